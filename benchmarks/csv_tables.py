@@ -0,0 +1,159 @@
+"""
+Compares `csv_columnar.ColumnarCSV` with a naive implementation of `csv_api.API` that keeps tables as lists
+of rows of text, on generated CSV files of a million rows (by default): one with quoted fields, which
+need a CSV parser, and one without, which `csv_columnar` splits into columns directly. Also times
+filtering a file a chunk at a time with `read_csv_chunks`/`write_csv_chunks`, which is how files larger
+than memory are processed.
+
+Run from the repository root:
+
+    python -m benchmarks.csv_tables [--rows N] [--rounds N] [--json]
+"""
+
+import argparse
+import csv
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Any, Callable
+
+import csv_api
+from csv_columnar import ColumnarCSV, read_csv_chunks, write_csv_chunks
+
+class NaiveTable(csv_api.Table):
+    def __init__(self, names: list[str], rows: list[list[Any]]):
+        super().__init__()
+        self.names = names
+        self.rows = rows
+
+class NaiveCSV:
+    """Tables as lists of rows, and a Python loop over the rows for every operation - the baseline."""
+
+    def read_csv(self, filename: str) -> NaiveTable:
+        with open(filename, "r", newline="") as f:
+            rows = list(csv.reader(f))
+        return NaiveTable(rows[0], rows[1:])
+
+    def write_csv(self, filename: str, table: NaiveTable) -> None:
+        with open(filename, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(table.names)
+            writer.writerows(table.rows)
+
+    def equals(self, table: NaiveTable, column_name: str, value: Any) -> list[bool]:
+        i = table.names.index(column_name)
+        text = str(value)
+        return [row[i] == text for row in table.rows]
+
+    def keep_rows(self, table: NaiveTable, rows: list[bool]) -> NaiveTable:
+        table.rows = [row for row, keep in zip(table.rows, rows) if keep]
+        return table
+
+    def numeric_map(self, table: NaiveTable, column_name: str, op: str, operand: int | float) -> list[int | float]:
+        i = table.names.index(column_name)
+        results: list[int | float] = []
+        for row in table.rows:
+            value = float(row[i])
+            if op == "+":
+                results.append(value + operand)
+            elif op == "-":
+                results.append(value - operand)
+            elif op == "*":
+                results.append(value * operand)
+            elif op == "/":
+                results.append(value / operand)
+            else:
+                results.append(value ** operand)
+        return results
+
+    def str_map(self, table: NaiveTable, column_name: str, op: str) -> list[str]:
+        i = table.names.index(column_name)
+        return [row[i].strip() for row in table.rows]
+
+    def group_by(self, table: NaiveTable, column_name: str) -> NaiveTable:
+        i = table.names.index(column_name)
+        counts: dict[str, int] = {}
+        for row in table.rows:
+            counts[row[i]] = counts.get(row[i], 0) + 1
+        return NaiveTable([column_name, "count"], [[key, count] for key, count in counts.items()])
+
+def write_sample(path: str, num_rows: int, quoted: bool) -> None:
+    rng = random.Random(0)
+    regions = ["west", "east", "north", "south", "central"]
+    products = ["latte", "mocha", "bagel", "muffin", "americano", "chai latte"]
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "region", "product", "amount", "quantity", "note"])
+        for i in range(num_rows):
+            note = rng.choice(["", "  gift  ", "said \"thanks\"", "rush, please"] if quoted else ["", "  gift  ", "rush"])
+            writer.writerow([i, rng.choice(regions), rng.choice(products), f"{rng.uniform(1, 20):.2f}", rng.randint(1, 5), note])
+
+def timed(function: Callable[[], Any], rounds: int) -> tuple[float, Any]:
+    times: list[float] = []
+    result: Any = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+def measure(api: Any, path: str, output_path: str, rounds: int) -> dict[str, float]:
+    stats: dict[str, float] = {}
+    def record(name: str, function: Callable[[], Any]) -> Any:
+        seconds, result = timed(function, rounds)
+        stats[name] = round(seconds * 1000, 1)
+        return result
+
+    table = record("read_csv", lambda: api.read_csv(path))
+    mask = record("equals", lambda: api.equals(table, "region", "west"))
+    record("numeric_map", lambda: api.numeric_map(table, "amount", "*", 1.1))
+    record("str_map", lambda: api.str_map(table, "note", "trim"))
+    record("group_by", lambda: api.group_by(table, "product"))
+    record("write_csv", lambda: api.write_csv(output_path, table))
+    # Filtering changes the table, so it runs once, last.
+    stats["keep_rows"] = round(timed(lambda: api.keep_rows(table, mask), 1)[0] * 1000, 1)
+    return stats
+
+def filter_in_chunks(path: str, output_path: str) -> None:
+    api = ColumnarCSV()
+    def west_rows():
+        for chunk in read_csv_chunks(path):
+            yield api.keep_rows(chunk, api.equals(chunk, "region", "west"))
+    write_csv_chunks(output_path, west_rows())  # pyright: ignore[reportArgumentType]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results: dict[str, Any] = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sample.csv")
+        output_path = os.path.join(directory, "output.csv")
+        for dataset, quoted in [("quoted", True), ("plain", False)]:
+            write_sample(path, args.rows, quoted)
+            results[dataset] = {
+                "rows": args.rows,
+                "file_mb": round(os.path.getsize(path) / 1e6, 1),
+                "naive_ms": measure(NaiveCSV(), path, output_path, args.rounds),
+                "columnar_ms": measure(ColumnarCSV(), path, output_path, args.rounds),
+                "chunked_filter_ms": round(timed(lambda: filter_in_chunks(path, output_path), args.rounds)[0] * 1000, 1),
+            }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for dataset, result in results.items():
+        print(f"{dataset}: {result['rows']} rows, {result['file_mb']} MB")
+        for operation, naive in result["naive_ms"].items():
+            columnar = result["columnar_ms"][operation]
+            print(f"{operation:>12}: naive {naive:>8} ms, columnar {columnar:>8} ms ({round(naive / max(columnar, 0.1), 1)}x)")
+        print(f"read, filter and write a chunk at a time: {result['chunked_filter_ms']} ms")
+
+if __name__ == "__main__":
+    main()
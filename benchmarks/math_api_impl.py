@@ -0,0 +1,63 @@
+"""
+An implementation of `math_api.API`, and a generator of random `math_api` programs, shared by the benchmarks
+that run `math_api` programs.
+"""
+
+import json
+import math
+import random
+from typing import Any
+
+from program.schema import Program
+
+class MathAPI:
+    """Evaluates each method with its obvious meaning; `unknown` returns `unknown_answer` for every request."""
+    def __init__(self, unknown_answer: float = math.nan):
+        super().__init__()
+        self.unknown_answer = unknown_answer
+    def add(self, x: float, y: float) -> float:
+        return x + y
+    def sub(self, x: float, y: float) -> float:
+        return x - y
+    def mul(self, x: float, y: float) -> float:
+        return x * y
+    def div(self, x: float, y: float) -> float:
+        return x / y
+    def pow(self, base: float, exp: float) -> float:
+        return base ** exp
+    def neg(self, x: float) -> float:
+        return -x
+    def id(self, x: float) -> float:
+        return x
+    def unknown(self, message: str) -> float:
+        return self.unknown_answer
+
+def ref(index: int) -> dict[str, Any]:
+    return {"@ref": index}
+
+def math_program(rng: random.Random) -> Program:
+    """A random program, full of the redundancy generated programs have: repeated steps, double negations."""
+    steps: list[Any] = []
+    def operand() -> Any:
+        choice = rng.random()
+        if steps and choice < 0.5:
+            return ref(rng.randrange(len(steps)))
+        if choice < 0.6:
+            return {"@func": rng.choice(["neg", "id"]), "@args": [operand()]}
+        return rng.choice([0, 1, 2, 3, 0.5, -2])
+    for _ in range(rng.randint(1, 10)):
+        if steps and rng.random() < 0.25:
+            steps.append(json.loads(json.dumps(rng.choice(steps))))
+        elif rng.random() < 0.2:
+            steps.append({"@func": "neg", "@args": [{"@func": "neg", "@args": [operand()]}]})
+        elif rng.random() < 0.1:
+            steps.append({"@func": "unknown", "@args": ["what is the weather?"]})
+        else:
+            func = rng.choice(["add", "sub", "mul", "div", "pow", "neg"])
+            if func == "neg":
+                steps.append({"@func": func, "@args": [operand()]})
+            elif func == "pow" and rng.random() < 0.5:
+                steps.append({"@func": func, "@kwargs": {"base": operand(), "exp": rng.choice([0, 1, 2])}})
+            else:
+                steps.append({"@func": func, "@args": [operand(), operand()]})
+    return {"@steps": steps}
@@ -0,0 +1,186 @@
+"""
+Compares evaluating `math_api` programs over many inputs with `math_vectorized` - in a generated Python loop,
+and with NumPy if it is installed - against running the compiled program step by step once per input, with
+an API call per step. Every vectorized result is checked against the step-by-step one before it is timed.
+
+With NumPy installed, also checks the NumPy evaluation differentially: random programs, with every number
+literal made a parameter, must give the same results vectorized as step by step. Exits with status 1 on any
+difference.
+
+Run from the repository root:
+
+    python -m benchmarks.math_batch [--rows N] [--rounds N] [--check N] [--json]
+"""
+
+import argparse
+import json
+import math
+import random
+import statistics
+import sys
+import time
+from typing import Any, Callable, cast
+
+from benchmarks.math_api_impl import MathAPI, math_program, ref
+from math_vectorized import numeric_literals, numpy_available, vectorize_program
+from program.executor import compile_program
+from program.schema import Program
+from schema_checker import JsonPath
+from typechat import Failure
+
+# Each program, with the paths of the literals that vary per input.
+programs: dict[str, tuple[Program, list[JsonPath]]] = {
+    # principal * (1 + rate / 12) ** 120
+    "compound_interest": ({"@steps": [
+        {"@func": "div", "@args": [0.05, 12]},
+        {"@func": "add", "@args": [1, ref(0)]},
+        {"@func": "pow", "@kwargs": {"base": ref(1), "exp": {"@func": "mul", "@args": [12, 10]}}},
+        {"@func": "mul", "@args": [1000, ref(2)]},
+    ]}, [("@steps", 0, "@args", 0), ("@steps", 3, "@args", 0)]),
+    # 3x^3 - 2x^2 + x - 7, reusing x^2 and x^3
+    "polynomial": ({"@steps": [
+        {"@func": "id", "@args": [1.5]},
+        {"@func": "mul", "@args": [ref(0), ref(0)]},
+        {"@func": "mul", "@args": [ref(1), ref(0)]},
+        {"@func": "sub", "@args": [{"@func": "mul", "@args": [3, ref(2)]}, {"@func": "mul", "@args": [2, ref(1)]}]},
+        {"@func": "sub", "@args": [{"@func": "add", "@args": [ref(3), ref(0)]}, 7]},
+    ]}, [("@steps", 0, "@args", 0)]),
+    # A program that also asks `unknown`, which is called on the API once rather than per input.
+    "with_unknown": ({"@steps": [
+        {"@func": "unknown", "@args": ["the exchange rate"]},
+        {"@func": "neg", "@args": [{"@func": "div", "@args": [2, 4]}]},
+        {"@func": "add", "@args": [{"@func": "mul", "@args": [ref(1), 3]}, ref(0)]},
+    ]}, [("@steps", 1, "@args", 0, "@args", 1)]),
+}
+
+# What `unknown` answers: a number, unlike the default NaN, so that results can be compared with `math.isclose`.
+unknown_answer = 0.25
+
+class RowAPI(MathAPI):
+    """`MathAPI` with an `input` method reading the current row's values, for running step by step."""
+    def __init__(self):
+        super().__init__(unknown_answer)
+        self.row: tuple[float, ...] = ()
+    def input(self, index: int) -> float:
+        return self.row[index]
+
+def with_inputs(expr: Any, parameters: dict[JsonPath, int], path: JsonPath) -> Any:
+    """Replaces the literals at `parameters` by calls to `RowAPI.input`."""
+    if path in parameters:
+        return {"@func": "input", "@args": [parameters[path]]}
+    if isinstance(expr, dict):
+        return {key: with_inputs(value, parameters, path + (key,)) for key, value in cast(dict[str, Any], expr).items()}
+    if isinstance(expr, list):
+        return [with_inputs(item, parameters, path + (i,)) for i, item in enumerate(cast(list[Any], expr))]
+    return expr
+
+def step_by_step(program: Program, parameters: list[JsonPath]) -> Callable[[list[list[float]]], list[float]]:
+    compiled = compile_program(with_inputs(program, {path: i for i, path in enumerate(parameters)}, ()))
+    if isinstance(compiled, Failure):
+        raise ValueError(compiled.message)
+    run = compiled.value.run
+    def evaluate(inputs: list[list[float]]) -> list[float]:
+        api = RowAPI()
+        results: list[float] = []
+        for row in zip(*inputs):
+            api.row = row
+            results.append(run(api))
+        return results
+    return evaluate
+
+def timed(function: Callable[[], Any], rounds: int) -> tuple[float, Any]:
+    times: list[float] = []
+    result: Any = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+def same(expected: list[float], actual: Any, exact: bool) -> bool:
+    if exact:
+        return list(actual) == expected
+    return all(math.isclose(a, e, rel_tol=1e-12) for a, e in zip(actual, expected))
+
+def differential_check(count: int, rng: random.Random) -> dict[str, int]:
+    """
+    Evaluates `count` random programs with NumPy and step by step, over a few inputs for each number literal.
+    Programs without number literals are skipped, as are those that raise step by step or give a complex
+    number: NumPy gives infinities and NaNs for those instead.
+    """
+    stats = {"programs": count, "skipped": 0, "mismatches": 0}
+    api = MathAPI(unknown_answer)
+    for _ in range(count):
+        program = math_program(rng)
+        parameters = numeric_literals(program)
+        inputs = [[rng.uniform(-3.0, 3.0) for _ in range(8)] for _ in parameters]
+        # Step by step, a number raised to a fractional power can be complex, despite the annotations.
+        expected: list[Any] | None
+        try:
+            expected = step_by_step(program, parameters)(inputs)
+        except Exception:
+            expected = None
+        if not parameters or expected is None or not all(isinstance(value, (int, float)) for value in expected):
+            stats["skipped"] += 1
+            continue
+        vectorized = vectorize_program(program, parameters, use_numpy=True)
+        if isinstance(vectorized, Failure):
+            raise ValueError(vectorized.message)
+        actual = vectorized.value.evaluate(*inputs, api=api)
+        if not same(expected, actual, exact=False):
+            stats["mismatches"] += 1
+            if stats["mismatches"] <= 3:
+                print("NumPy results differ from step-by-step evaluation for", json.dumps(program), file=sys.stderr)
+                print(f"  expected: {expected}\n  actual:   {list(actual)}", file=sys.stderr)
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--check", type=int, default=500, help="random programs to check NumPy evaluation with")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    api = MathAPI(unknown_answer)
+    modes = [("loop", False)] + ([("numpy", True)] if numpy_available() else [])
+    results: dict[str, Any] = {"rows": args.rows, "numpy": numpy_available()}
+    for name, (program, parameters) in programs.items():
+        inputs = [[rng.uniform(0.01, 2.0) for _ in range(args.rows)] for _ in parameters]
+        baseline_seconds, expected = timed(lambda: step_by_step(program, parameters)(inputs), args.rounds)
+        entry: dict[str, Any] = {"step_by_step_ms": round(baseline_seconds * 1000, 1)}
+        for mode, use_numpy in modes:
+            vectorized = vectorize_program(program, parameters, use_numpy=use_numpy)
+            if isinstance(vectorized, Failure):
+                raise ValueError(vectorized.message)
+            evaluate = vectorized.value.evaluate
+            actual = evaluate(*inputs, api=api)
+            if not same(expected, actual, exact=not use_numpy):
+                raise AssertionError(f"{name}: {mode} results differ from step-by-step evaluation")
+            seconds, _ = timed(lambda: evaluate(*inputs, api=api), args.rounds)
+            entry[f"{mode}_ms"] = round(seconds * 1000, 1)
+            entry[f"{mode}_speedup"] = round(baseline_seconds / seconds, 1)
+        results[name] = entry
+    check = differential_check(args.check, rng) if numpy_available() else None
+    results["numpy_check"] = check
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{results['rows']} inputs per program, NumPy {'installed' if results['numpy'] else 'not installed'}")
+        for name in programs:
+            entry = results[name]
+            line = f"{name:>18}: step by step {entry['step_by_step_ms']:>8} ms"
+            for mode, _ in modes:
+                line += f", {mode} {entry[f'{mode}_ms']:>7} ms ({entry[f'{mode}_speedup']}x)"
+            print(line)
+        if check is None:
+            print("NumPy check: skipped, NumPy is not installed")
+        else:
+            print(f"NumPy check: {check['programs']} random programs ({check['skipped']} skipped), {check['mismatches']} mismatches")
+    if check is not None and check["mismatches"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Checks `openai_model.OpenAIModel` against a stub OpenAI-compatible server built on `http.server`, scripted
+to answer each scenario's requests: keep-alive connections are reused from the `ConnectionPool` (and replaced
+when the server drops them), rate limits and transient failures are retried (waiting as long as Retry-After
+says), and a server that rejects `response_format` or `grammar` as unsupported gets plain completions from
+then on. Reports each scenario's requests, connections and time; exits with status 1 if any check fails.
+
+Run from the repository root:
+
+    python -m benchmarks.openai_stub [--calls N] [--json]
+"""
+
+import argparse
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import sys
+import threading
+import time
+from typing import Any, Callable, Literal, cast
+from typing_extensions import override
+
+from openai_model import ConcurrencyLimiter, OpenAIModel, RetryPolicy
+from schema_export import OutputFormat
+from typechat import Failure, Result, Success
+
+# A scripted reply: its status, extra headers, and JSON body.
+Reply = tuple[int, dict[str, str], dict[str, Any]]
+
+def completion(content: str) -> Reply:
+    return 200, {}, {"choices": [{"message": {"role": "assistant", "content": content}}]}
+
+def error(status: int, message: str, headers: dict[str, str] | None = None) -> Reply:
+    return status, headers or {}, {"error": {"message": message, "type": "invalid_request_error"}}
+
+@dataclass
+class StubState:
+    # Replies to the next requests, in order; once they run out, every request gets `completion("{}")`.
+    script: list[Reply] = field(default_factory=lambda: [])
+    # Answers a request body with a reply instead of the script, or returns None to use the script.
+    answer: Callable[[dict[str, Any]], Reply | None] | None = None
+    # Closes each connection after answering, without saying so in the response, as idle timeouts do.
+    drop_connections: bool = False
+    # Each request's body, and the client port (one per connection) it came from.
+    bodies: list[dict[str, Any]] = field(default_factory=lambda: [])
+    ports: list[int] = field(default_factory=lambda: [])
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    state = StubState()
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # The headers and body are written separately; with Nagle's algorithm, the client's delayed ACK would
+    # hold back the body of every response on a kept-alive connection by about 40 ms.
+    disable_nagle_algorithm = True
+
+    def do_POST(self) -> None:
+        state = cast(StubServer, self.server).state
+        body: dict[str, Any] = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with state.lock:
+            state.bodies.append(body)
+            state.ports.append(self.client_address[1])
+            reply = state.answer(body) if state.answer is not None else None
+            if reply is None:
+                reply = state.script.pop(0) if state.script else completion("{}")
+        status, headers, payload = reply
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+        self.wfile.flush()
+        if state.drop_connections:
+            self.close_connection = True
+
+    @override
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+@dataclass
+class Scenario:
+    name: str
+    state: StubState
+    # Makes the scenario's calls on a model pointed at the stub, returning their results.
+    run: Callable[[OpenAIModel], list[Result[str]]]
+    # Checks the results against what the stub saw, returning a description of any problem.
+    check: Callable[[list[Result[str]], StubState, float], str | None]
+    retry: RetryPolicy = field(default_factory=lambda: RetryPolicy(base_delay=0.01, max_delay=0.05))
+    output_constraint: Literal["json_schema", "grammar"] = "json_schema"
+
+output = OutputFormat("Cart", {"type": "object"}, 'root ::= "{}"')
+
+def calls(count: int, structured: bool = False) -> Callable[[OpenAIModel], list[Result[str]]]:
+    def run(model: OpenAIModel) -> list[Result[str]]:
+        if structured:
+            return [model.complete_structured(f"request {i}", output) for i in range(count)]
+        return [model.complete(f"request {i}") for i in range(count)]
+    return run
+
+def expect(
+    succeeded: int,
+    requests: int,
+    connections: int | None = None,
+    min_seconds: float = 0.0,
+    constrained: int | None = None,
+) -> Callable[[list[Result[str]], StubState, float], str | None]:
+    """A check that `succeeded` calls succeeded in `requests` requests, over `connections` connections if given."""
+    def check(results: list[Result[str]], state: StubState, seconds: float) -> str | None:
+        problems: list[str] = []
+        if sum(isinstance(result, Success) for result in results) != succeeded:
+            problems.append(f"expected {succeeded} successes, got {results!r}")
+        if len(state.bodies) != requests:
+            problems.append(f"expected {requests} requests, got {len(state.bodies)}")
+        if connections is not None and len(set(state.ports)) != connections:
+            problems.append(f"expected {connections} connections, got {len(set(state.ports))}")
+        if seconds < min_seconds:
+            problems.append(f"expected to wait at least {min_seconds} s, took {seconds:.3f} s")
+        sent_constraints = sum("response_format" in body or "grammar" in body for body in state.bodies)
+        if constrained is not None and sent_constraints != constrained:
+            problems.append(f"expected {constrained} constrained requests, got {sent_constraints}")
+        return "; ".join(problems) or None
+    return check
+
+def rejecting(option: str, message: str) -> Callable[[dict[str, Any]], Reply | None]:
+    """Answers requests with `option` with a 400 error saying `message`."""
+    def answer(body: dict[str, Any]) -> Reply | None:
+        return error(400, message) if option in body else None
+    return answer
+
+def scenarios(count: int) -> list[Scenario]:
+    return [
+        Scenario("keep-alive", StubState(), calls(count), expect(count, count, connections=1)),
+        # Every reused connection turns out to be closed, so each call reconnects once, without a retry.
+        Scenario("dropped connections", StubState(drop_connections=True), calls(count), expect(count, count, connections=count)),
+        Scenario(
+            "Retry-After",
+            StubState(script=[error(429, "Rate limit reached.", {"Retry-After": "0.2"})]),
+            calls(1),
+            expect(1, 2, min_seconds=0.2),
+            retry=RetryPolicy(base_delay=0.01, max_delay=1.0),
+        ),
+        Scenario("backoff", StubState(script=[error(503, "Overloaded."), error(502, "Bad gateway.")]), calls(1), expect(1, 3)),
+        Scenario(
+            "retries exhausted",
+            StubState(script=[error(500, "Server error.")] * 3),
+            calls(1),
+            expect(0, 3),
+            retry=RetryPolicy(max_retries=2, base_delay=0.01, max_delay=0.05),
+        ),
+        Scenario("not retryable", StubState(script=[error(401, "Invalid API key.")]), calls(1), expect(0, 1)),
+        # The first call falls back to a plain completion; later calls skip the constrained request.
+        Scenario(
+            "unsupported response_format",
+            StubState(answer=rejecting("response_format", "Invalid parameter: 'response_format' of type 'json_schema' is not supported with this model.")),
+            calls(3, structured=True),
+            expect(3, 4, constrained=1),
+        ),
+        Scenario(
+            "unsupported grammar",
+            StubState(answer=rejecting("grammar", "Unrecognized request argument supplied: grammar")),
+            calls(2, structured=True),
+            expect(2, 3, constrained=1),
+            output_constraint="grammar",
+        ),
+        # A 400 about something else is not mistaken for a missing feature.
+        Scenario(
+            "unrelated 400",
+            StubState(answer=rejecting("response_format", "'messages' must contain at least one message.")),
+            calls(2, structured=True),
+            expect(0, 2, constrained=2),
+        ),
+    ]
+
+def run_scenario(scenario: Scenario) -> dict[str, Any]:
+    server = StubServer(("127.0.0.1", 0), StubHandler)
+    server.state = scenario.state
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    model = OpenAIModel(
+        "stub",
+        "sk-stub",
+        base_url=f"http://127.0.0.1:{server.server_address[1]}/v1",
+        timeout=5.0,
+        retry=scenario.retry,
+        limiter=ConcurrencyLimiter(1),
+        output_constraint=scenario.output_constraint,
+    )
+    try:
+        start = time.perf_counter()
+        results = scenario.run(model)
+        seconds = time.perf_counter() - start
+    finally:
+        model.close()
+        server.shutdown()
+        server.server_close()
+    problem = scenario.check(results, scenario.state, seconds)
+    failures = [result.message for result in results if isinstance(result, Failure)]
+    return {
+        "scenario": scenario.name,
+        "ok": problem is None,
+        "problem": problem,
+        "calls": len(results),
+        "failed": len(failures),
+        "requests": len(scenario.state.bodies),
+        "connections": len(set(scenario.state.ports)),
+        "ms_per_call": round(seconds / max(len(results), 1) * 1000, 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=50, help="calls in the connection reuse scenarios")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = [run_scenario(scenario) for scenario in scenarios(args.calls)]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            line = " ".join([
+                f"{result['scenario']:>28}: {result['calls']} calls ({result['failed']} failed),",
+                f"{result['requests']} requests over {result['connections']} connections, {result['ms_per_call']} ms per call",
+            ])
+            print(line if result["ok"] else f"{line}\n{'':>30}WRONG: {result['problem']}")
+    if not all(result["ok"] for result in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Compares per-validation latency of `ProgramValidator` with a cold mypy run per check against a warm
+`DaemonChecker`, over the programs in `benchmarks/corpus/programs.jsonl`.
+
+Run from the repository root:
+
+    python -m benchmarks.program_checker [--rounds N] [--json]
+"""
+
+import argparse
+import importlib
+import json
+import os
+import statistics
+import time
+from typing import Any
+
+from typechat import Checker, DaemonChecker, ProgramValidator, Success, _SingleFileChecker # pyright: ignore[reportPrivateUsage]
+
+corpus_path = os.path.join(os.path.dirname(__file__), "corpus", "programs.jsonl")
+
+def load_corpus() -> list[tuple[str, str]]:
+    """Returns (schema source, program JSON text) pairs."""
+    schemas: dict[str, str] = {}
+    corpus: list[tuple[str, str]] = []
+    with open(corpus_path, "r") as f:
+        for line in f:
+            entry = json.loads(line)
+            module_name = entry["schema"]
+            if module_name not in schemas:
+                with open(importlib.import_module(module_name).__file__ or "", "r") as schema_file:
+                    schemas[module_name] = schema_file.read()
+            corpus.append((schemas[module_name], json.dumps(entry["program"])))
+    return corpus
+
+def measure(checker: Checker, corpus: list[tuple[str, str]], rounds: int) -> dict[str, Any]:
+    # Without a verdict memo, so every round runs the checker rather than looking up the first round's verdicts.
+    validators = {schema: ProgramValidator(schema, checker, memo_size=0) for schema, _ in corpus}
+    # The first check of each schema pays for starting up and analyzing the schema; report it separately.
+    first_check_times: list[float] = []
+    for schema in validators:
+        program_text = next(text for s, text in corpus if s == schema)
+        start = time.perf_counter()
+        validators[schema].validate(program_text)
+        first_check_times.append(time.perf_counter() - start)
+
+    times: list[float] = []
+    passed = 0
+    for _ in range(rounds):
+        for schema, program_text in corpus:
+            start = time.perf_counter()
+            result = validators[schema].validate(program_text)
+            times.append(time.perf_counter() - start)
+            passed += isinstance(result, Success)
+    return {
+        "first_check_ms": [round(t * 1000, 2) for t in first_check_times],
+        "mean_ms": round(statistics.mean(times) * 1000, 2),
+        "median_ms": round(statistics.median(times) * 1000, 2),
+        "max_ms": round(max(times) * 1000, 2),
+        "checks": len(times),
+        "passed": passed,
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    daemon = DaemonChecker()
+    try:
+        results = {
+            "cold": measure(_SingleFileChecker(), corpus, args.rounds),
+            "warm": measure(daemon, corpus, args.rounds),
+        }
+    finally:
+        daemon.stop()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name, stats in results.items():
+        print(" ".join([
+            f"{name:>5}: first check {stats['first_check_ms']} ms,",
+            f"mean {stats['mean_ms']} ms, median {stats['median_ms']} ms, max {stats['max_ms']} ms",
+            f"({stats['passed']}/{stats['checks']} passed)",
+        ]))
+
+if __name__ == "__main__":
+    main()
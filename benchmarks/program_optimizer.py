@@ -0,0 +1,213 @@
+"""
+Checks `program.optimizer` differentially: generates random `math_api` and `csv_api` programs, full of the
+redundancy generated programs have (repeated calls, unused steps, columns set twice, masks filtering the
+table they were computed from), and runs each before and after optimizing it. Every program that runs
+without raising must give the same result and write the same files optimized, in no more API calls.
+Reports the calls saved and the time spent optimizing; exits with status 1 on any difference.
+
+Run from the repository root:
+
+    python -m benchmarks.program_optimizer [--programs N] [--seed N] [--json]
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, cast
+
+from benchmarks.math_api_impl import MathAPI, math_program, ref
+from csv_columnar import ColumnarCSV, ColumnarTable, columnar_rules
+from program.executor import compile_program
+from program.optimizer import OptimizationRules, math_api_rules, optimize_program
+from program.schema import Program
+from typechat import Failure
+
+class CountingAPI:
+    """Counts the calls made to the methods of `api`."""
+    def __init__(self, api: Any):
+        super().__init__()
+        self.api = api
+        self.calls = 0
+
+    def __getattr__(self, name: str) -> Any:
+        method = getattr(self.api, name)
+        def counted(*args: Any, **kwargs: Any) -> Any:
+            self.calls += 1
+            return method(*args, **kwargs)
+        return counted
+
+columns = ["id", "region", "amount", "note"]
+
+def csv_program(rng: random.Random, directory: str) -> Program:
+    steps: list[Any] = []
+    kinds: list[str] = []
+    def of_kind(kind: str) -> Any:
+        indices = [i for i, k in enumerate(kinds) if k == kind]
+        if kind == "table" and (not indices or rng.random() < 0.1):
+            return {"@func": "read_csv", "@args": [os.path.join(directory, rng.choice(["a.csv", "b.csv"]))]}
+        return ref(rng.choice(indices)) if indices else None
+    def add(call: dict[str, Any], kind: str) -> None:
+        steps.append(call)
+        kinds.append(kind)
+    def interleave(table: Any) -> None:
+        # A step between a call and the one using its result, which the optimizer must not move it past.
+        choice = rng.random()
+        if choice < 0.1:
+            add({"@func": "get_column", "@args": [table, "id"]}, "list")
+        elif choice < 0.2:
+            add({"@func": "set_column", "@args": [table, "region", {"@func": "get_column", "@args": [table, "note"]}]}, "table")
+        elif choice < 0.3:
+            doubled = {"@func": "numeric_map", "@args": [table, "amount", "*", 2]}
+            add({"@func": "set_column", "@args": [table, "amount", doubled]}, "table")
+
+    add({"@func": "read_csv", "@args": [os.path.join(directory, "a.csv")]}, "table")
+    for _ in range(rng.randint(1, 14)):
+        table = of_kind("table")
+        column = rng.choice(columns)
+        choice = rng.random()
+        if steps and choice < 0.15:
+            i = rng.randrange(len(steps))
+            add(json.loads(json.dumps(steps[i])), kinds[i])
+        elif choice < 0.25:
+            add({"@func": "get_column", "@args": [table, column]}, "list")
+        elif choice < 0.4:
+            mask = {"@func": rng.choice(["equals", "not_equals"]), "@args": [table, "region", rng.choice(["west", "east"])]}
+            if rng.random() < 0.5:
+                add(mask, "mask")
+                mask = ref(len(steps) - 1)
+                interleave(table)
+            add({"@func": rng.choice(["keep_rows", "drop_rows"]), "@args": [table, mask]}, "table")
+        elif choice < 0.55:
+            values = {"@func": "numeric_map", "@args": [table, "amount", rng.choice(["+", "*"]), rng.choice([1, 2.5])]}
+            if rng.random() < 0.5:
+                add(values, "list")
+                values = ref(len(steps) - 1)
+                interleave(table)
+            add({"@func": "set_column", "@args": [table, rng.choice(["total", "amount"]), values]}, "table")
+        elif choice < 0.62:
+            add({"@func": "remove_column", "@args": [table, rng.choice(["total", "note"])]}, "table")
+        elif choice < 0.7:
+            add({"@func": "str_map", "@args": [table, "note", "trim"]}, "list")
+        elif choice < 0.76:
+            add({"@func": "group_by", "@args": [table, rng.choice(["region", "id"])]}, "table")
+        elif choice < 0.82:
+            add({"@func": "write_csv", "@args": [os.path.join(directory, rng.choice(["a.csv", "out.csv"])), table]}, "none")
+        elif choice < 0.88:
+            add({"@func": "get_column_names", "@args": [table]}, "names")
+        elif choice < 0.93:
+            add({"@func": "remove_rows_by_index", "@args": [table, 0]}, "table")
+        else:
+            add({"@func": "equals", "@args": [table, column, rng.choice([1, "west", None])]}, "mask")
+    return {"@steps": steps}
+
+def write_inputs(directory: str) -> None:
+    with open(os.path.join(directory, "a.csv"), "w") as f:
+        f.write("id,region,amount,note\n1,west,2.5, gift \n2,east,,\n3,west,10,rush\n4,north,1.25, \n5,east,3,x\n")
+    with open(os.path.join(directory, "b.csv"), "w") as f:
+        f.write("id,region,amount,note\n7,west,1,a\n8,west,2,b\n")
+    out_path = os.path.join(directory, "out.csv")
+    if os.path.exists(out_path):
+        os.remove(out_path)
+
+def comparable(value: Any) -> Any:
+    """A value that compares equal for equal results, counting NaNs as equal."""
+    if isinstance(value, ColumnarTable):
+        return ("table", value.names, [comparable(list(row)) for row in value.rows()])
+    if isinstance(value, (list, tuple)):
+        return [comparable(item) for item in cast(list[Any] | tuple[Any, ...], value)]
+    if isinstance(value, float) and math.isnan(value):
+        return "NaN"
+    return value
+
+def outcome(program: Program, api: CountingAPI, directory: str | None) -> tuple[Any, Any]:
+    """The result of running `program` and the files it leaves behind, or the exception it raised."""
+    if directory is not None:
+        write_inputs(directory)
+    compiled = compile_program(program)
+    if isinstance(compiled, Failure):
+        raise ValueError(compiled.message)
+    try:
+        result: Any = comparable(compiled.value.run(api))
+    except Exception as err:
+        result = err
+    files: dict[str, str] = {}
+    if directory is not None:
+        for name in sorted(os.listdir(directory)):
+            with open(os.path.join(directory, name)) as f:
+                files[name] = f.read()
+    return result, files
+
+def check(
+    name: str,
+    generate: Callable[[random.Random], Program],
+    make_api: Callable[[], Any],
+    rules: OptimizationRules,
+    count: int,
+    rng: random.Random,
+    directory: str | None,
+) -> dict[str, Any]:
+    stats: dict[str, Any] = {"programs": count, "raised": 0, "mismatches": 0, "calls_before": 0, "calls_after": 0}
+    optimize_times: list[float] = []
+    for _ in range(count):
+        program = generate(rng)
+        start = time.perf_counter()
+        optimized = optimize_program(program, rules)
+        optimize_times.append(time.perf_counter() - start)
+        if isinstance(optimized, Failure):
+            raise ValueError(optimized.message)
+        before_api, after_api = CountingAPI(make_api()), CountingAPI(make_api())
+        before = outcome(program, before_api, directory)
+        if isinstance(before[0], Exception):
+            # The optimizer only promises the same outcome for programs that run without raising.
+            stats["raised"] += 1
+            continue
+        after = outcome(optimized.value, after_api, directory)
+        stats["calls_before"] += before_api.calls
+        stats["calls_after"] += after_api.calls
+        if after != before or after_api.calls > before_api.calls:
+            stats["mismatches"] += 1
+            if stats["mismatches"] <= 3:
+                print(f"{name}: optimizing changed the outcome of", json.dumps(program), file=sys.stderr)
+                print("  into", json.dumps(optimized.value), file=sys.stderr)
+                print(f"  before: {before!r}\n  after:  {after!r}", file=sys.stderr)
+    stats["mean_optimize_us"] = round(statistics.mean(optimize_times) * 1e6, 1)
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--programs", type=int, default=2000, help="programs per API")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        results = {
+            "math_api": check("math_api", math_program, MathAPI, math_api_rules, args.programs, rng, None),
+            "csv_api": check(
+                "csv_api", lambda rng: csv_program(rng, directory), ColumnarCSV, columnar_rules, args.programs, rng, directory,
+            ),
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name, stats in results.items():
+            ran = stats["programs"] - stats["raised"]
+            saved = 1 - stats["calls_after"] / max(stats["calls_before"], 1)
+            print(" ".join([
+                f"{name}: {ran} programs ran ({stats['raised']} raised), {stats['mismatches']} mismatches,",
+                f"{stats['calls_before']} -> {stats['calls_after']} calls ({saved:.0%} fewer),",
+                f"{stats['mean_optimize_us']} us to optimize",
+            ]))
+    if any(stats["mismatches"] for stats in results.values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
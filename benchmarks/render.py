@@ -0,0 +1,150 @@
+"""
+Compares `render_expression`/`render_program` with the recursive renderers they replaced, on wide payloads
+(a large `Cart`, a csv program adding many rows) and deep ones (nested lists, chained calls). Every payload's
+output is checked to be identical before it is timed.
+
+Run from the repository root:
+
+    python -m benchmarks.render [--scale N] [--rounds N] [--json]
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from typing import Any, Callable, cast
+
+from rendering import render_expression, render_program
+
+def recursive_expr_to_text(expr: Any, for_program: bool) -> str:
+    """`expr_to_text` as it was before rendering became iterative, as the baseline."""
+    match expr:
+        case { "@ref": int(index) } if for_program:
+            return f"STEP{index + 1}"
+        case { "@ref": _ } if for_program:
+            return f"NON_INTEGRAL_REF"
+        case { "@func": _ } if for_program:
+            return recursive_call_to_text(expr)
+        case list():
+            elements_str = ", ".join(recursive_expr_to_text(item, for_program) for item in cast(list[Any], expr))
+            return f"[{elements_str}]"
+        case dict():
+            elements_strs: list[str] = []
+            for key, value in cast(dict[str, Any], expr).items():
+                elements_strs.append(f"{json.dumps(key)}: {recursive_expr_to_text(value, for_program)}")
+            return f"{{{', '.join(elements_strs)}}}"
+        case bool() | int() | float() | None:
+            return str(expr)
+        case str():
+            return json.dumps(expr)
+        case _:
+            raise TypeError()
+
+def recursive_call_to_text(call: Any) -> str:
+    arg_strs: list[str] = []
+    if "@args" in call and call["@args"]:
+        for arg in call["@args"]:
+            arg_strs.append(recursive_expr_to_text(arg, for_program=True))
+    if "@kwargs" in call and call["@kwargs"]:
+        for k, v in call["@kwargs"].items():
+            arg_strs.append(f"{k}={recursive_expr_to_text(v, for_program=True)}")
+    return f"api.{call['@func']}({', '.join(arg_strs)})"
+
+def recursive_program_to_text(p: Any) -> str:
+    steps = p["@steps"]
+    step_strs = [f"\n    STEP{i} = {recursive_call_to_text(call)}" for i, call in enumerate(steps, 1)]
+    step_strs.append(f"\n    return STEP{len(steps)}")
+    return f"def fn(api: API):{''.join(step_strs)}"
+
+def wide_cart(scale: int) -> Any:
+    return {"type": "Cart", "items": [
+        {
+            "type": "LineItem",
+            "product": {"type": "LatteDrink", "name": "cappuccino", "size": "grande", "options": [
+                {"type": "Milk", "name": "oat milk"},
+                {"type": "Sweetener", "name": "vanilla syrup", "optionQuantity": "extra"},
+            ]},
+            "quantity": i % 4 + 1,
+        }
+        for i in range(scale)
+    ]}
+
+def wide_csv_program(scale: int) -> Any:
+    steps: list[Any] = [{"@func": "new_table", "@args": [["name", "city", "amount"]]}]
+    steps.extend(
+        {"@func": "add_row", "@args": [{"@ref": i}, [f"customer {i}", "Seattle, \"WA\"", str(i * 1.5)]]}
+        for i in range(scale)
+    )
+    return {"@steps": steps}
+
+def deep_lists(depth: int) -> Any:
+    root: list[Any] = []
+    current = root
+    for i in range(depth):
+        child: list[Any] = [i]
+        current.append(child)
+        current = child
+    return root
+
+def deep_calls(depth: int) -> Any:
+    expr: Any = 1
+    for i in range(depth):
+        expr = {"@func": "add", "@args": [expr, i], "@kwargs": {"label": f"step {i}"}}
+    return {"@steps": [expr]}
+
+def time_calls(render: Callable[[], str], rounds: int) -> float:
+    times: list[float] = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        render()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+def measure(name: str, new: Callable[[], str], old: Callable[[], str], rounds: int) -> dict[str, Any]:
+    stats: dict[str, Any] = {"payload": name, "chars": len(new())}
+    stats["iterative_ms"] = round(time_calls(new, rounds) * 1000, 3)
+    try:
+        if old() != new():
+            raise AssertionError(f"The renderers disagree on {name}.")
+    except RecursionError:
+        stats["recursive_ms"] = "RecursionError"
+        stats["speedup"] = None
+        return stats
+    stats["recursive_ms"] = round(time_calls(old, rounds) * 1000, 3)
+    stats["speedup"] = round(stats["recursive_ms"] / stats["iterative_ms"], 2)
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=int, default=2000, help="items in wide payloads, levels in deep ones")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    scale = args.scale
+    cart = wide_cart(scale)
+    csv_program = wide_csv_program(scale)
+    shallow_lists = deep_lists(min(scale, sys.getrecursionlimit() // 4))
+    calls = deep_calls(min(scale, sys.getrecursionlimit() // 8))
+    results = [
+        measure("wide cart", lambda: render_expression(cart, False), lambda: recursive_expr_to_text(cart, False), args.rounds),
+        measure("wide csv program", lambda: render_program(csv_program), lambda: recursive_program_to_text(csv_program), args.rounds),
+        measure("deep lists", lambda: render_expression(shallow_lists, False), lambda: recursive_expr_to_text(shallow_lists, False), args.rounds),
+        measure("deep calls", lambda: render_program(calls), lambda: recursive_program_to_text(calls), args.rounds),
+    ]
+    # Beyond the recursion limit, only the iterative renderer finishes.
+    very_deep = deep_lists(scale * 50)
+    results.append(measure("very deep lists", lambda: render_expression(very_deep, False), lambda: recursive_expr_to_text(very_deep, False), args.rounds))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for stats in results:
+        baseline = stats["recursive_ms"]
+        comparison = f", recursive {baseline} ms" if isinstance(baseline, float) else f", recursive: {baseline}"
+        speedup = f" ({stats['speedup']}x)" if stats["speedup"] else ""
+        print(f"{stats['payload']:>16}: {stats['chars']} chars, iterative {stats['iterative_ms']} ms{comparison}{speedup}")
+
+if __name__ == "__main__":
+    main()
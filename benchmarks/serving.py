@@ -0,0 +1,193 @@
+"""
+Runs `translation_server` end to end against a `ReplayModel` answering from `benchmarks/corpus/{coffee,math,csv}.jsonl`
+with a simulated latency, and compares it with translating the same requests one at a time, as the demos' REPLs
+do. Clients send their requests over TCP without waiting for replies; every reply is checked against the
+result of translating its request directly, and the server's answers to malformed requests and to `stats` are
+checked too. Reports throughput, client-side latency and the server's queueing and batching statistics; exits
+with status 1 on any wrong reply.
+
+Run from the repository root:
+
+    python -m benchmarks.serving [--clients N] [--requests N] [--latency SECONDS] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Any
+
+from replay_model import ReplayModel
+from schema_registry import SchemaRegistry
+from translation_server import ServedSchema, TranslationServer, replay_model
+from typechat import Success
+
+corpus_dir = os.path.join(os.path.dirname(__file__), "corpus")
+corpora = {"coffee_api": "coffee.jsonl", "math_api": "math.jsonl", "csv_api": "csv.jsonl"}
+schemas = [ServedSchema("coffee_api", "Cart"), ServedSchema("math_api"), ServedSchema("csv_api")]
+
+def workload(count: int, rng: random.Random) -> list[tuple[str, str]]:
+    """(schema, intent) pairs drawn from every corpus."""
+    intents = [
+        (name, intent)
+        for name, file_name in corpora.items()
+        for intent in ReplayModel.from_jsonl(os.path.join(corpus_dir, file_name)).responses
+    ]
+    return [rng.choice(intents) for _ in range(count)]
+
+def expected_replies(registry: SchemaRegistry, model: ReplayModel, requests: list[tuple[str, str]]) -> tuple[dict[tuple[str, str], dict[str, Any]], float]:
+    """The reply the server should give for each distinct request, and the seconds translating all of `requests` one at a time took."""
+    translators = {
+        schema.name: registry.program_translator(model, schema.name) if schema.type_name is None
+        else registry.translator(model, schema.name, schema.type_name)
+        for schema in schemas
+    }
+    # Validating every recorded response once leaves the validators' verdicts memoized for both runs.
+    for name, intent in set(requests):
+        translators[name].translate(intent)
+    replies: dict[tuple[str, str], dict[str, Any]] = {}
+    start = time.perf_counter()
+    for name, intent in requests:
+        result = translators[name].translate(intent)
+        replies[name, intent] = {"ok": True, "value": result.value} if isinstance(result, Success) else {"ok": False}
+    return replies, time.perf_counter() - start
+
+async def client(port: int, requests: list[tuple[int, str, str]], latencies: list[float]) -> dict[int, dict[str, Any]]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port, limit=1 << 20)
+    sent: dict[int, float] = {}
+
+    async def send_all() -> None:
+        for request_id, name, intent in requests:
+            sent[request_id] = time.perf_counter()
+            writer.write(json.dumps({"id": request_id, "schema": name, "request": intent}).encode() + b"\n")
+            await writer.drain()
+
+    sender = asyncio.create_task(send_all())
+    replies: dict[int, dict[str, Any]] = {}
+    while len(replies) < len(requests):
+        line = await reader.readline()
+        if not line:
+            break
+        reply = json.loads(line)
+        latencies.append(time.perf_counter() - sent[reply["id"]])
+        replies[reply["id"]] = reply
+    await sender
+    writer.close()
+    await writer.wait_closed()
+    return replies
+
+async def exchange(port: int, lines: list[bytes]) -> list[dict[str, Any]]:
+    """Sends raw lines on a new connection and returns the replies to them, in order."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    replies: list[dict[str, Any]] = []
+    for line in lines:
+        writer.write(line)
+        await writer.drain()
+        replies.append(json.loads(await reader.readline()))
+    writer.close()
+    await writer.wait_closed()
+    return replies
+
+async def run_server(
+    registry: SchemaRegistry,
+    model: ReplayModel,
+    requests: list[tuple[str, str]],
+    num_clients: int,
+    max_pending: int,
+) -> tuple[dict[int, dict[str, Any]], list[float], float, dict[str, Any], list[dict[str, Any]]]:
+    server = TranslationServer(model, schemas, registry, max_pending=max_pending, warm_checker=False)
+    started = await server.start()
+    if not isinstance(started, Success):
+        raise RuntimeError(started.message)
+    port = started.value
+    try:
+        numbered = [(i, name, intent) for i, (name, intent) in enumerate(requests)]
+        latencies: list[float] = []
+        start = time.perf_counter()
+        per_client = await asyncio.gather(*(client(port, numbered[c::num_clients], latencies) for c in range(num_clients)))
+        seconds = time.perf_counter() - start
+        control = await exchange(port, [
+            b"not json\n",
+            b'{"id": "a", "schema": "weather_api", "request": "will it rain?"}\n',
+            b'{"id": "b", "op": "stats"}\n',
+        ])
+    finally:
+        await server.stop()
+    replies = {request_id: reply for replies in per_client for request_id, reply in replies.items()}
+    return replies, latencies, seconds, control[-1]["value"], control
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=400, help="requests in total, spread over the clients")
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated model latency in seconds")
+    parser.add_argument("--max-pending", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    requests = workload(args.requests, random.Random(args.seed))
+    registry = SchemaRegistry()
+    model = replay_model([os.path.join(corpus_dir, file_name) for file_name in corpora.values()], args.latency)
+    expected, sequential_seconds = expected_replies(registry, model, requests)
+    replies, latencies, seconds, stats, control = asyncio.run(
+        run_server(registry, model, requests, args.clients, args.max_pending))
+
+    wrong = 0
+    for i, (name, intent) in enumerate(requests):
+        reply = replies.get(i)
+        want = expected[name, intent]
+        if reply is None or reply["ok"] != want["ok"] or (want["ok"] and reply["value"] != want["value"]):
+            wrong += 1
+            if wrong <= 3:
+                print(f"Wrong reply to {name} request {intent!r}: {reply!r}", file=sys.stderr)
+    malformed_ok = [reply["ok"] for reply in control] == [False, False, True] and control[1]["id"] == "a"
+    if not malformed_ok:
+        print(f"Wrong replies to the control requests: {control!r}", file=sys.stderr)
+
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else [0.0] * 99
+    sequential: dict[str, float] = {
+        "seconds": round(sequential_seconds, 3),
+        "per_s": round(len(requests) / sequential_seconds, 1),
+    }
+    validation: dict[str, Any] = stats["validation"]
+    server: dict[str, Any] = {
+        "seconds": round(seconds, 3),
+        "per_s": round(len(requests) / seconds, 1),
+        "p50_ms": round(cuts[49] * 1000, 2),
+        "p99_ms": round(cuts[98] * 1000, 2),
+        "queue_wait_p99_ms": stats["server"]["queue_wait"]["p99_ms"],
+        "validation": validation,
+    }
+    results = {
+        "requests": len(requests),
+        "clients": args.clients,
+        "model_latency_ms": args.latency * 1000,
+        "wrong_replies": wrong,
+        "control_replies_ok": malformed_ok,
+        "sequential": sequential,
+        "server": server,
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{len(requests)} requests from {args.clients} clients, {args.latency * 1000:g} ms per model call")
+        print(f"  one at a time: {sequential['seconds']} s ({sequential['per_s']}/s)")
+        print(" ".join([
+            f"         server: {server['seconds']} s ({server['per_s']}/s), p50 {server['p50_ms']} ms, p99 {server['p99_ms']} ms,",
+            f"queue wait p99 {server['queue_wait_p99_ms']} ms",
+        ]))
+        print(" ".join([
+            f"    validations: {validation['validations']} in {validation['batches']} batches",
+            f"(mean {validation['mean_batch']}, largest {validation['largest_batch']}), {validation['deduplicated']} deduplicated",
+        ]))
+        print(f"  wrong replies: {wrong}, control replies {'ok' if malformed_ok else 'WRONG'}")
+    if wrong or not malformed_ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
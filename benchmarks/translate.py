@@ -0,0 +1,229 @@
+"""
+Measures the library's own overhead in `translate`, using a `ReplayModel` that replays the recorded responses in
+`benchmarks/corpus/{coffee,math,csv}.jsonl` (including invalid responses that trigger repairs).
+
+Reports p50/p95/p99 latency and throughput per schema, broken down into prompt building, the model call, JSON
+extraction, rendering (`expr_to_text`/`program_to_text`) and checking, along with the tokens sent in first
+requests and in repairs. Results are printed as JSON.
+
+Run from the repository root:
+
+    python -m benchmarks.translate [--rounds N] [--schemas coffee math csv] [--checker cold|daemon]
+                                   [--repair full|targeted] [--output FILE]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, TypeVar
+from typing_extensions import override
+
+import coffee_api
+import csv_api
+import math_api
+from program.schema import Program
+from replay_model import ReplayModel
+from typechat import (Checker, DaemonChecker, Model, ProgramTranslator, ProgramValidator, RepairPromptMode, RepairStrategy, Result,
+                      Success, TranslationObserver, TypedDictTranslator, TypedDictValidator, ValidationMode, count_tokens,
+                      expr_to_text, program_to_text)
+
+T = TypeVar("T")
+
+corpus_dir = os.path.join(os.path.dirname(__file__), "corpus")
+
+class Timings:
+    def __init__(self):
+        super().__init__()
+        self.stages: dict[str, list[float]] = {}
+
+    def record(self, stage: str, seconds: float) -> None:
+        self.stages.setdefault(stage, []).append(seconds)
+
+    def timed(self, stage: str, fn: Callable[..., Any], *args: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+class TimedModel(Model):
+    def __init__(self, model: Model, timings: Timings):
+        super().__init__()
+        self.model = model
+        self.timings = timings
+
+    @override
+    def complete(self, input: str) -> Result[str]:
+        start = time.perf_counter()
+        result = self.model.complete(input)
+        self.timings.record("model", time.perf_counter() - start)
+        if isinstance(result, Success):
+            # Mirrors the extraction `translate` does on every response.
+            self.timings.timed("extract", _extract_json, result.value)
+        return result
+
+def _extract_json(text: str) -> str | None:
+    first_curly = text.find("{")
+    last_curly = text.rfind("}") + 1
+    return text[first_curly:last_curly] if 0 <= first_curly < last_curly else None
+
+def timed_validation(timings: Timings, validate: Callable[[str], Result[Any]], json_text: str, render: Callable[[Any], str] | None) -> Result[Any]:
+    """Times a validation, splitting off the time `render` takes (rendering JSON as Python) from the checker's time."""
+    start = time.perf_counter()
+    result = validate(json_text)
+    total = time.perf_counter() - start
+    render_seconds = 0.0
+    if render is not None:
+        value = json.loads(json_text)
+        render_start = time.perf_counter()
+        try:
+            render(value)
+        except Exception:
+            pass
+        render_seconds = time.perf_counter() - render_start
+        timings.record("render", render_seconds)
+    timings.record("check", max(total - render_seconds, 0.0))
+    return result
+
+def render_expr(value: Any) -> str:
+    return expr_to_text(value, for_program=False)
+
+@dataclass
+class TimedValidator(TypedDictValidator[T]):
+    timings: Timings = field(default_factory=Timings, repr=False, compare=False)
+
+    @override
+    def validate(self, json_text: str) -> Result[T]:
+        # Natively compiled schemas are checked without rendering the JSON as Python.
+        render = render_expr if self.compiled_schema() is None else None
+        return timed_validation(self.timings, super().validate, json_text, render)
+
+class TimedProgramValidator(ProgramValidator):
+    def __init__(self, schema: str, checker: Checker | None, timings: Timings):
+        if checker is not None:
+            super().__init__(schema, checker, memo_size=0)
+        else:
+            super().__init__(schema, memo_size=0)
+        self.timings = timings
+
+    @override
+    def validate(self, json_text: str) -> Result[Program]:
+        return timed_validation(self.timings, super().validate, json_text, program_to_text)
+
+class PromptTokens(TranslationObserver):
+    """Counts the tokens sent to the model, separating first requests from repairs."""
+    def __init__(self):
+        super().__init__()
+        self.first = 0
+        self.repair = 0
+        self._repairing = False
+
+    @override
+    def on_repair_attempt(self, attempt: int, error_message: str) -> None:
+        self._repairing = True
+
+    @override
+    def on_model_call_start(self, prompt: str) -> None:
+        if self._repairing:
+            self.repair += count_tokens(prompt)
+        else:
+            self.first += count_tokens(prompt)
+        self._repairing = False
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    if len(samples) < 2:
+        samples = samples * 2 or [0.0, 0.0]
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {
+        "p50_ms": round(cuts[49] * 1000, 4),
+        "p95_ms": round(cuts[94] * 1000, 4),
+        "p99_ms": round(cuts[98] * 1000, 4),
+        "count": len(samples),
+    }
+
+def read_schema(module: Any) -> str:
+    with open(module.__file__, "r") as schema_file:
+        return schema_file.read()
+
+def run_schema(
+    name: str,
+    rounds: int,
+    mode: ValidationMode,
+    checker: Checker | None,
+    latency: float,
+    repair: RepairPromptMode,
+) -> dict[str, Any]:
+    timings = Timings()
+    tokens = PromptTokens()
+    replay = ReplayModel.from_jsonl(os.path.join(corpus_dir, f"{name}.jsonl"), latency)
+    model = TimedModel(replay, timings)
+    translator: TypedDictTranslator[Any]
+    # Validators are built without a verdict memo, so every round measures checking rather than looking up the
+    # first round's verdicts.
+    if name == "coffee":
+        cart_validator = TimedValidator[coffee_api.Cart](read_schema(coffee_api), "Cart", mode, memo_size=0, timings=timings)
+        translator = TypedDictTranslator(model, cart_validator, observer=tokens, repair=RepairStrategy(repair))
+    else:
+        schema = read_schema(math_api if name == "math" else csv_api)
+        program_validator = TimedProgramValidator(schema, checker, timings)
+        translator = ProgramTranslator(model, program_validator, observer=tokens, repair=RepairStrategy(repair))
+
+    intents = list(replay.responses)
+    totals: list[float] = []
+    successes = 0
+    model_calls_before = replay.calls
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for intent in intents:
+            timings.timed("prompt_build", translator._create_request_prompt, intent) # pyright: ignore[reportPrivateUsage]
+            translation_start = time.perf_counter()
+            result = translator.translate(intent)
+            totals.append(time.perf_counter() - translation_start)
+            successes += isinstance(result, Success)
+    elapsed = time.perf_counter() - start
+    translations = rounds * len(intents)
+
+    return {
+        "translations": translations,
+        "succeeded": successes,
+        "model_calls": replay.calls - model_calls_before,
+        "repairs": replay.calls - model_calls_before - translations,
+        "throughput_per_s": round(translations / elapsed, 2),
+        "prompt_tokens": {"first": tokens.first, "repair": tokens.repair},
+        "total": percentiles(totals),
+        "stages": {stage: percentiles(samples) for stage, samples in timings.stages.items()},
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--schemas", nargs="+", default=["coffee", "math", "csv"], choices=["coffee", "math", "csv"])
+    parser.add_argument("--mode", default="native", choices=["native", "mypy"], help="validation mode for coffee")
+    parser.add_argument("--checker", default="cold", choices=["cold", "daemon"], help="mypy backend for programs")
+    parser.add_argument("--repair", default="targeted", choices=["full", "targeted"], help="repair prompt mode")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated model latency in seconds")
+    parser.add_argument("--output", help="write results to this file instead of stdout")
+    args = parser.parse_args()
+
+    checker = DaemonChecker() if args.checker == "daemon" else None
+    try:
+        results = {
+            "config": vars(args),
+            "schemas": {name: run_schema(name, args.rounds, args.mode, checker, args.latency, args.repair) for name in args.schemas},
+        }
+    finally:
+        if isinstance(checker, DaemonChecker):
+            checker.stop()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
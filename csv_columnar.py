@@ -0,0 +1,576 @@
+from array import array
+import codecs
+from collections import Counter
+from contextlib import contextmanager
+import csv
+import gc
+import io
+from itertools import compress, repeat
+import math
+import mmap
+import operator
+import os
+from typing import Any, Callable, Generator, Iterable, Iterator, Literal, TypeAlias
+from typing_extensions import override
+
+import csv_api
+from program.executor import in_place, not_parallel_safe
+from program.optimizer import Fusion, OptimizationRules, csv_api_rules
+from program.schema import FunctionCall
+
+# A reference implementation of `csv_api.API` that stores tables by column, for running generated programs
+# over real data. Whole-column operations (masks, maps, filters) go through C-level iteration (`map`,
+# `itertools.compress`, typed arrays) rather than a Python loop per row.
+#
+# Columns of integers are stored in `array("q")`s and columns of numbers in `array("d")`s, with NaN for a
+# missing number (an empty field). Anything else is a list of values: the text of the field when read from
+# a file, or whatever values a program put there.
+#
+# Numbers read from a file that are not written the way the numbers print ("02134", "1_000", "2.00") keep
+# their fields' text alongside the array, in `ColumnarTable.texts`. The text is what the table holds - what
+# `get_column` returns, what text is compared with, and what is written back, unchanged - while arithmetic
+# and comparisons with numbers use the array.
+
+Column: TypeAlias = "array[Any] | list[Any]"
+# The text of a numeric column's fields, or None if the numbers are written the way they print.
+Texts: TypeAlias = "list[str] | None"
+
+# Files are read this many bytes at a time (rounded to whole rows), so memory stays bounded while parsing.
+# Small chunks also keep each chunk's rows in cache while they are transposed into columns.
+default_chunk_bytes = 256 * 1024
+# Rows written per call to the CSV writer.
+_write_batch_rows = 65536
+
+class ColumnarTable(csv_api.Table):
+    __slots__ = ("names", "columns", "texts")
+
+    def __init__(self, names: list[str], columns: list[Column], texts: list[Texts] | None = None):
+        super().__init__()
+        if len(names) != len(columns):
+            raise ValueError(f"A table with {len(names)} column names cannot have {len(columns)} columns.")
+        if len({len(column) for column in columns}) > 1:
+            raise ValueError("All columns of a table must have the same number of rows.")
+        if texts is not None and (len(texts) != len(columns) or any(
+                text is not None and len(text) != len(column) for column, text in zip(columns, texts))):
+            raise ValueError("A table needs the text of every field of the columns it keeps the text of.")
+        self.names = names
+        self.columns = columns
+        self.texts: list[Texts] = texts if texts is not None else [None] * len(columns)
+
+    @staticmethod
+    def from_rows(names: list[str], rows: Iterable[Iterable[Any]]) -> "ColumnarTable":
+        values = list(zip(*rows)) or [() for _ in names]
+        return ColumnarTable(list(names), [_typed_column(column) for column in values])
+
+    @property
+    def num_rows(self) -> int:
+        return len(self.columns[0]) if self.columns else 0
+
+    def column(self, name: str) -> Column:
+        """The column's storage: for a numeric column, its numbers."""
+        return self.columns[self.index(name)]
+
+    def values(self, name: str) -> Column:
+        """The column's values as the table holds them: for numbers not written the way they print, their text."""
+        i = self.index(name)
+        return _values(self.columns[i], self.texts[i])
+
+    def index(self, name: str) -> int:
+        try:
+            return self.names.index(name)
+        except ValueError:
+            raise KeyError(f'The table has no column "{name}"; its columns are {", ".join(map(repr, self.names))}.') from None
+
+    def rows(self) -> Iterator[tuple[Any, ...]]:
+        return zip(*map(_values, self.columns, self.texts))
+
+    def extend(self, other: "ColumnarTable") -> None:
+        """Appends the rows of a table with the same column names."""
+        if other.names != self.names:
+            raise ValueError("Only tables with the same column names can be concatenated.")
+        joined = [
+            _concatenate([(column, text), (more, more_text)])
+            for column, text, more, more_text in zip(self.columns, self.texts, other.columns, other.texts)
+        ]
+        self.columns = [column for column, _ in joined]
+        self.texts = [text for _, text in joined]
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    @override
+    def __repr__(self) -> str:
+        return f"ColumnarTable({self.names!r}, {self.num_rows} rows)"
+
+def read_csv_chunks(filename: str, chunk_bytes: int = default_chunk_bytes) -> Iterator[ColumnarTable]:
+    """
+    Reads a CSV file with a header row as a sequence of tables of about `chunk_bytes` of input each, so files
+    larger than memory can be processed a chunk at a time. The file is memory-mapped rather than read.
+    """
+    names: list[str] | None = None
+    for text in _text_chunks(filename, chunk_bytes):
+        with _collection_paused():
+            if names is None:
+                rows = list(csv.reader(io.StringIO(text)))
+                if not rows:
+                    continue
+                names = rows[0]
+                columns = _transpose(rows[1:], len(names))
+            else:
+                split = _split_columns(text, len(names))
+                columns = split if split is not None else _transpose(list(csv.reader(io.StringIO(text))), len(names))
+            if columns and columns[0]:
+                parsed = [_parse_column(values) for values in columns]
+                yield ColumnarTable(list(names), [column for column, _ in parsed], [text for _, text in parsed])
+
+def write_csv_chunks(filename: str, tables: Iterable[ColumnarTable]) -> None:
+    """Writes tables with the same columns to one CSV file, with a header row, as they arrive."""
+    with open(filename, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        names: list[str] | None = None
+        for table in tables:
+            if names is None:
+                names = table.names
+                writer.writerow(names)
+            elif table.names != names:
+                raise ValueError("Only tables with the same column names can be written to one file.")
+            for start in range(0, table.num_rows, _write_batch_rows):
+                end = start + _write_batch_rows
+                with _collection_paused():
+                    writer.writerows(zip(*(
+                        _writable(column[start:end], text[start:end] if text is not None else None)
+                        for column, text in zip(table.columns, table.texts)
+                    )))
+
+_numeric_ops: dict[str, Callable[[Any, Any], Any]] = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    # typeshed leaves these two unannotated.
+    "/": operator.truediv,  # pyright: ignore[reportUnknownMemberType]
+    "**": operator.pow,  # pyright: ignore[reportUnknownMemberType]
+}
+
+_str_ops: dict[str, Callable[[str], str]] = {
+    "trim": str.strip,
+    "trim_start": str.lstrip,
+    "trim_end": str.rstrip,
+}
+
+class ColumnarCSV(csv_api.API):
+    """
+    Implements `csv_api.API` over `ColumnarTable`s. Like the API describes, methods that return "the given
+    table" change it in place, and are marked `in_place` so that `run_parallel` orders the calls reading the
+    table around them. `group_by` returns a new table of each distinct value of the column, in order
+    of first appearance, with the number of rows that have it.
+    """
+
+    def __init__(self, chunk_bytes: int = default_chunk_bytes):
+        super().__init__()
+        self.chunk_bytes = chunk_bytes
+
+    @override
+    def read_csv(self, filename: str) -> csv_api.Table:
+        chunks = list(read_csv_chunks(filename, self.chunk_bytes))
+        if not chunks:
+            return _read_header_only(filename)
+        if len(chunks) == 1:
+            return chunks[0]
+        names = chunks[0].names
+        joined = [_concatenate([(chunk.columns[i], chunk.texts[i]) for chunk in chunks]) for i in range(len(names))]
+        return ColumnarTable(names, [column for column, _ in joined], [text for _, text in joined])
+
+    @override
+    @not_parallel_safe
+    def write_csv(self, filename: str, table: csv_api.Table) -> None:
+        write_csv_chunks(filename, [_columnar(table)])
+
+    @override
+    def get_column_names(self, table: csv_api.Table) -> list[str]:
+        return list(_columnar(table).names)
+
+    @override
+    def get_column(self, table: csv_api.Table, column_name: str) -> list[Any]:
+        return list(_columnar(table).values(column_name))
+
+    @override
+    @in_place
+    def set_column(self, table: csv_api.Table, column_name: str, column: list[Any]) -> csv_api.Table:
+        t = _columnar(table)
+        if t.columns and len(column) != t.num_rows:
+            raise ValueError(f'Column "{column_name}" has {len(column)} values, but the table has {t.num_rows} rows.')
+        values = _typed_column(column)
+        if column_name in t.names:
+            i = t.index(column_name)
+            t.columns[i] = values
+            t.texts[i] = None
+        else:
+            t.names.append(column_name)
+            t.columns.append(values)
+            t.texts.append(None)
+        return t
+
+    @override
+    @in_place
+    def remove_column(self, table: csv_api.Table, column_name: str) -> csv_api.Table:
+        t = _columnar(table)
+        i = t.index(column_name)
+        del t.names[i]
+        del t.columns[i]
+        del t.texts[i]
+        return t
+
+    @override
+    @in_place
+    def add_row(self, table: csv_api.Table, row: list[Any]) -> csv_api.Table:
+        t = _columnar(table)
+        if len(row) != len(t.columns):
+            raise ValueError(f"The row has {len(row)} values, but the table has {len(t.columns)} columns.")
+        appended = [_append(column, text, value) for column, text, value in zip(t.columns, t.texts, row)]
+        t.columns = [column for column, _ in appended]
+        t.texts = [text for _, text in appended]
+        return t
+
+    @override
+    @in_place
+    def remove_rows_by_index(self, table: csv_api.Table, row_index: int | list[int]) -> csv_api.Table:
+        t = _columnar(table)
+        num_rows = t.num_rows
+        keep = bytearray(b"\x01") * num_rows
+        for i in [row_index] if isinstance(row_index, int) else row_index:
+            if not -num_rows <= i < num_rows:
+                raise IndexError(f"Row {i} is out of range for a table with {num_rows} rows.")
+            keep[i] = 0
+        return _keep(t, keep)
+
+    @override
+    @in_place
+    def drop_rows(self, table: csv_api.Table, rows: list[bool]) -> csv_api.Table:
+        t = _columnar(table)
+        return _keep(t, list(map(operator.not_, _mask(t, rows))))
+
+    @override
+    @in_place
+    def keep_rows(self, table: csv_api.Table, rows: list[bool]) -> csv_api.Table:
+        t = _columnar(table)
+        return _keep(t, _mask(t, rows))
+
+    @in_place
+    def keep_rows_equal(self, table: csv_api.Table, column_name: str, value: Any) -> csv_api.Table:
+        """`keep_rows(table, equals(table, column_name, value))` in one call, which `columnar_rules` fuses into."""
+        t = _columnar(table)
+        return _keep(t, self.equals(t, column_name, value))
+
+    @in_place
+    def keep_rows_not_equal(self, table: csv_api.Table, column_name: str, value: Any) -> csv_api.Table:
+        """`keep_rows(table, not_equals(table, column_name, value))` in one call."""
+        t = _columnar(table)
+        return _keep(t, self.not_equals(t, column_name, value))
+
+    @override
+    def equals(self, table: csv_api.Table, column_name: str, value: Any) -> list[bool]:
+        t = _columnar(table)
+        if _is_missing(value):
+            return _missing(t.values(column_name))
+        column, operand = _operands(t, column_name, value)
+        return list(map(operator.eq, column, repeat(operand)))
+
+    @override
+    def not_equals(self, table: csv_api.Table, column_name: str, value: Any) -> list[bool]:
+        t = _columnar(table)
+        if _is_missing(value):
+            return list(map(operator.not_, _missing(t.values(column_name))))
+        column, operand = _operands(t, column_name, value)
+        return list(map(operator.ne, column, repeat(operand)))
+
+    @override
+    def group_by(self, table: csv_api.Table, column_name: str) -> csv_api.Table:
+        column = _columnar(table).values(column_name)
+        if _has_nan(column):
+            # NaNs never equal each other, but all stand for the same thing: a missing number.
+            counts: Counter[Any] = Counter(None if value != value else value for value in column)
+            keys = [math.nan if key is None else key for key in counts]
+        else:
+            counts = Counter(column)
+            keys = list(counts)
+        return ColumnarTable([column_name, "count"], [_typed_column(keys), array("q", counts.values())])
+
+    @override
+    def numeric_map(self, table: csv_api.Table, column_name: str, op: Literal["+", "-", "*", "/", "**"], operand: int | float) -> list[int | float]:
+        column = _numeric(_columnar(table), column_name)
+        return list(map(_numeric_ops[op], column, repeat(operand)))
+
+    @override
+    def str_map(self, table: csv_api.Table, column_name: str, op: Literal["trim", "trim_start", "trim_end", "slice"], start: int | None = None, end: int | None = None) -> list[str]:
+        strings = _strings(_columnar(table).values(column_name))
+        if op == "slice":
+            return [value[start:end] for value in strings]
+        return list(map(_str_ops[op], strings))
+
+def _columnar(table: csv_api.Table) -> ColumnarTable:
+    if not isinstance(table, ColumnarTable):
+        raise TypeError(f"Expected a table read by this API, but got {type(table).__name__}.")
+    return table
+
+def _text_chunks(filename: str, chunk_bytes: int) -> Iterator[str]:
+    """
+    Decodes a file in chunks that end at row boundaries: after a newline that is not inside a quoted field,
+    which is the case when the chunk holds an even number of quotes.
+    """
+    with open(filename, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start = len(codecs.BOM_UTF8) if data[:len(codecs.BOM_UTF8)] == codecs.BOM_UTF8 else 0
+            while start < size:
+                end = _after_newline(data, start + chunk_bytes, size)
+                chunk = data[start:end]
+                while end < size and chunk.count(b'"') % 2:
+                    end = _after_newline(data, end, size)
+                    chunk = data[start:end]
+                yield chunk.decode("utf-8")
+                start = end
+
+def _transpose(rows: list[list[str]], width: int) -> list[list[str]]:
+    if set(map(len, rows)) - {width}:
+        # Blank lines are skipped, and short or long rows padded or cut to the header's width.
+        rows = [row + [""] * (width - len(row)) if len(row) < width else row[:width] for row in rows if row]
+    return [list(map(operator.itemgetter(i), rows)) for i in range(width)]
+
+def _split_columns(text: str, width: int) -> list[list[str]] | None:
+    """
+    Splits a chunk without quotes (so without commas or newlines inside fields) into columns with a few
+    string operations, rather than a list per row. Returns None if the chunk needs a CSV reader after all.
+    """
+    # With a single column, a blank line would be an empty field, where the CSV reader skips it.
+    if width < 2 or '"' in text or not text.endswith("\n"):
+        return None
+    if "\r" in text:
+        # Lines usually end in "\r\n", as `csv.writer` ends them; any other "\r" is left to the CSV reader.
+        text = text.replace("\r\n", "\n")
+        if "\r" in text:
+            return None
+    lines = text.split("\n")
+    lines.pop()
+    if set(map(_count_commas, lines)) != {width - 1}:
+        return None
+    fields = ",".join(lines).split(",")
+    return [fields[i::width] for i in range(width)]
+
+_count_commas = operator.methodcaller("count", ",")
+
+@contextmanager
+def _collection_paused() -> Generator[None, None, None]:
+    """
+    Parsing allocates a list for every row, and writing a tuple, none of which can be part of a reference
+    cycle. Pausing the cyclic garbage collector meanwhile spares it from traversing them over and over.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def _after_newline(data: mmap.mmap, position: int, size: int) -> int:
+    if position >= size:
+        return size
+    newline = data.find(b"\n", position)
+    return size if newline < 0 else newline + 1
+
+def _read_header_only(filename: str) -> ColumnarTable:
+    with open(filename, "r", newline="", encoding="utf-8-sig") as f:
+        empty: list[str] = []
+        header = next(csv.reader(f), empty)
+    return ColumnarTable(header, [[] for _ in header])
+
+def _parse_column(values: list[str]) -> tuple[Column, Texts]:
+    """
+    Stores the fields of a column as integers or numbers if they all are (or are empty), with their text if
+    any of them is not written the way its number prints ("007", "1_000", "2.00"); otherwise as text.
+    """
+    try:
+        integers = array("q", list(map(int, values)))
+    except (ValueError, OverflowError):
+        pass
+    else:
+        return integers, None if list(map(str, integers)) == values else values
+    try:
+        numbers = array("d", list(map(float, [value or "nan" for value in values] if "" in values else values)))
+    except ValueError:
+        return values, None
+    return numbers, None if list(map(_format_number, numbers)) == values else values
+
+def _typed_column(values: Iterable[Any]) -> Column:
+    """Stores values a program produced in a typed array if they are all integers or all numbers."""
+    values = list(values)
+    types = set(map(type, values))
+    try:
+        if types <= {int}:
+            return array("q", values)
+        # Integers among the numbers stay in a list, so they are written as integers.
+        if types <= {float}:
+            return array("d", values)
+    except OverflowError:
+        pass
+    return values
+
+def _concatenate(parts: list[tuple[Column, Texts]]) -> tuple[Column, Texts]:
+    """Joins parts of a column, converting them all to the most general storage any of them uses."""
+    kinds = {column.typecode if isinstance(column, array) else "list" for column, _ in parts}
+    if "list" not in kinds:
+        # Integers joined with numbers become numbers, keeping the integers' text.
+        mixed = len(kinds) > 1
+        typecode = "d" if mixed else kinds.pop()
+        joined: array[Any] = array(typecode)
+        for column, _ in parts:
+            joined.extend(column if isinstance(column, array) and column.typecode == typecode else list(column))
+        if not mixed and all(text is None for _, text in parts):
+            return joined, None
+        return joined, [value for column, text in parts for value in _text(column, text)]
+    # Text that happened to look like numbers in one chunk of a file is text after all.
+    return [value for column, text in parts for value in (column if isinstance(column, list) else _text(column, text))], None
+
+def _append(column: Column, text: Texts, value: Any) -> tuple[Column, Texts]:
+    """Appends a value to a column, moving the column to more general storage if the value needs it."""
+    if not isinstance(column, array):
+        column.append(value)
+        return column, None
+    number = _as_number(value)
+    if (type(number) is int and column.typecode == "q") or (type(number) in (int, float) and column.typecode == "d"):
+        try:
+            column.append(number)
+        except OverflowError:
+            pass
+        else:
+            spelled = value if type(value) is str else "" if value is None else _format_number(value)
+            if text is not None:
+                text.append(spelled)
+            elif spelled != _format_number(column[-1]):
+                text = _strings(column[:-1]) + [spelled]
+            return column, text
+    values = list(_values(column, text))
+    values.append(value)
+    return values, None
+
+def _as_number(value: Any) -> Any:
+    """Converts text to the number it spells (as `_parse_column` reads fields), and None to NaN; returns anything else unchanged."""
+    if value is None or value == "":
+        return float("nan")
+    if type(value) is str:
+        for parse in (int, float):
+            try:
+                return parse(value)
+            except ValueError:
+                continue
+    return value
+
+def _operands(table: ColumnarTable, column_name: str, value: Any) -> tuple[Column, Any]:
+    """
+    The column to compare a value with, and the value as that column holds it: numbers compare with a
+    numeric column's numbers, and anything else with the column's values.
+    """
+    i = table.index(column_name)
+    column, text = table.columns[i], table.texts[i]
+    if text is not None and not (type(value) in (int, float)):
+        return text, value
+    return column, _comparable(column, value)
+
+def _comparable(column: Column, value: Any) -> Any:
+    """
+    Reads text as a number when comparing it with a column of numbers written the way they print, if the
+    text is written that way too, so comparisons match the text of the file.
+    """
+    if isinstance(column, array) and type(value) is str:
+        number = _as_number(value)
+        if type(number) is (int if column.typecode == "q" else float) and _format_number(number) == value:
+            return number
+    return value
+
+def _is_missing(value: Any) -> bool:
+    return value is None or value == "" or (type(value) is float and value != value)
+
+def _missing(column: Column) -> list[bool]:
+    if isinstance(column, array):
+        return [value != value for value in column] if column.typecode == "d" else [False] * len(column)
+    return [value is None or value == "" for value in column]
+
+def _numeric(table: ColumnarTable, column_name: str) -> Column:
+    column = table.column(column_name)
+    if isinstance(column, array):
+        return column
+    try:
+        # Empty fields are missing numbers, as in a column parsed as numbers.
+        return array("d", [math.nan if value is None or value == "" else float(value) for value in column])
+    except (ValueError, TypeError):
+        raise TypeError(f'Column "{column_name}" does not hold numbers.') from None
+
+def _values(column: Column, text: Texts) -> Column:
+    return text if text is not None else column
+
+def _text(column: Column, text: Texts) -> list[str]:
+    return text if text is not None else _strings(column)
+
+def _strings(column: Column) -> list[str]:
+    if isinstance(column, array):
+        return list(map(_format_number, column))
+    if all(type(value) is str for value in column):
+        return column
+    return ["" if value is None else str(value) for value in column]
+
+def _format_number(value: int | float) -> str:
+    return "" if value != value else str(value)
+
+def _has_nan(column: Column) -> bool:
+    return isinstance(column, array) and column.typecode == "d" and any(map(math.isnan, column))
+
+def _writable(column: Column, text: Texts) -> Iterable[Any]:
+    if text is not None:
+        return text
+    # The CSV writer writes None as an empty field, but NaN as "nan".
+    if _has_nan(column):
+        return map(_format_number, column)
+    return column
+
+def _mask(table: ColumnarTable, rows: list[bool]) -> list[bool]:
+    if len(rows) != table.num_rows:
+        raise ValueError(f"Expected a boolean for each of the table's {table.num_rows} rows, but got {len(rows)}.")
+    return rows
+
+def _keep(table: ColumnarTable, keep: Iterable[Any]) -> ColumnarTable:
+    keep = keep if isinstance(keep, (list, bytearray)) else list(keep)
+    table.columns = [
+        array(column.typecode, compress(column, keep)) if isinstance(column, array) else list(compress(column, keep))
+        for column in table.columns
+    ]
+    table.texts = [list(compress(text, keep)) if text is not None else None for text in table.texts]
+    return table
+
+def _row_filter(func: str) -> Callable[[FunctionCall, FunctionCall], FunctionCall | None]:
+    """Fuses `keep_rows(table, equals(table, ...))` and the like into a call to `func`."""
+    def fuse(outer: FunctionCall, inner: FunctionCall) -> FunctionCall | None:
+        outer_args: list[Any] = outer.get("@args") or []
+        inner_args: list[Any] = inner.get("@args") or []
+        if len(outer_args) != 2 or len(inner_args) != 3 or outer.get("@kwargs") or inner.get("@kwargs"):
+            return None
+        # The mask must be computed from the very table it filters.
+        table = outer_args[0]
+        if not (isinstance(table, dict) and "@ref" in table) or table != inner_args[0]:
+            return None
+        return {"@func": func, "@args": [table, inner_args[1], inner_args[2]]}
+    return fuse
+
+# `csv_api_rules` for `ColumnarCSV`, which can also filter rows by a column's value in one call.
+columnar_rules = OptimizationRules(
+    pure=csv_api_rules.pure,
+    in_place=csv_api_rules.in_place | {"keep_rows_equal", "keep_rows_not_equal"},
+    effects=csv_api_rules.effects,
+    fusions=csv_api_rules.fusions + (
+        Fusion("keep_rows", "equals", 1, _row_filter("keep_rows_equal")),
+        Fusion("keep_rows", "not_equals", 1, _row_filter("keep_rows_not_equal")),
+        Fusion("drop_rows", "equals", 1, _row_filter("keep_rows_not_equal")),
+        Fusion("drop_rows", "not_equals", 1, _row_filter("keep_rows_equal")),
+    ),
+)
@@ -1,44 +1,20 @@
-from dataclasses import dataclass
 import sys
-from typing import Any
-from typing_extensions import override
 
-from typechat import Failure, Model, ProgramTranslator, ProgramValidator, Result, Success, program_to_text
-
-import openai
+from openai_model import OpenAIModel
+from typechat import Failure, ProgramTranslator, ProgramValidator, program_to_text
 
 from dotenv import dotenv_values
-vals = dotenv_values()
-
-@dataclass
-class OpenAIModel(Model):
-    model_name: str
-    api_key: str
-
-    @override
-    def complete(self, input: str) -> Result[str]:
-        try:
-            ChatCompletion: Any = openai.ChatCompletion
-            response = ChatCompletion.create(
-                model=self.model_name,
-                api_key=self.api_key,
-                messages=[{"role": "user", "content": input}],
-                temperature=0.0,
-            )
-            return Success(response.choices[0].message.content)
-        except Exception as e:
-            return Failure(str(e))
 
 import csv_api
-with open(csv_api.__file__, "r") as schema_file:
-    api_schema = schema_file.read()
-
-model = OpenAIModel(
-    model_name=vals["OPENAI_MODEL"] or "",
-    api_key=vals["OPENAI_API_KEY"] or ""
-)
 
 def main():
+    vals = dotenv_values()
+    with open(csv_api.__file__, "r") as schema_file:
+        api_schema = schema_file.read()
+    model = OpenAIModel(
+        model_name=vals["OPENAI_MODEL"] or "",
+        api_key=vals["OPENAI_API_KEY"] or ""
+    )
     validator = ProgramValidator(api_schema)
     translator = ProgramTranslator(model, validator)
     print("> ", end="", flush=True)
@@ -0,0 +1,286 @@
+from dataclasses import dataclass
+from functools import lru_cache
+import inspect
+import math
+from typing import Any, Callable, Iterator, Sequence, cast
+
+import math_api
+from program.executor import compile_program
+from program.schema import Program
+from schema_checker import JsonPath, format_path
+from typechat import Failure, Result, Success
+
+# Evaluates a `math_api.API` program over whole arrays of inputs at once, rather than once per input with an
+# API call per step. Chosen number literals of the program become parameters, and the program is compiled into
+# a generated function over them: NumPy array expressions if NumPy is installed, and otherwise a single Python
+# loop doing the arithmetic inline.
+#
+# The arithmetic methods are evaluated with their obvious meanings; any other method (like `unknown`) is
+# called on an API implementation - once, if its arguments do not depend on the parameters. With NumPy,
+# arithmetic follows IEEE rules (dividing by zero gives inf or NaN rather than raising); the loop raises
+# exactly where calling the API step by step would. Steps nothing depends on are dropped unless they call the
+# API or can raise (`div` and `pow`), so even an unused `div(1, 0)` raises as it would step by step.
+
+_operators: dict[str, str] = {
+    "add": "({} + {})",
+    "sub": "({} - {})",
+    "mul": "({} * {})",
+    "div": "({} / {})",
+    "pow": "({} ** {})",
+    "neg": "(-{})",
+    "id": "{}",
+}
+
+# Operators that can raise for some operands (ZeroDivisionError, OverflowError), so are evaluated even when
+# nothing depends on their results.
+_raising_operators = frozenset({"div", "pow"})
+
+@lru_cache(maxsize=1)
+def _numpy() -> Any | None:
+    # Looked up once: a failed import is retried (and searches sys.path) on every attempt.
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+def numpy_available() -> bool:
+    return _numpy() is not None
+
+@dataclass(frozen=True)
+class VectorizedProgram:
+    # Paths of the literals each input array replaces, in order.
+    parameters: tuple[JsonPath, ...]
+    uses_numpy: bool
+    # The generated function, for inspection.
+    source: str
+    # Names of the methods called on the API rather than evaluated inline.
+    api_methods: frozenset[str]
+    function: Callable[..., Any]
+
+    def evaluate(self, *inputs: Sequence[float], api: Any = None) -> Any:
+        """
+        Evaluates the program once for each index of the input arrays, which must all have the same length,
+        with the parameters' literals replaced by the inputs' values. Returns a NumPy array if the program
+        uses NumPy, and otherwise a list. `api` is only needed if the program calls methods other than the
+        arithmetic ones.
+        """
+        if len(inputs) != len(self.parameters):
+            raise ValueError(f"Expected {len(self.parameters)} input arrays, but got {len(inputs)}.")
+        if self.api_methods and api is None:
+            raise ValueError(f"The program calls {', '.join(sorted(self.api_methods))} on the API, so it needs an `api`.")
+        lengths = {len(values) for values in inputs}
+        if len(lengths) > 1:
+            raise ValueError("All input arrays must have the same length.")
+        size = lengths.pop() if lengths else 1
+        if not self.uses_numpy:
+            return self.function(api, size, *inputs)
+        np: Any = _numpy()
+        arrays = [np.asarray(values, dtype=np.float64) for values in inputs]
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            return self.function(api, size, *arrays)
+
+def numeric_literals(p: Program) -> list[JsonPath]:
+    """The paths of every number literal in a program, in order, as candidates for parameters."""
+    return [path for path, value in _literals(p.get("@steps"), ("@steps",)) if _is_number(value)]
+
+def vectorize_program(p: Program, parameters: Sequence[JsonPath] = (), use_numpy: bool | None = None) -> Result[VectorizedProgram]:
+    """
+    Compiles a `math_api` program to evaluate over arrays of values for the number literals at `parameters`.
+    Uses NumPy if `use_numpy` is true, or by default if it is installed.
+    """
+    compiled = compile_program(p)
+    if isinstance(compiled, Failure):
+        return compiled
+    if use_numpy is None:
+        use_numpy = numpy_available()
+    elif use_numpy and not numpy_available():
+        return Failure("NumPy is not installed.")
+    steps: list[Any] = cast(list[Any], p["@steps"])
+    if not steps:
+        return Failure("The program has no steps to evaluate.")
+    literals = dict(_literals(steps, ("@steps",)))
+    for path in parameters:
+        if not _is_number(literals.get(path)):
+            return Failure(f"{format_path(path)}: Expected a number literal to make a parameter.")
+    generator = _Generator(steps, {path: i for i, path in enumerate(parameters)}, use_numpy)
+    try:
+        source = generator.generate()
+    except _VectorizeError as err:
+        return Failure(str(err))
+    namespace: dict[str, Any] = {"_constants": generator.constants, "_np": _numpy(), "_elementwise": _elementwise}
+    exec(compile(source, "<vectorized math program>", "exec"), namespace)
+    return Success(VectorizedProgram(
+        parameters=tuple(parameters),
+        uses_numpy=use_numpy,
+        source=source,
+        api_methods=frozenset(generator.api_methods),
+        function=namespace["evaluate"],
+    ))
+
+class _VectorizeError(Exception):
+    def __init__(self, path: JsonPath, message: str):
+        super().__init__(f"{format_path(path)}: {message}")
+
+def _is_number(value: Any) -> bool:
+    return type(value) is int or type(value) is float
+
+def _literals(expr: Any, path: JsonPath) -> Iterator[tuple[JsonPath, Any]]:
+    if isinstance(expr, dict):
+        if "@ref" in expr:
+            return
+        for key, value in cast(dict[str, Any], expr).items():
+            if key != "@func":
+                yield from _literals(value, path + (key,))
+    elif isinstance(expr, list):
+        for i, item in enumerate(cast(list[Any], expr)):
+            yield from _literals(item, path + (i,))
+    else:
+        yield path, expr
+
+def _elementwise(method: Callable[..., Any], size: int, *args: Any) -> Any:
+    """Calls an API method once per index of its arguments, some of which are arrays."""
+    np: Any = _numpy()
+    columns = [np.broadcast_to(arg, (size,)) if isinstance(arg, np.ndarray) else [arg] * size for arg in args]
+    return np.fromiter(map(method, *columns), dtype=np.float64, count=size)
+
+class _Generator:
+    def __init__(self, steps: list[Any], parameters: dict[JsonPath, int], use_numpy: bool):
+        super().__init__()
+        self.steps = steps
+        self.parameters = parameters
+        self.use_numpy = use_numpy
+        self.constants: list[Any] = []
+        self.api_methods: set[str] = set()
+        # Which steps' values depend on a parameter.
+        self.varying: dict[int, bool] = {}
+        # Assignments of the values that do not depend on the parameters, computed once before any loop.
+        self.once: list[str] = []
+        self.num_hoisted = 0
+
+    def generate(self) -> str:
+        needed = self._needed_steps()
+        per_index: list[str] = []
+        for i in sorted(needed):
+            code, varying = self._expression(self.steps[i], ("@steps", i))
+            self.varying[i] = varying
+            (per_index if varying else self.once).append(f"s{i} = {code}")
+        last = len(self.steps) - 1
+        inputs = [f"p{i}" for i in range(len(self.parameters))]
+        lines = [f"def evaluate(api, size{''.join(', ' + name for name in inputs)}):"]
+        lines += [f"    m_{name} = api.{name}" for name in sorted(self.api_methods)]
+        lines += [f"    {line}" for line in self.once]
+        if self.use_numpy:
+            lines += [f"    {line}" for line in per_index]
+            lines.append(f"    return _np.broadcast_to(_np.asarray(s{last}, dtype=_np.float64), (size,)).copy()")
+        elif not self.varying[last]:
+            lines.append(f"    return [s{last}] * size")
+        else:
+            loop_names = ", ".join(f"x{i}" for i in range(len(inputs)))
+            source = f"zip({', '.join(inputs)})" if len(inputs) > 1 else inputs[0]
+            lines += [
+                "    results = []",
+                "    append = results.append",
+                f"    for {loop_names} in {source}:",
+            ]
+            lines += [f"        {line}" for line in per_index]
+            lines.append(f"        append(s{last})")
+            lines.append("    return results")
+        return "\n".join(lines) + "\n"
+
+    def _needed_steps(self) -> set[int]:
+        """
+        The steps the last step depends on, and those calling the API or able to raise (whose effects are
+        kept).
+        """
+        needed: set[int] = set()
+        pending = [len(self.steps) - 1]
+        pending += [
+            i for i, call in enumerate(self.steps)
+            if any(self._is_api_call(c) or c["@func"] in _raising_operators for c in _calls(call))
+        ]
+        while pending:
+            i = pending.pop()
+            if i not in needed:
+                needed.add(i)
+                pending.extend(_refs(self.steps[i]))
+        return needed
+
+    @staticmethod
+    def _is_api_call(call: Any) -> bool:
+        return call["@func"] not in _operators
+
+    def _expression(self, expr: Any, path: JsonPath) -> tuple[str, bool]:
+        """Python source for `expr`, and whether its value depends on a parameter."""
+        if path in self.parameters:
+            index = self.parameters[path]
+            return (f"p{index}" if self.use_numpy else f"x{index}"), True
+        if isinstance(expr, dict):
+            expr = cast(dict[str, Any], expr)
+            if "@ref" in expr:
+                ref: int = expr["@ref"]
+                return f"s{ref}", self.varying[ref]
+            if "@func" in expr:
+                return self._call(expr, path)
+        if isinstance(expr, (int, float)) and not isinstance(expr, bool) and math.isfinite(expr):
+            return repr(expr), False
+        if isinstance(expr, (int, float, str)) or expr is None:
+            self.constants.append(expr)
+            return f"_constants[{len(self.constants) - 1}]", False
+        raise _VectorizeError(path, f"Cannot evaluate a value of type {type(expr).__name__}.")
+
+    def _call(self, call: dict[str, Any], path: JsonPath) -> tuple[str, bool]:
+        func = call["@func"]
+        method = getattr(math_api.API, func, None)
+        if not func.isidentifier() or func.startswith("_") or not inspect.isfunction(method):
+            raise _VectorizeError(path, f"'{func}' is not a method of the API.")
+        args: list[Any] = call.get("@args") or []
+        kwargs: dict[str, Any] = call.get("@kwargs") or {}
+        codes: list[tuple[str, bool]] = [self._expression(arg, path + ("@args", i)) for i, arg in enumerate(args)]
+        keyword_codes = {name: self._expression(value, path + ("@kwargs", name)) for name, value in kwargs.items()}
+        try:
+            bound = inspect.signature(method).bind(None, *codes, **keyword_codes)
+        except TypeError as err:
+            raise _VectorizeError(path, f"Cannot call '{func}' with these arguments: {err}.")
+        arguments: list[tuple[str, bool]] = list(bound.arguments.values())[1:]
+        varying = any(is_varying for _, is_varying in arguments)
+        if func in _operators:
+            code = _operators[func].format(*(code for code, _ in arguments))
+        else:
+            self.api_methods.add(func)
+            argument_list = ", ".join(code for code, _ in arguments)
+            if self.use_numpy and varying:
+                code = f"_elementwise(m_{func}, size, {argument_list})"
+            else:
+                code = f"m_{func}({argument_list})"
+        if not varying and len(path) > 2:
+            # A nested call that does not depend on the parameters is hoisted out of the loop.
+            name = f"h{self.num_hoisted}"
+            self.num_hoisted += 1
+            self.once.append(f"{name} = {code}")
+            return name, False
+        return code, varying
+
+def _calls(expr: Any) -> Iterator[Any]:
+    if isinstance(expr, dict):
+        if "@ref" in expr:
+            return
+        if "@func" in expr:
+            yield expr
+        for key, value in cast(dict[str, Any], expr).items():
+            if key != "@func":
+                yield from _calls(value)
+    elif isinstance(expr, list):
+        for item in cast(list[Any], expr):
+            yield from _calls(item)
+
+def _refs(expr: Any) -> Iterator[int]:
+    if isinstance(expr, dict):
+        if "@ref" in expr:
+            yield expr["@ref"]
+            return
+        for value in cast(dict[str, Any], expr).values():
+            yield from _refs(value)
+    elif isinstance(expr, list):
+        for item in cast(list[Any], expr):
+            yield from _refs(item)
@@ -0,0 +1,162 @@
+import bisect
+import threading
+from typing import Any
+from typing_extensions import override
+
+from schema_checker import Coercion
+from typechat import Failure, Result, Success, TranslationObserver, count_tokens
+
+# Upper bounds of the latency histogram's buckets, in seconds: ten per decade (each about 26% wider than the
+# last) from 10us to 100s, which covers everything from a memoized native validation to a slow model call.
+_bucket_bounds: tuple[float, ...] = tuple(10.0 ** (exponent / 10) for exponent in range(-50, 21))
+
+class LatencyHistogram:
+    """A fixed-bucket latency histogram. Not thread-safe on its own; `TranslationMetrics` locks around it."""
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self) -> None:
+        super().__init__()
+        # The last bucket counts everything above the largest bound.
+        self.counts = [0] * (len(_bucket_bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(_bucket_bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction: float) -> float:
+        """The upper bound of the bucket holding the given fraction (0-1) of samples, capped at the maximum seen."""
+        if self.count == 0:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                return min(_bucket_bounds[i], self.max) if i < len(_bucket_bounds) else self.max
+        return self.max
+
+    def summary(self) -> dict[str, float | int]:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 4) if self.count else 0.0,
+            "p50_ms": round(self.percentile(0.50) * 1000, 4),
+            "p95_ms": round(self.percentile(0.95) * 1000, 4),
+            "p99_ms": round(self.percentile(0.99) * 1000, 4),
+            "max_ms": round(self.max * 1000, 4),
+        }
+
+class TranslationMetrics(TranslationObserver):
+    """
+    Aggregates counters and latency histograms over every translation it observes. Attach it as a
+    translator's `observer`, and read the aggregate with `snapshot()`.
+
+    Only characters are counted by default: pass `count_tokens=True` to also count tokens with `count_tokens`,
+    which is exact only if tiktoken is installed and runs on the calling thread for every model call.
+    """
+    def __init__(self, count_tokens: bool = False):
+        super().__init__()
+        self._count_tokens = count_tokens
+        self._lock = threading.Lock()
+        self.counters: dict[str, int] = {}
+        self.latencies: dict[str, LatencyHistogram] = {}
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters = dict.fromkeys((
+                "translations",
+                "succeeded",
+                "failed",
+                "cache_hits",
+                "model_calls",
+                "model_failures",
+                "validations",
+                "validation_failures",
+                "extraction_failures",
+                "repairs",
+                "repaired_translations",
+                "local_repairs",
+                "local_repairs_succeeded",
+                "coercions",
+                "prompt_chars",
+                "response_chars",
+                "prompt_tokens",
+                "response_tokens",
+            ), 0)
+            self.latencies = {
+                stage: LatencyHistogram()
+                for stage in ("translation", "prompt_build", "model_call", "extraction", "validation")
+            }
+
+    def snapshot(self) -> dict[str, Any]:
+        """The metrics so far, as JSON-serializable values."""
+        with self._lock:
+            counters = dict(self.counters)
+            translations = counters["translations"]
+            return {
+                "counters": counters,
+                "repair_rate": round(counters["repaired_translations"] / translations, 4) if translations else 0.0,
+                "cache_hit_rate": round(counters["cache_hits"] / translations, 4) if translations else 0.0,
+                "latency": {stage: histogram.summary() for stage, histogram in self.latencies.items()},
+            }
+
+    def _add(self, **counts: int) -> None:
+        with self._lock:
+            for name, count in counts.items():
+                self.counters[name] += count
+
+    def _record(self, stage: str, seconds: float, **counts: int) -> None:
+        with self._lock:
+            self.latencies[stage].record(seconds)
+            for name, count in counts.items():
+                self.counters[name] += count
+
+    @override
+    def on_translation_end(self, request: str, result: Result[Any], seconds: float) -> None:
+        succeeded = isinstance(result, Success)
+        self._record("translation", seconds, translations=1, succeeded=int(succeeded), failed=int(not succeeded))
+
+    @override
+    def on_cache_hit(self, request: str) -> None:
+        self._add(cache_hits=1)
+
+    @override
+    def on_prompt_built(self, prompt: str, seconds: float) -> None:
+        self._record("prompt_build", seconds)
+
+    @override
+    def on_model_call_end(self, prompt: str, response: Result[str] | str, seconds: float) -> None:
+        text = response if isinstance(response, str) else response.value if isinstance(response, Success) else ""
+        self._record(
+            "model_call",
+            seconds,
+            model_calls=1,
+            model_failures=int(isinstance(response, Failure)),
+            prompt_chars=len(prompt),
+            response_chars=len(text),
+            prompt_tokens=count_tokens(prompt) if self._count_tokens else 0,
+            response_tokens=count_tokens(text) if self._count_tokens and text else 0,
+        )
+
+    @override
+    def on_extraction(self, response: str, json_text: str | None, seconds: float) -> None:
+        self._record("extraction", seconds, extraction_failures=int(json_text is None))
+
+    @override
+    def on_validation_end(self, json_text: str, result: Result[Any], seconds: float) -> None:
+        self._record("validation", seconds, validations=1, validation_failures=int(isinstance(result, Failure)))
+
+    @override
+    def on_local_repair(self, json_text: str, coercions: list[Coercion], result: Result[Any]) -> None:
+        self._add(local_repairs=1, local_repairs_succeeded=int(isinstance(result, Success)), coercions=len(coercions))
+
+    @override
+    def on_repair_attempt(self, attempt: int, error_message: str) -> None:
+        # Attempts are numbered from 1 within each translation, so the first one marks a repaired translation.
+        self._add(repairs=1, repaired_translations=int(attempt == 1))
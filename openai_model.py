@@ -0,0 +1,248 @@
+from dataclasses import dataclass, field
+import http.client
+import json
+import queue
+import random
+import threading
+import time
+from typing import Any, Literal, cast
+import urllib.parse
+from typing_extensions import override
+
+from schema_export import OutputFormat
+from typechat import Failure, Result, StructuredModel, Success
+
+# A model for OpenAI-compatible chat completion APIs, built on the standard library's HTTP client so that it
+# can keep connections alive between calls. Point `base_url` at a local server to test against a stub.
+
+class ConcurrencyLimiter:
+    """Bounds how many model requests are in flight at once, across every model that shares it."""
+
+    def __init__(self, max_concurrent: int):
+        super().__init__()
+        if max_concurrent < 1:
+            raise ValueError("A concurrency limiter must allow at least one request.")
+        self.max_concurrent = max_concurrent
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+
+    def __enter__(self) -> None:
+        self._semaphore.acquire()
+
+    def __exit__(self, *exc_info: object) -> None:
+        self._semaphore.release()
+
+# Shared by every model that is not given a limiter of its own, so all translators in a process stay
+# within one limit.
+default_limiter = ConcurrencyLimiter(16)
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    max_retries: int = 4
+    # Retries wait a random time between zero and `base_delay * 2**attempt` ("full jitter"), capped at
+    # `max_delay`, unless the server says how long to wait with a Retry-After header.
+    base_delay: float = 0.5
+    max_delay: float = 30.0
+    retry_statuses: frozenset[int] = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+    def delay(self, attempt: int, retry_after: float | None = None) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+class ConnectionPool:
+    """Keeps up to `max_idle` keep-alive connections to one host for reuse. Safe to share between threads."""
+
+    def __init__(self, base_url: str, timeout: float = 60.0, max_idle: int = 8):
+        super().__init__()
+        url = urllib.parse.urlsplit(base_url)
+        if url.scheme not in ("http", "https") or not url.hostname:
+            raise ValueError(f"Expected an http or https URL, but got '{base_url}'.")
+        self.is_https = url.scheme == "https"
+        self.host = url.hostname
+        self.port = url.port
+        self.path_prefix = url.path.rstrip("/")
+        self.timeout = timeout
+        self._idle: queue.LifoQueue[http.client.HTTPConnection] = queue.LifoQueue(max_idle)
+
+    def request(self, method: str, path: str, body: bytes, headers: dict[str, str]) -> tuple[int, http.client.HTTPMessage, bytes]:
+        """Sends a request and returns its status, headers and body. Raises OSError or HTTPException on failure."""
+        connection, reused = self._acquire()
+        try:
+            try:
+                response = self._send(connection, method, path, body, headers)
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                if not reused:
+                    raise
+                # The server closed the idle connection; that is not a failure of the request.
+                connection.close()
+                connection = self._connect()
+                response = self._send(connection, method, path, body, headers)
+        except BaseException:
+            connection.close()
+            raise
+        status, response_headers, data, will_close = response
+        if will_close:
+            connection.close()
+        else:
+            self._release(connection)
+        return status, response_headers, data
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def _send(
+        self,
+        connection: http.client.HTTPConnection,
+        method: str,
+        path: str,
+        body: bytes,
+        headers: dict[str, str],
+    ) -> tuple[int, http.client.HTTPMessage, bytes, bool]:
+        connection.request(method, f"{self.path_prefix}{path}", body, headers)
+        response = connection.getresponse()
+        return response.status, response.headers, response.read(), response.will_close
+
+    def _acquire(self) -> tuple[http.client.HTTPConnection, bool]:
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self._connect(), False
+
+    def _release(self, connection: http.client.HTTPConnection) -> None:
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def _connect(self) -> http.client.HTTPConnection:
+        if self.is_https:
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+@dataclass
+class OpenAIModel(StructuredModel):
+    """
+    Calls an OpenAI-compatible chat completion API over pooled keep-alive connections, retrying rate limits
+    and transient failures with jittered exponential backoff. Requests are bounded by `limiter`, which is
+    `default_limiter` unless given.
+
+    Structured completions send the output format's JSON Schema as the `response_format`, or, for servers
+    that support grammar-constrained decoding instead (like llama.cpp's), its grammar as `grammar`. If the
+    server rejects that as unsupported, the model falls back to plain completions from then on.
+    """
+    model_name: str
+    api_key: str = field(repr=False)
+    base_url: str = "https://api.openai.com/v1"
+    # Seconds to wait for connecting and for each read from the server.
+    timeout: float = 60.0
+    temperature: float = 0.0
+    max_idle_connections: int = 8
+    retry: RetryPolicy = field(default_factory=RetryPolicy)
+    limiter: ConcurrencyLimiter | None = field(default=None, repr=False, compare=False)
+    output_constraint: Literal["json_schema", "grammar"] = "json_schema"
+
+    def __post_init__(self):
+        self._pool = ConnectionPool(self.base_url, self.timeout, self.max_idle_connections)
+        # Set once the server has rejected `output_constraint` as unsupported.
+        self._constraint_unsupported = False
+
+    @override
+    def complete(self, input: str) -> Result[str]:
+        return self._chat(input, {})
+
+    @override
+    def complete_structured(self, input: str, output: OutputFormat) -> Result[str]:
+        if self._constraint_unsupported:
+            return self.complete(input)
+        if self.output_constraint == "grammar":
+            return self._chat(input, {"grammar": output.grammar})
+        # Not "strict": strict mode requires every property, and optional keys are common in schemas.
+        response_format = {"name": output.name, "schema": output.json_schema, "strict": False}
+        return self._chat(input, {"response_format": {"type": "json_schema", "json_schema": response_format}})
+
+    def _chat(self, input: str, options: dict[str, Any]) -> Result[str]:
+        body = self._request_body(input, options)
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+        limiter = self.limiter or default_limiter
+        attempt = 0
+        while True:
+            retry_after: float | None = None
+            unsupported = False
+            with limiter:
+                try:
+                    status, response_headers, data = self._pool.request("POST", "/chat/completions", body, headers)
+                except (OSError, http.client.HTTPException) as err:
+                    error = f"Request to {self.base_url} failed: {str(err) or type(err).__name__}"
+                    retryable = True
+                else:
+                    if status == 200:
+                        return _parse_completion(data)
+                    error = f"Request to {self.base_url} failed with status {status}: {_error_message(data)}"
+                    retryable = status in self.retry.retry_statuses
+                    retry_after = _parse_retry_after(response_headers.get("Retry-After"))
+                    unsupported = status == 400 and _rejects_options(data, options)
+            if unsupported:
+                # The endpoint cannot constrain its output; the translator validates the plain completion anyway.
+                # The plain request starts with a fresh budget of retries.
+                self._constraint_unsupported = True
+                options = {}
+                body = self._request_body(input, options)
+                attempt = 0
+                continue
+            if not retryable or attempt >= self.retry.max_retries:
+                return Failure(error)
+            # Back off without holding a slot in the limiter.
+            time.sleep(self.retry.delay(attempt, retry_after))
+            attempt += 1
+
+    def close(self) -> None:
+        self._pool.close()
+
+    def _request_body(self, input: str, options: dict[str, Any]) -> bytes:
+        return json.dumps({
+            "model": self.model_name,
+            "messages": [{"role": "user", "content": input}],
+            "temperature": self.temperature,
+            **options,
+        }).encode()
+
+def _parse_completion(data: bytes) -> Result[str]:
+    try:
+        response = json.loads(data)
+        content = response["choices"][0]["message"]["content"]
+    except (ValueError, KeyError, IndexError, TypeError) as err:
+        return Failure(f"Unexpected response from the model ({type(err).__name__}: {err}): {data[:200]!r}")
+    if not isinstance(content, str):
+        return Failure("The model's response did not contain any text.")
+    return Success(content)
+
+def _error_message(data: bytes) -> str:
+    try:
+        error: Any = cast(dict[str, Any], json.loads(data))["error"]
+        if isinstance(error, dict):
+            error = cast(dict[str, Any], error)["message"]
+        return str(error)
+    except (ValueError, KeyError, TypeError):
+        return data[:200].decode(errors="replace")
+
+def _rejects_options(data: bytes, options: dict[str, Any]) -> bool:
+    """Whether an error response says the server does not support one of the request's `options`."""
+    message = _error_message(data).lower()
+    # OpenAI names the `response_format` type in its error rather than the option itself.
+    names = [*options, "json_schema"] if "response_format" in options else list(options)
+    return any(name in message for name in names) and any(
+        phrase in message for phrase in ("support", "unrecognized", "unknown", "unexpected", "not allowed"))
+
+def _parse_retry_after(value: str | None) -> float | None:
+    # Only the delay-seconds form; an HTTP date falls back to the backoff schedule.
+    try:
+        return max(float(value), 0.0) if value is not None else None
+    except ValueError:
+        return None
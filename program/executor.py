@@ -0,0 +1,242 @@
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Any, Callable, Iterable, TypeVar, cast
+
+from program.schema import Expression, FunctionCall, Program
+from typechat import Failure, Result, Success
+
+# Executes `@steps` programs against a concrete implementation of an API (for example, a class
+# implementing `math_api.API`).
+#
+# A program is compiled once into a flat list of instructions over numbered registers: one register per
+# step, followed by temporaries holding the results of nested calls. Each argument is compiled into an
+# operand - a function from the register file to the argument's value - so running a compiled program does
+# no matching on the JSON structure at all.
+
+Operand = Callable[[list[Any]], Any]
+
+@dataclass(frozen=True)
+class Instruction:
+    # Register the call's result is stored in.
+    target: int
+    func: str
+    args: tuple[Operand, ...]
+    kwargs: tuple[tuple[str, Operand], ...]
+    # Registers the arguments read from.
+    reads: frozenset[int]
+    # Index of the step in "@steps", or None for a call nested in another call's arguments.
+    step: int | None
+
+@dataclass(frozen=True)
+class CompiledProgram:
+    instructions: tuple[Instruction, ...]
+    num_registers: int
+    result_register: int | None
+    # Names of every API method the program calls.
+    functions: frozenset[str]
+
+    def run(self, api: Any) -> Any:
+        """Runs the program against `api` and returns the result of its last step."""
+        methods = {name: getattr(api, name) for name in self.functions}
+        registers: list[Any] = [None] * self.num_registers
+        for instruction in self.instructions:
+            args = [arg(registers) for arg in instruction.args]
+            kwargs = {name: kwarg(registers) for name, kwarg in instruction.kwargs}
+            registers[instruction.target] = methods[instruction.func](*args, **kwargs)
+        return None if self.result_register is None else registers[self.result_register]
+
+    def run_many(self, apis: Iterable[Any]) -> list[Any]:
+        """Runs the program once against each of `apis`, e.g. one per input data set."""
+        return [self.run(api) for api in apis]
+
+    def run_parallel(self, api: Any, executor: Executor | None = None, max_workers: int | None = None) -> Any:
+        """
+        Runs the program against `api`, running calls that do not depend on each other concurrently on
+        `executor` (or on a new thread pool of `max_workers` threads).
+
+        A call depends on every call whose result it reads through a `@ref` or a nested call. Methods marked
+        with `in_place` change what they read, so they also run after every preceding call reading the same
+        objects, and before every following one. Methods marked with `not_parallel_safe` act as barriers: they
+        run alone, after every preceding call has finished and before any following call starts. The result is
+        the same as `run`'s, though if a call raises, calls independent of it may already have run.
+        """
+        if executor is None:
+            with ThreadPoolExecutor(max_workers) as own_executor:
+                return self.run_parallel(api, own_executor)
+
+        methods = {name: getattr(api, name) for name in self.functions}
+        dependencies = [set(deps) for deps in self._dependencies]
+        barrier: int | None = None
+        # Registers that may hold the same object, as sets identified by one of their registers: an in-place
+        # call's result is the object it changed. Which arguments it changes is not known, so all of them count.
+        aliases = list(range(self.num_registers))
+        def alias_set(register: int) -> int:
+            while aliases[register] != register:
+                aliases[register] = aliases[aliases[register]]
+                register = aliases[register]
+            return register
+        last_change: dict[int, int] = {}
+        readers: dict[int, list[int]] = {}
+        for i, instruction in enumerate(self.instructions):
+            if barrier is not None:
+                dependencies[i].add(barrier)
+            if not is_parallel_safe(methods[instruction.func]):
+                dependencies[i].update(range(i))
+                barrier = i
+            read_sets = {alias_set(register) for register in instruction.reads}
+            dependencies[i].update(last_change[read_set] for read_set in read_sets if read_set in last_change)
+            if is_in_place(methods[instruction.func]):
+                target_set = alias_set(instruction.target)
+                for read_set in read_sets:
+                    dependencies[i].update(readers.pop(read_set, ()))
+                    last_change.pop(read_set, None)
+                    aliases[read_set] = target_set
+                last_change[target_set] = i
+                readers[target_set] = []
+            else:
+                for read_set in read_sets:
+                    readers.setdefault(read_set, []).append(i)
+
+        dependents: list[list[int]] = [[] for _ in self.instructions]
+        for i, deps in enumerate(dependencies):
+            for dep in deps:
+                dependents[dep].append(i)
+        remaining = [len(deps) for deps in dependencies]
+        registers: list[Any] = [None] * self.num_registers
+
+        def call(instruction: Instruction) -> Any:
+            args = [arg(registers) for arg in instruction.args]
+            kwargs = {name: kwarg(registers) for name, kwarg in instruction.kwargs}
+            return methods[instruction.func](*args, **kwargs)
+
+        running: dict[Future[Any], int] = {}
+        def start(i: int):
+            running[executor.submit(call, self.instructions[i])] = i
+
+        for i, count in enumerate(remaining):
+            if count == 0:
+                start(i)
+        try:
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i = running.pop(future)
+                    registers[self.instructions[i].target] = future.result()
+                    for dependent in dependents[i]:
+                        remaining[dependent] -= 1
+                        if remaining[dependent] == 0:
+                            start(dependent)
+        finally:
+            for future in running:
+                future.cancel()
+        return None if self.result_register is None else registers[self.result_register]
+
+    @cached_property
+    def _dependencies(self) -> list[frozenset[int]]:
+        """For each instruction, the indices of the instructions producing the registers it reads."""
+        producers = {instruction.target: i for i, instruction in enumerate(self.instructions)}
+        return [frozenset(producers[register] for register in instruction.reads) for instruction in self.instructions]
+
+_parallel_safe_attribute = "__typechat_parallel_safe__"
+_in_place_attribute = "__typechat_in_place__"
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+def not_parallel_safe(method: F) -> F:
+    """Marks an API method that must not run concurrently with any other call, e.g. because it writes files."""
+    setattr(method, _parallel_safe_attribute, False)
+    return method
+
+def is_parallel_safe(method: Callable[..., Any]) -> bool:
+    return getattr(method, _parallel_safe_attribute, True)
+
+def in_place(method: F) -> F:
+    """Marks an API method that changes its arguments (like `csv_api.API.set_column`) and may return one of them."""
+    setattr(method, _in_place_attribute, True)
+    return method
+
+def is_in_place(method: Callable[..., Any]) -> bool:
+    return getattr(method, _in_place_attribute, False)
+
+class ProgramError(Exception):
+    def __init__(self, path: str, message: str):
+        super().__init__(f"{path}: {message}")
+
+def compile_program(p: Program) -> Result[CompiledProgram]:
+    steps = p["@steps"]
+    compiler = _ProgramCompiler(len(steps))
+    try:
+        for i, call in enumerate(steps):
+            compiler.compile_call(cast(Any, call), i, f'$["@steps"][{i}]', target=i)
+    except ProgramError as err:
+        return Failure(str(err))
+    return Success(CompiledProgram(
+        instructions=tuple(compiler.instructions),
+        num_registers=compiler.num_registers,
+        result_register=len(steps) - 1 if steps else None,
+        functions=frozenset(instruction.func for instruction in compiler.instructions),
+    ))
+
+class _ProgramCompiler:
+    def __init__(self, num_steps: int):
+        super().__init__()
+        self.instructions: list[Instruction] = []
+        # Temporaries for nested calls are numbered after the registers of the steps.
+        self.num_registers = num_steps
+
+    def compile_call(self, call: Any, step: int, path: str, target: int | None = None) -> int:
+        """Emits the instructions for `call` (nested calls first) and returns the register holding its result."""
+        if not isinstance(call, dict) or not isinstance(cast(dict[str, Any], call).get("@func"), str):
+            raise ProgramError(path, "Expected a function call with a '@func' name.")
+        call = cast(FunctionCall, call)
+        reads: set[int] = set()
+        args: list[Operand] = []
+        for i, arg in enumerate(call.get("@args") or []):
+            args.append(self.compile_expression(arg, step, f'{path}["@args"][{i}]', reads))
+        kwargs: list[tuple[str, Operand]] = []
+        call_kwargs: dict[str, Expression] = call.get("@kwargs") or {}
+        for name, kwarg in call_kwargs.items():
+            kwargs.append((name, self.compile_expression(kwarg, step, f'{path}["@kwargs"]["{name}"]', reads)))
+
+        is_step = target is not None
+        if target is None:
+            target = self.num_registers
+            self.num_registers += 1
+        self.instructions.append(Instruction(
+            target=target,
+            func=call["@func"],
+            args=tuple(args),
+            kwargs=tuple(kwargs),
+            reads=frozenset(reads),
+            step=step if is_step else None,
+        ))
+        return target
+
+    def compile_expression(self, expr: Expression, step: int, path: str, reads: set[int]) -> Operand:
+        # Matches in the same order as `expr_to_text`, so programs run the way they were type-checked.
+        match expr:
+            case { "@ref": bool() }:
+                raise ProgramError(path, "A '@ref' must be an integer step index.")
+            case { "@ref": int(index) }:
+                if not 0 <= index < step:
+                    raise ProgramError(path, f"'@ref' {index} does not refer to a preceding step.")
+                reads.add(index)
+                return lambda registers: registers[index]
+            case { "@ref": _ }:
+                raise ProgramError(path, "A '@ref' must be an integer step index.")
+            case { "@func": _ }:
+                register = self.compile_call(expr, step, path)
+                reads.add(register)
+                return lambda registers: registers[register]
+            case list():
+                items = [self.compile_expression(item, step, f"{path}[{i}]", reads) for i, item in enumerate(expr)]
+                # Containers are rebuilt on every run so an API that mutates its arguments cannot change the program.
+                return lambda registers: [item(registers) for item in items]
+            case dict():
+                entries = [(key, self.compile_expression(value, step, f'{path}["{key}"]', reads)) for key, value in expr.items()]
+                return lambda registers: {key: value(registers) for key, value in entries}
+            case bool() | int() | float() | str() | None:
+                return lambda registers: expr
+            case _:
+                raise ProgramError(path, f"Unexpected value of type {type(expr).__name__}.")
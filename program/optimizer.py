@@ -0,0 +1,410 @@
+from collections import Counter
+import copy
+from dataclasses import dataclass
+import itertools
+from typing import Any, Callable, Iterator, cast
+
+from program.executor import compile_program
+from program.schema import FunctionCall, Program
+from typechat import Failure, Result, Success
+
+# Rewrites `@steps` programs into equivalent ones that make fewer API calls, before they are run:
+#
+# - Common-subexpression elimination: a call identical to an earlier step, reading tables nothing has
+#   changed since, reuses that step's result instead of being made again.
+# - Dead-step elimination: steps the final step does not depend on are dropped, unless they have effects
+#   of their own (like writing a file).
+# - Fusion: rules declared per API replace a call, and the call computing one of its arguments, with one
+#   call.
+#
+# What the optimizer may assume about each API method is declared in `OptimizationRules`; methods it is told
+# nothing about are never removed, merged or moved. The optimized program returns the same result, and has
+# the same effects, as the original whenever the original runs without raising. It may raise less often,
+# for instance when a dropped step would have raised.
+
+@dataclass(frozen=True)
+class Fusion:
+    """
+    Fuses a call to `outer` whose positional argument `argument` is computed by a call to `inner`. `fuse` is
+    given both calls and returns the call replacing them, or None if these two cannot be fused. Arguments of
+    `inner` the replacement does not use are dropped, so `fuse` is only given an `inner` whose nested calls are
+    all pure.
+    """
+    outer: str
+    inner: str
+    argument: int
+    fuse: Callable[[FunctionCall, FunctionCall], FunctionCall | None]
+
+@dataclass(frozen=True)
+class OptimizationRules:
+    """What the optimizer may assume about the methods of an API."""
+    # Methods without effects, that neither change their arguments nor return one of them. Their results depend
+    # only on their arguments (and on state only `effects` methods change, like the files `read_csv` reads).
+    pure: frozenset[str] = frozenset()
+    # Methods that change their first argument in place and return it, like `csv_api.API.set_column`, and
+    # neither change nor keep a reference to their other arguments.
+    in_place: frozenset[str] = frozenset()
+    # Methods with effects outside the program, like writing a file, that do not change their arguments.
+    effects: frozenset[str] = frozenset()
+    fusions: tuple[Fusion, ...] = ()
+
+def optimize_program(p: Program, rules: OptimizationRules) -> Result[Program]:
+    """
+    Returns an equivalent program that makes fewer API calls, or a Failure if `p` is not a well-formed
+    program. `p` itself is not changed.
+    """
+    compiled = compile_program(p)
+    if isinstance(compiled, Failure):
+        return compiled
+    steps: list[Any] = copy.deepcopy(cast(list[Any], p["@steps"]))
+    if steps:
+        _eliminate_common_calls(steps, rules)
+        _eliminate_dead_steps(steps, rules)
+        _fuse_calls(steps, rules)
+        _eliminate_dead_steps(steps, rules)
+    optimized: Program = {"@steps": _renumber(steps)}
+    return Success(optimized)
+
+# A removed step is left as None until the steps are renumbered, so `@ref`s keep their meaning.
+_Steps = list[Any]
+
+def _is_ref(expr: Any) -> bool:
+    return isinstance(expr, dict) and "@ref" in expr
+
+def _is_call(expr: Any) -> bool:
+    return isinstance(expr, dict) and "@ref" not in expr and "@func" in expr
+
+def _arguments(call: Any) -> list[Any]:
+    args: list[Any] = call.get("@args") or []
+    kwargs: dict[str, Any] = call.get("@kwargs") or {}
+    return [*args, *kwargs.values()]
+
+def _calls(expr: Any) -> Iterator[Any]:
+    """Every call in `expr`, including `expr` itself."""
+    if _is_ref(expr):
+        return
+    if _is_call(expr):
+        yield expr
+        for arg in _arguments(expr):
+            yield from _calls(arg)
+    elif isinstance(expr, list):
+        for item in cast(list[Any], expr):
+            yield from _calls(item)
+    elif isinstance(expr, dict):
+        for value in cast(dict[str, Any], expr).values():
+            yield from _calls(value)
+
+def _refs(expr: Any) -> Iterator[int]:
+    """The step indices of every `@ref` in `expr`, including those in nested calls."""
+    if _is_ref(expr):
+        yield expr["@ref"]
+    elif _is_call(expr):
+        for arg in _arguments(expr):
+            yield from _refs(arg)
+    elif isinstance(expr, list):
+        for item in cast(list[Any], expr):
+            yield from _refs(item)
+    elif isinstance(expr, dict):
+        for value in cast(dict[str, Any], expr).values():
+            yield from _refs(value)
+
+def _map_refs(expr: Any, index: Callable[[int], int]) -> Any:
+    if _is_ref(expr):
+        return {**expr, "@ref": index(expr["@ref"])}
+    if isinstance(expr, list):
+        return [_map_refs(item, index) for item in cast(list[Any], expr)]
+    if isinstance(expr, dict):
+        return {key: _map_refs(value, index) for key, value in cast(dict[str, Any], expr).items()}
+    return expr
+
+class _Analysis:
+    """
+    Which tables each step reads and changes. Results that may be the same object - a step that changes its
+    first argument in place and returns it, and that argument - share a class; every other result gets a
+    class of its own.
+    """
+
+    def __init__(self, steps: _Steps, rules: OptimizationRules):
+        super().__init__()
+        self.rules = rules
+        self.step_class: dict[int, int] = {}
+        # Classes each step reads through `@ref`s, and changes.
+        self.reads: dict[int, set[int]] = {}
+        self.changes: dict[int, set[int]] = {}
+        # Whether each step has effects outside the program, or calls a method not described by the rules.
+        self.has_effects: dict[int, bool] = {}
+        # Classes changed by any step.
+        self.changed: set[int] = set()
+        self.uses: Counter[int] = Counter()
+        self._ids = itertools.count()
+        for j, call in enumerate(steps):
+            if call is None:
+                continue
+            self.reads[j] = set()
+            self.changes[j] = set()
+            self.has_effects[j] = False
+            self.step_class[j] = self._visit(call, j)
+            self.changed |= self.changes[j]
+
+    def class_of(self, expr: Any) -> int | None:
+        """The class of a `@ref`, or of an in-place call on one; None for anything else."""
+        if _is_ref(expr):
+            return self.step_class.get(expr["@ref"])
+        if _is_call(expr) and expr["@func"] in self.rules.in_place and expr.get("@args"):
+            return self.class_of(expr["@args"][0])
+        return None
+
+    def is_pure(self, expr: Any) -> bool:
+        return all(call["@func"] in self.rules.pure for call in _calls(expr))
+
+    def _visit(self, expr: Any, step: int) -> int:
+        if _is_ref(expr):
+            index = expr["@ref"]
+            self.uses[index] += 1
+            self.reads[step].add(self.step_class[index])
+            return self.step_class[index]
+        if _is_call(expr):
+            args: list[Any] = expr.get("@args") or []
+            kwargs: dict[str, Any] = expr.get("@kwargs") or {}
+            classes = [self._visit(arg, step) for arg in args]
+            for value in kwargs.values():
+                self._visit(value, step)
+            func = expr["@func"]
+            if func in self.rules.in_place and args:
+                self.changes[step].add(classes[0])
+                return classes[0]
+            if func not in self.rules.pure:
+                self.has_effects[step] = True
+                if func not in self.rules.effects:
+                    # Nothing is known about this method, so it may change any table it is given.
+                    self.changes[step] |= self.reads[step]
+        elif isinstance(expr, list):
+            for item in cast(list[Any], expr):
+                self._visit(item, step)
+        elif isinstance(expr, dict):
+            for value in cast(dict[str, Any], expr).values():
+                self._visit(value, step)
+        return next(self._ids)
+
+def _eliminate_common_calls(steps: _Steps, rules: OptimizationRules) -> None:
+    """
+    Replaces pure calls identical to an earlier step by a `@ref` to it. Calls are identical if they have the
+    same name and arguments, and no table they read has changed since the earlier step. Results that are
+    changed in place, or passed to a call that may change them, are never shared.
+    """
+    analysis = _Analysis(steps, rules)
+    # Steps replaced by an earlier identical one.
+    replaced_by: dict[int, int] = {}
+    # How often each class has been changed so far.
+    versions: Counter[int] = Counter()
+    # The steps computed so far that can be shared, by key.
+    available: dict[Any, int] = {}
+
+    def rewrite(expr: Any, changed: bool, step: bool = False) -> tuple[Any, Any]:
+        """
+        Rewrites `expr` in evaluation order, returning it and a key identifying its value, or None if it is
+        not pure. `changed` says whether the call `expr` is passed to may change it.
+        """
+        if _is_ref(expr):
+            ref: int = expr["@ref"]
+            index = replaced_by.get(ref, ref)
+            # Steps of the same class hold the same object.
+            value_class = analysis.step_class[index]
+            return {**expr, "@ref": index}, ("@ref", value_class, versions[value_class])
+        if _is_call(expr):
+            func = expr["@func"]
+            # Without a first positional argument, there is no telling what an in-place method changes.
+            in_place = func in rules.in_place and bool(expr.get("@args"))
+            known = in_place or func in rules.pure or func in rules.effects
+            call = dict(expr)
+            keys: list[Any] = []
+            if "@args" in expr:
+                new_args: list[Any] = []
+                call["@args"] = new_args
+                for i, arg in enumerate(expr["@args"]):
+                    arg, key = rewrite(arg, (in_place and i == 0) or not known)
+                    new_args.append(arg)
+                    keys.append(key)
+            if "@kwargs" in expr:
+                call["@kwargs"] = {}
+                for name, value in expr["@kwargs"].items():
+                    value, key = rewrite(value, not known)
+                    call["@kwargs"][name] = value
+                    keys.append(None if key is None else (name, key))
+            if in_place:
+                target = analysis.class_of(call["@args"][0])
+                if target is not None:
+                    versions[target] += 1
+            elif not in_place and func not in rules.pure:
+                # Effects outside the program may change what any call returns.
+                available.clear()
+            if func not in rules.pure or None in keys:
+                return call, None
+            key = ("@func", func, tuple(keys))
+            if not step and not changed and key in available:
+                return {"@ref": available[key]}, key
+            return call, key
+        if isinstance(expr, list):
+            items = [rewrite(item, changed) for item in cast(list[Any], expr)]
+            item_keys = tuple(key for _, key in items)
+            return [item for item, _ in items], None if None in item_keys else ("list", item_keys)
+        if isinstance(expr, dict):
+            entries = {name: rewrite(value, changed) for name, value in cast(dict[str, Any], expr).items()}
+            pairs = tuple((name, key) for name, (_, key) in entries.items())
+            key = None if any(key is None for _, key in pairs) else ("dict", pairs)
+            return {name: value for name, (value, _) in entries.items()}, key
+        return expr, (type(expr).__name__, expr)
+
+    last = len(steps) - 1
+    for j, call in enumerate(steps):
+        if call is None:
+            continue
+        steps[j], key = rewrite(call, False, step=True)
+        if key is None or j == last or analysis.step_class[j] in analysis.changed:
+            continue
+        if key in available:
+            replaced_by[j] = available[key]
+            steps[j] = None
+        else:
+            available[key] = j
+
+def _eliminate_dead_steps(steps: _Steps, rules: OptimizationRules) -> None:
+    """
+    Removes the steps the last step does not depend on: those whose results are not used, whose changes
+    (if they change a table in place) are not seen by any later step that is kept, and that have no effects.
+    """
+    analysis = _Analysis(steps, rules)
+    last = max(j for j, call in enumerate(steps) if call is not None)
+    used: set[int] = set()
+    # Classes read by the steps kept so far, or returned by the program.
+    needed: set[int] = {analysis.step_class[last]}
+    for j in range(last, -1, -1):
+        if steps[j] is None:
+            continue
+        if j == last or j in used or analysis.has_effects[j] or analysis.changes[j] & needed:
+            used.update(_refs(steps[j]))
+            needed |= analysis.reads[j]
+        else:
+            steps[j] = None
+
+def _fuse_calls(steps: _Steps, rules: OptimizationRules) -> None:
+    """Applies the rules' fusions to every call, innermost first."""
+    if not rules.fusions:
+        return
+    analysis = _Analysis(steps, rules)
+    fused_any = False
+
+    def fuse(call: Any, step: int | None) -> Any:
+        """Fuses the calls nested in `call`, then `call` itself; `step` is its index if it is a step's call."""
+        nonlocal analysis, fused_any
+        call = dict(call)
+        if "@args" in call:
+            call["@args"] = [_map_calls(arg, lambda nested: fuse(nested, None)) for arg in call["@args"]]
+        if "@kwargs" in call:
+            call["@kwargs"] = {name: _map_calls(value, lambda nested: fuse(nested, None)) for name, value in call["@kwargs"].items()}
+        fused = True
+        while fused:
+            fused = False
+            for fusion in rules.fusions:
+                args: list[Any] = call.get("@args") or []
+                if call["@func"] != fusion.outer or len(args) <= fusion.argument:
+                    continue
+                kwargs: dict[str, Any] = call.get("@kwargs") or {}
+                # Calls among the other arguments would run before the inner call, where they ran after.
+                others = [*args[:fusion.argument], *args[fusion.argument + 1:], *kwargs.values()]
+                if any(True for other in others for _ in _calls(other)):
+                    continue
+                arg = args[fusion.argument]
+                producer = _producer(steps, analysis, arg, step)
+                if producer is None or producer["@func"] != fusion.inner or not all(
+                    analysis.is_pure(inner_arg) for inner_arg in _arguments(producer)
+                ):
+                    continue
+                replacement = fusion.fuse(call, producer)
+                if replacement is None:
+                    continue
+                call = replacement
+                if _is_ref(arg):
+                    steps[arg["@ref"]] = None
+                    if step is not None:
+                        steps[step] = call
+                    analysis = _Analysis(steps, rules)
+                fused = fused_any = True
+        return call
+
+    for j, call in enumerate(steps):
+        if call is not None:
+            steps[j] = fuse(call, j)
+            if fused_any:
+                analysis = _Analysis(steps, rules)
+                fused_any = False
+
+def _producer(steps: _Steps, analysis: _Analysis, arg: Any, step: int | None) -> Any:
+    """
+    The call computing `arg` if it can be moved into the call `arg` is passed to: a nested call, or the call
+    of a step used only there, provided nothing between the two could tell the difference.
+    """
+    if _is_call(arg):
+        return arg
+    if not _is_ref(arg) or step is None:
+        return None
+    index = arg["@ref"]
+    if analysis.uses[index] != 1:
+        return None
+    moved = analysis.step_class[index]
+    for i in range(index + 1, step):
+        if steps[i] is None:
+            continue
+        if analysis.has_effects[i] or analysis.changes[i] or moved in analysis.reads[i]:
+            return None
+    return steps[index]
+
+def _map_calls(expr: Any, function: Callable[[Any], Any]) -> Any:
+    """Applies `function` to the outermost calls in `expr`."""
+    if _is_ref(expr):
+        return expr
+    if _is_call(expr):
+        return function(expr)
+    if isinstance(expr, list):
+        return [_map_calls(item, function) for item in cast(list[Any], expr)]
+    if isinstance(expr, dict):
+        return {key: _map_calls(value, function) for key, value in cast(dict[str, Any], expr).items()}
+    return expr
+
+def _renumber(steps: _Steps) -> list[Any]:
+    indices: dict[int, int] = {}
+    for j, call in enumerate(steps):
+        if call is not None:
+            indices[j] = len(indices)
+    return [_map_refs(call, indices.__getitem__) for call in steps if call is not None]
+
+def _double_negation(outer: FunctionCall, inner: FunctionCall) -> FunctionCall | None:
+    args: list[Any] = inner.get("@args") or []
+    if len(args) != 1 or inner.get("@kwargs") or outer.get("@kwargs"):
+        return None
+    return {"@func": "id", "@args": args}
+
+def _overwritten_column(outer: FunctionCall, inner: FunctionCall) -> FunctionCall | None:
+    # Setting a column twice keeps only the second value (and the column's position from the first).
+    outer_args: list[Any] = outer.get("@args") or []
+    inner_args: list[Any] = inner.get("@args") or []
+    if len(outer_args) != 3 or len(inner_args) != 3 or outer.get("@kwargs") or inner.get("@kwargs"):
+        return None
+    name = outer_args[1]
+    if not isinstance(name, str) or name != inner_args[1]:
+        return None
+    return {"@func": "set_column", "@args": [inner_args[0], name, outer_args[2]]}
+
+math_api_rules = OptimizationRules(
+    pure=frozenset({"add", "sub", "mul", "div", "pow", "neg", "id"}),
+    fusions=(Fusion("neg", "neg", 0, _double_negation),),
+)
+
+csv_api_rules = OptimizationRules(
+    pure=frozenset({
+        "read_csv", "get_column_names", "get_column", "equals", "not_equals", "group_by", "numeric_map", "str_map",
+    }),
+    in_place=frozenset({"set_column", "remove_column", "add_row", "remove_rows_by_index", "drop_rows", "keep_rows"}),
+    effects=frozenset({"write_csv"}),
+    fusions=(Fusion("set_column", "set_column", 0, _overwritten_column),),
+)
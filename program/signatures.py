@@ -0,0 +1,41 @@
+from functools import lru_cache
+import inspect
+import typing
+from typing import Any
+
+from schema_checker import load_schema
+from translation_cache import schema_hash
+
+# Reads the methods of an API Protocol (like `math_api.API`) from its schema source: the calls a program
+# may make, and the arguments each one takes.
+
+@lru_cache(maxsize=32)
+def api_signatures(schema: str, class_name: str = "API") -> dict[str, tuple[inspect.Signature, ...]]:
+    """
+    Maps each public method of the schema's `class_name` to its signatures, without `self`, in the order the
+    methods are defined. An overloaded method has one signature per overload. Raises KeyError if the schema
+    does not define `class_name`.
+    """
+    # Overloads are registered by module and qualified name, so every schema gets a module name of its own.
+    module_name = f"typechat_api_{schema_hash(schema)[:16]}"
+    namespace = load_schema(schema, module_name)
+    cls: type = namespace[class_name]
+    signatures: dict[str, tuple[inspect.Signature, ...]] = {}
+    for name, member in vars(cls).items():
+        if name.startswith("_") or not inspect.isfunction(member):
+            continue
+        # An overloaded method's attribute is a placeholder, so the overloads are looked up by name.
+        overloads = typing.get_overloads(_stand_in(module_name, f"{cls.__qualname__}.{name}")) or [member]
+        signatures[name] = tuple(_without_self(inspect.signature(overload)) for overload in overloads)
+    return signatures
+
+def _stand_in(module_name: str, qualname: str) -> Any:
+    def stand_in() -> None:
+        pass
+    stand_in.__module__ = module_name
+    stand_in.__qualname__ = qualname
+    return stand_in
+
+def _without_self(signature: inspect.Signature) -> inspect.Signature:
+    parameters = list(signature.parameters.values())
+    return signature.replace(parameters=parameters[1:])
@@ -0,0 +1,108 @@
+import inspect
+from typing import Any, Mapping, cast
+
+from schema_checker import CheckError, JsonPath
+
+# Checks the structure of `@steps` programs against the signatures of an API's methods (see
+# `program.signatures`), without type-checking them: every step must be a call naming a method of the API,
+# with arguments one of the method's signatures can bind, and every `@ref` must refer to a preceding step.
+# A program with any of these errors cannot pass mypy, so checking them first spares the checker every
+# program it would reject for its shape alone, and reports the errors by their JSON paths.
+#
+# Expressions are matched in the same order as the renderer and `program.executor` match them.
+
+Signatures = Mapping[str, tuple[inspect.Signature, ...]]
+
+def check_program_structure(p: Any, signatures: Signatures) -> list[CheckError]:
+    """Returns the program's structural errors, or an empty list if its calls and references are well formed."""
+    steps = cast(dict[str, Any], p).get("@steps") if isinstance(p, dict) else None
+    if not isinstance(steps, list):
+        return [CheckError((), "The program does not have a '@steps' list.")]
+    checker = _StructureChecker(signatures)
+    for i, call in enumerate(cast(list[Any], steps)):
+        checker.check_call(call, i, ("@steps", i))
+    return checker.errors
+
+def functions_along(p: Any, path: JsonPath) -> list[str]:
+    """The names of the calls enclosing `path`, outermost first, for finding the methods an error involves."""
+    names: list[str] = []
+    value = p
+    for part in path:
+        names.extend(_call_names(value))
+        try:
+            value = value[part]
+        except (KeyError, IndexError, TypeError):
+            break
+    else:
+        names.extend(_call_names(value))
+    return names
+
+def _call_names(value: Any) -> list[str]:
+    """The name `value` calls if it is a function call, as a list of zero or one names."""
+    func = cast(dict[str, Any], value).get("@func") if isinstance(value, dict) and "@ref" not in value else None
+    return [func] if isinstance(func, str) else []
+
+class _StructureChecker:
+    def __init__(self, signatures: Signatures):
+        super().__init__()
+        self.signatures = signatures
+        self.errors: list[CheckError] = []
+
+    def check_call(self, call: Any, step: int, path: JsonPath) -> None:
+        if not isinstance(call, dict) or not isinstance(cast(dict[str, Any], call).get("@func"), str):
+            self.errors.append(CheckError(path, "Expected a function call with a '@func' name."))
+            return
+        call = cast(dict[str, Any], call)
+        args = call.get("@args", [])
+        kwargs = call.get("@kwargs", {})
+        if not isinstance(args, list):
+            self.errors.append(CheckError(path + ("@args",), "Expected '@args' to be a list."))
+            args = []
+        if not isinstance(kwargs, dict):
+            self.errors.append(CheckError(path + ("@kwargs",), "Expected '@kwargs' to be an object."))
+            kwargs = {}
+        args = cast(list[Any], args)
+        kwargs = cast(dict[str, Any], kwargs)
+        for i, arg in enumerate(args):
+            self.check_expression(arg, step, path + ("@args", i))
+        for name, value in kwargs.items():
+            self.check_expression(value, step, path + ("@kwargs", name))
+
+        func: str = call["@func"]
+        overloads = self.signatures.get(func)
+        if overloads is None:
+            methods = ", ".join(self.signatures)
+            self.errors.append(CheckError(path + ("@func",), f"'{func}' is not a method of the API, whose methods are: {methods}."))
+            return
+        reasons: list[str] = []
+        for signature in overloads:
+            try:
+                signature.bind(*args, **kwargs)
+                return
+            except TypeError as err:
+                reasons.append(str(err))
+        if len(overloads) == 1:
+            message = f"Cannot call '{func}' with these arguments: {reasons[0]}."
+        else:
+            message = f"No overload of '{func}' accepts these arguments: {'; '.join(dict.fromkeys(reasons))}."
+        self.errors.append(CheckError(path, message))
+
+    def check_expression(self, expr: Any, step: int, path: JsonPath) -> None:
+        match expr:
+            case { "@ref": bool() }:
+                self.errors.append(CheckError(path, "A '@ref' must be an integer step index."))
+            case { "@ref": int(index) }:
+                if not 0 <= index < step:
+                    self.errors.append(CheckError(path, f"'@ref' {index} does not refer to a preceding step."))
+            case { "@ref": _ }:
+                self.errors.append(CheckError(path, "A '@ref' must be an integer step index."))
+            case { "@func": _ }:
+                self.check_call(expr, step, path)
+            case list():
+                for i, item in enumerate(cast(list[Any], expr)):
+                    self.check_expression(item, step, path + (i,))
+            case dict():
+                for key, value in cast(dict[str, Any], expr).items():
+                    self.check_expression(value, step, path + (key,))
+            case _:
+                pass
@@ -0,0 +1,129 @@
+import io
+import json
+from json.encoder import encode_basestring_ascii
+from typing import Any, cast
+
+# Renders JSON values and programs as the Python source that is type-checked against a schema. Rendering
+# walks the value with an explicit stack and writes into a single buffer, so deeply nested values cannot
+# hit the recursion limit and wide ones build no intermediate lists or joined strings.
+#
+# The text is exactly what `expr_to_text` and `program_to_text` have always produced: strings and keys are
+# quoted like `json.dumps`, other scalars written with `str` (so `True`, `None` and `inf`), and in programs
+# `{"@ref": n}` becomes `STEP{n + 1}` and `{"@func": ...}` a call on `api`.
+
+# How a value on the stack is rendered.
+_VALUE = 0
+_PROGRAM_VALUE = 1
+_CALL = 2
+
+def render_expression(expr: Any, for_program: bool) -> str:
+    buffer = io.StringIO()
+    _render(expr, _PROGRAM_VALUE if for_program else _VALUE, buffer)
+    return buffer.getvalue()
+
+def render_call(call: Any) -> str:
+    buffer = io.StringIO()
+    _render(call, _CALL, buffer)
+    return buffer.getvalue()
+
+def render_program(program: Any) -> str:
+    buffer = io.StringIO()
+    steps: list[Any] = program["@steps"]
+    write = buffer.write
+    write("def fn(api: API):")
+    for i, call in enumerate(steps):
+        write(f"\n    STEP{i + 1} = ")
+        _render(call, _CALL, buffer)
+    write(f"\n    return STEP{len(steps)}")
+    return buffer.getvalue()
+
+def _is_call(expr: Any) -> bool:
+    return isinstance(expr, dict) and "@func" in expr and "@ref" not in expr
+
+def _render(root: Any, root_mode: int, buffer: io.StringIO) -> None:
+    write = buffer.write
+    # Entries are text to write, or a value to render as `(value, mode)`. Children are pushed in reverse, so
+    # they pop in order; strings and integers - most of any payload - are pushed already written as text.
+    stack: list[Any] = [(root, root_mode)]
+    push = stack.append
+    pop = stack.pop
+    while stack:
+        entry = pop()
+        if type(entry) is str:
+            write(entry)
+            continue
+        expr, mode = entry
+        if mode == _PROGRAM_VALUE and _is_call(expr):
+            mode = _CALL
+
+        if mode == _CALL:
+            write(f"api.{expr['@func']}(")
+            push(")")
+            # Pushed in reverse: keyword arguments, then positional ones.
+            pending_separator = False
+            kwargs: dict[str, Any] | None = expr["@kwargs"] if "@kwargs" in expr else None
+            if kwargs:
+                for k, v in reversed(kwargs.items()):
+                    if pending_separator:
+                        push(", ")
+                    push((v, _PROGRAM_VALUE))
+                    push(f"{k}=")
+                    pending_separator = True
+            args: list[Any] | None = expr["@args"] if "@args" in expr else None
+            if args:
+                args = args if type(args) is list else list(args)
+                for i in range(len(args) - 1, -1, -1):
+                    if pending_separator:
+                        push(", ")
+                    push((args[i], _PROGRAM_VALUE))
+                    pending_separator = True
+            continue
+
+        expr_type = expr.__class__
+        if expr_type is str:
+            write(encode_basestring_ascii(expr))
+        elif expr_type is int or expr_type is float or expr_type is bool or expr is None:
+            write(str(expr))
+        elif isinstance(expr, list):
+            items = cast(list[Any], expr)
+            write("[")
+            push("]")
+            for i in range(len(items) - 1, -1, -1):
+                item = items[i]
+                item_type = item.__class__
+                if item_type is str:
+                    push(encode_basestring_ascii(item))
+                elif item_type is int:
+                    push(str(item))
+                else:
+                    push((item, mode))
+                if i:
+                    push(", ")
+        elif isinstance(expr, dict):
+            members = cast(dict[Any, Any], expr)
+            if mode == _PROGRAM_VALUE and "@ref" in members:
+                index = members["@ref"]
+                write(f"STEP{index + 1}" if isinstance(index, int) else "NON_INTEGRAL_REF")
+            else:
+                write("{")
+                push("}")
+                first = True
+                for key, value in reversed(members.items()):
+                    if not first:
+                        push(", ")
+                    key_text = encode_basestring_ascii(key) if type(key) is str else json.dumps(key)
+                    value_type = value.__class__
+                    if value_type is str:
+                        push(f"{key_text}: {encode_basestring_ascii(value)}")
+                    elif value_type is int:
+                        push(f"{key_text}: {value}")
+                    else:
+                        push((value, mode))
+                        push(f"{key_text}: ")
+                    first = False
+        elif isinstance(expr, (bool, int, float)):
+            write(str(expr))
+        elif isinstance(expr, str):
+            write(json.dumps(expr))
+        else:
+            raise TypeError(f"Cannot render a value of type '{expr_type.__name__}'.")
@@ -0,0 +1,89 @@
+import ast
+from functools import lru_cache
+import re
+from typing import Iterable
+
+# Helpers for targeted repair prompts, which describe what is wrong with a response in as few tokens as
+# possible: checker output condensed to one line per problem, and only the parts of the schema those
+# problems involve.
+
+_mypy_line = re.compile(r"^.*?:\d+(?::\d+)?: (error|note): (.*?)(?:  \[[a-z-]+\])?$")
+_step_name = re.compile(r'"?\bSTEP(\d+)\b"?')
+_quoted_name = re.compile(r'"([A-Za-z_][A-Za-z0-9_]*)"')
+
+def condense_mypy_output(output: str, for_program: bool) -> list[str]:
+    """
+    Reduces mypy's output to its messages, without file names, line numbers, error codes or the summary.
+    Notes (like the list of overload variants) are kept, indented under their error. For programs, the
+    `STEPn` variables of the generated code are written as the `@ref`s they came from.
+    """
+    messages: list[str] = []
+    for line in output.splitlines():
+        match = _mypy_line.match(line)
+        if match is None:
+            continue
+        kind, message = match.groups()
+        if for_program:
+            message = _step_name.sub(lambda step: f'{{"@ref": {int(step[1]) - 1}}}', message)
+        messages.append(message if kind == "error" else f"  {message}")
+    return messages
+
+def quoted_names(messages: Iterable[str]) -> list[str]:
+    """The identifiers quoted in checker messages (like `"LatteDrink"` or `"add"`), in order of appearance."""
+    return list(dict.fromkeys(name for message in messages for name in _quoted_name.findall(message)))
+
+def schema_fragments(schema: str, names: Iterable[str], methods_of: str | None = None) -> str:
+    """
+    Returns the source of the schema's definitions of `names`, in the order they appear in the schema. With
+    `methods_of`, names may also refer to methods of that class (like `API`), which are listed under its
+    header rather than bringing in the whole class. Unknown names are ignored.
+    """
+    definitions = _schema_definitions(schema)
+    wanted: set[str] = set()
+    for name in names:
+        if methods_of is not None and f"{methods_of}.{name}" in definitions:
+            wanted.add(f"{methods_of}.{name}")
+        elif name in definitions and name != methods_of:
+            wanted.add(name)
+    fragments: list[str] = []
+    header_added = False
+    for name, source in definitions.items():
+        if name not in wanted:
+            continue
+        if methods_of is not None and name.startswith(f"{methods_of}.") and not header_added:
+            fragments.append(definitions[f"{methods_of}:header"])
+            header_added = True
+        fragments.append(source)
+    return "\n".join(fragments)
+
+@lru_cache(maxsize=32)
+def _schema_definitions(schema: str) -> dict[str, str]:
+    """Maps each top-level name the schema defines, and each `Class.method`, to its source, in source order."""
+    lines = schema.splitlines()
+    definitions: dict[str, str] = {}
+
+    def source_of(node: ast.stmt) -> str:
+        decorators: list[ast.expr] = getattr(node, "decorator_list", [])
+        start = min([node.lineno, *(decorator.lineno for decorator in decorators)])
+        return "\n".join(lines[start - 1:node.end_lineno])
+
+    try:
+        tree = ast.parse(schema)
+    except SyntaxError:
+        return definitions
+    for node in tree.body:
+        match node:
+            case ast.ClassDef(name=name):
+                definitions[name] = source_of(node)
+                definitions[f"{name}:header"] = lines[node.lineno - 1]
+                for member in node.body:
+                    if isinstance(member, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                        # Overloads share a name, so their sources are collected together.
+                        key = f"{name}.{member.name}"
+                        previous = definitions.get(key)
+                        definitions[key] = source_of(member) if previous is None else f"{previous}\n{source_of(member)}"
+            case ast.Assign(targets=[ast.Name(id=name)]) | ast.AnnAssign(target=ast.Name(id=name)):
+                definitions[name] = source_of(node)
+            case _:
+                pass
+    return definitions
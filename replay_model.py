@@ -0,0 +1,68 @@
+from dataclasses import dataclass, field
+from functools import lru_cache
+import json
+import time
+from typing_extensions import override
+
+from typechat import Failure, Model, Result, Success
+
+@dataclass
+class ReplayModel(Model):
+    """
+    A deterministic, local stand-in for a model that replays recorded responses.
+
+    `responses` maps each intent to the responses to give for it, in order: the first is returned for the
+    initial request, and each following one for a repair request that quotes the response before it. That
+    makes replays stateless, so the same corpus can be run any number of times or concurrently.
+    """
+    responses: dict[str, list[str]]
+    # Seconds to sleep per call, to simulate model latency.
+    latency: float = 0.0
+    model_name: str = "replay"
+    calls: int = field(default=0, init=False)
+
+    @staticmethod
+    def from_jsonl(path: str, latency: float = 0.0) -> "ReplayModel":
+        """Loads a corpus with one `{"intent": ..., "responses": [...]}` object per line."""
+        responses: dict[str, list[str]] = {}
+        with open(path, "r") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    responses[entry["intent"]] = entry["responses"]
+        return ReplayModel(responses, latency)
+
+    @override
+    def complete(self, input: str) -> Result[str]:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        intent = self._find_intent(input)
+        if intent is None:
+            return Failure("No recorded responses for this prompt.")
+        responses = self.responses[intent]
+        # A repair prompt quotes the response being repaired; answer with the one recorded after it.
+        for i in reversed(range(len(responses) - 1)):
+            if any(quoted in input for quoted in _quoted_forms(responses[i])):
+                return Success(responses[i + 1])
+        return Success(responses[0])
+
+    def _find_intent(self, prompt: str) -> str | None:
+        found: str | None = None
+        for intent in self.responses:
+            if f"'''\n{intent}\n'''" in prompt and (found is None or len(intent) > len(found)):
+                found = intent
+        return found
+
+@lru_cache(maxsize=1024)
+def _quoted_forms(response: str) -> tuple[str, ...]:
+    """The ways a repair prompt may quote `response`: verbatim, or as its JSON object written compactly."""
+    first_curly = response.find("{")
+    last_curly = response.rfind("}") + 1
+    try:
+        value = json.loads(response[first_curly:last_curly]) if 0 <= first_curly < last_curly else None
+    except ValueError:
+        value = None
+    if value is None:
+        return (response,)
+    return (response, json.dumps(value, separators=(",", ":")))
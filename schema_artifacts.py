@@ -0,0 +1,153 @@
+"""
+Builds and loads precompiled schema artifacts, so short-lived worker processes can skip compiling schemas and
+building prompts at startup.
+
+An artifact holds, for one schema module and type, the natively compiled schema (if the schema can be compiled)
+and the prompt prefixes the translators would build for it. Artifacts are keyed by the hash of the schema's
+source, so an artifact built from an older version of a schema is simply never used.
+
+Artifacts are pickles: only load artifacts you built yourself. Build them with
+
+    python -m schema_artifacts coffee_api:Cart math_api csv_api --output-dir build/schemas
+
+where `module:Type` builds an artifact for translating into `Type`, and a bare module name one for programs
+against the module's `API`. At startup, call `load_artifacts("build/schemas")`.
+"""
+
+import argparse
+from dataclasses import dataclass
+import os
+import pickle
+import sys
+from typing import Any, Literal, cast
+from typing_extensions import override
+
+from schema_checker import CompiledSchema, SchemaCompileError, compile_schema
+from schema_registry import SchemaRegistry
+from translation_cache import schema_hash
+from typechat import (Failure, Model, ProgramTranslator, ProgramValidator, Result, Success, TypedDictTranslator,
+                      TypedDictValidator, install_precompiled, program_schema)
+
+# Bump whenever prompts or the compiled schema's node classes change shape.
+_artifact_version = 1
+artifact_suffix = ".typechat-schema"
+
+ArtifactKind = Literal["typed_dict", "program"]
+
+@dataclass(frozen=True)
+class SchemaArtifact:
+    name: str
+    kind: ArtifactKind
+    type_name: str
+    schema_hash: str
+    # None for programs, and for schemas the native checker cannot compile.
+    compiled: CompiledSchema | None
+    # Keyed by the translator class each prefix was built by.
+    prompt_prefixes: dict[type, str]
+    # Program prompts include `program.schema`, so they are only valid for the same version of it.
+    program_schema_hash: str
+    version: int = _artifact_version
+
+class _NoModel(Model):
+    """Stands in for a model in translators that are only used to build prompts."""
+    @override
+    def complete(self, input: str) -> Result[str]:
+        return Failure("Schema artifacts are built without a model.")
+
+def build_artifact(name: str, schema: str, type_name: str | None = None) -> SchemaArtifact:
+    """Builds the artifact for schema `name` with source `schema`, for `type_name` or, if None, for programs."""
+    if type_name is None:
+        program_translator = ProgramTranslator(_NoModel(), ProgramValidator(schema))
+        return SchemaArtifact(
+            name=name,
+            kind="program",
+            type_name="API",
+            schema_hash=schema_hash(schema),
+            compiled=None,
+            prompt_prefixes={ProgramTranslator: program_translator._create_prompt_prefix()}, # pyright: ignore[reportPrivateUsage]
+            program_schema_hash=schema_hash(program_schema()),
+        )
+    try:
+        compiled = compile_schema(schema, type_name)
+    except SchemaCompileError:
+        compiled = None
+    translator = TypedDictTranslator(_NoModel(), TypedDictValidator[object](schema, type_name))
+    return SchemaArtifact(
+        name=name,
+        kind="typed_dict",
+        type_name=type_name,
+        schema_hash=schema_hash(schema),
+        compiled=compiled,
+        prompt_prefixes={TypedDictTranslator: translator._create_prompt_prefix()}, # pyright: ignore[reportPrivateUsage]
+        program_schema_hash=schema_hash(program_schema()),
+    )
+
+def artifact_path(directory: str, artifact: SchemaArtifact) -> str:
+    return os.path.join(directory, f"{artifact.name}.{artifact.type_name}{artifact_suffix}")
+
+def save_artifact(artifact: SchemaArtifact, path: str) -> None:
+    # The fields are stored rather than the artifact itself, which would pickle as `__main__.SchemaArtifact`
+    # when built from the command line. The file is written under another name first, so a worker starting
+    # up never reads a half-written artifact.
+    partial_path = f"{path}.partial"
+    with open(partial_path, "wb") as f:
+        pickle.dump(dict(vars(artifact)), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(partial_path, path)
+
+def load_artifact(path: str) -> Result[SchemaArtifact]:
+    try:
+        with open(path, "rb") as f:
+            fields = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, AttributeError, EOFError, ImportError) as err:
+        return Failure(f"Could not load schema artifact '{path}': {err}")
+    if not isinstance(fields, dict):
+        return Failure(f"'{path}' is not a schema artifact.")
+    version = cast(dict[str, Any], fields).get("version")
+    if version != _artifact_version:
+        return Failure(f"Schema artifact '{path}' has version {version}, but {_artifact_version} is required.")
+    return Success(SchemaArtifact(**cast(dict[str, Any], fields)))
+
+def install_artifact(artifact: SchemaArtifact) -> None:
+    """Makes validators and translators for the artifact's schema use its precompiled forms."""
+    prompt_prefixes = artifact.prompt_prefixes
+    if artifact.kind == "program" and artifact.program_schema_hash != schema_hash(program_schema()):
+        # The native schema is still usable, but the prompts quote an outdated program schema.
+        prompt_prefixes = {}
+    install_precompiled(artifact.schema_hash, artifact.type_name, artifact.compiled, prompt_prefixes)
+
+def load_artifacts(directory: str) -> Result[list[SchemaArtifact]]:
+    """Loads and installs every artifact in `directory`."""
+    artifacts: list[SchemaArtifact] = []
+    for file_name in sorted(os.listdir(directory)):
+        if not file_name.endswith(artifact_suffix):
+            continue
+        artifact = load_artifact(os.path.join(directory, file_name))
+        if isinstance(artifact, Failure):
+            return artifact
+        install_artifact(artifact.value)
+        artifacts.append(artifact.value)
+    return Success(artifacts)
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m schema_artifacts", description="Builds precompiled schema artifacts.")
+    parser.add_argument("schemas", nargs="+", help="'module:Type' for a TypedDict schema, or 'module' for programs")
+    parser.add_argument("--output-dir", default=".", help="directory to write artifacts to")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    registry = SchemaRegistry(max_schemas=len(args.schemas))
+    for spec in args.schemas:
+        name, _, type_name = spec.partition(":")
+        try:
+            entry = registry.load(name)
+        except (ModuleNotFoundError, OSError) as err:
+            print(f"{spec}: {err}", file=sys.stderr)
+            sys.exit(1)
+        artifact = build_artifact(name, entry.source, type_name or None)
+        path = artifact_path(args.output_dir, artifact)
+        save_artifact(artifact, path)
+        compiled = "native" if artifact.compiled is not None else "mypy"
+        print(f"{spec}: wrote {path} ({artifact.kind}, {compiled} validation)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,724 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+import collections.abc
+import json
+import re
+import types
+import typing
+from typing import Any, ClassVar, Literal, NotRequired, Required, Union, cast
+from typing_extensions import override
+
+# Compiles the Python type definitions used as TypeChat schemas (TypedDicts, Literals, Unions, lists, ...)
+# into a tree of checker nodes that validate parsed JSON values directly, without writing a source file
+# and round-tripping through mypy.
+#
+# Checker nodes deliberately hold no references to the Python types they were compiled from, so a
+# compiled schema can be pickled and loaded in another process.
+
+JsonPath = tuple[str | int, ...]
+
+class SchemaCompileError(Exception):
+    """Raised when a schema uses a construct the native checker does not understand."""
+
+@dataclass(frozen=True)
+class CheckError:
+    path: JsonPath
+    message: str
+
+    @override
+    def __str__(self) -> str:
+        return f"{format_path(self.path)}: {self.message}"
+
+def format_path(path: JsonPath) -> str:
+    parts = ["$"]
+    for part in path:
+        if isinstance(part, int):
+            parts.append(f"[{part}]")
+        elif part.isidentifier():
+            parts.append(f".{part}")
+        else:
+            parts.append(f"[{_quote(part)}]")
+    return "".join(parts)
+
+def _quote(value: Any) -> str:
+    if isinstance(value, str):
+        return f'"{value}"'
+    return repr(value)
+
+def json_type_name(value: Any) -> str:
+    match value:
+        case None:
+            return "None"
+        case bool():
+            return "bool"
+        case int():
+            return "int"
+        case float():
+            return "float"
+        case str():
+            return "str"
+        case list():
+            return "list"
+        case dict():
+            return "dict"
+        case _:
+            return type(value).__name__
+
+def _mismatch(expected: str, value: Any) -> str:
+    return f'Incompatible types (expression has type "{json_type_name(value)}", expected "{expected}")'
+
+class Node(ABC):
+    __slots__ = ()
+
+    @abstractmethod
+    def accepts(self, value: Any) -> bool:
+        """Returns whether `value` is valid, without collecting errors."""
+        ...
+
+    @abstractmethod
+    def check(self, value: Any, path: list[str | int], errors: list[CheckError]) -> None:
+        """Appends an error to `errors` for every problem found in `value`."""
+        ...
+
+    @abstractmethod
+    def describe(self) -> str:
+        ...
+
+class AnyNode(Node):
+    __slots__ = ()
+
+    @override
+    def accepts(self, value: Any) -> bool:
+        return True
+
+    @override
+    def check(self, value: Any, path: list[str | int], errors: list[CheckError]) -> None:
+        pass
+
+    @override
+    def describe(self) -> str:
+        return "Any"
+
+class ScalarNode(Node):
+    __slots__ = ("kind", "_types")
+
+    # Mirrors mypy's promotions: a bool is an int, and an int is a float.
+    _accepted_types: ClassVar[dict[str, tuple[type, ...]]] = {
+        "str": (str,),
+        "int": (int,),
+        "float": (int, float),
+        "bool": (bool,),
+        "None": (type(None),),
+    }
+
+    def __init__(self, kind: str):
+        super().__init__()
+        self.kind = kind
+        self._types = self._accepted_types[kind]
+
+    @override
+    def accepts(self, value: Any) -> bool:
+        return isinstance(value, self._types)
+
+    @override
+    def check(self, value: Any, path: list[str | int], errors: list[CheckError]) -> None:
+        if not isinstance(value, self._types):
+            errors.append(CheckError(tuple(path), _mismatch(self.kind, value)))
+
+    @override
+    def describe(self) -> str:
+        return self.kind
+
+class LiteralNode(Node):
+    __slots__ = ("values", "_lookup")
+
+    def __init__(self, values: tuple[Any, ...]):
+        super().__init__()
+        self.values = values
+        # Keyed by type as well as value so that `Literal[1]` does not accept `True`.
+        self._lookup: frozenset[tuple[type, Any]] = frozenset((v.__class__, v) for v in values)
+
+    @override
+    def accepts(self, value: Any) -> bool:
+        return isinstance(value, (str, int, float, type(None))) and (type(value), value) in self._lookup
+
+    @override
+    def check(self, value: Any, path: list[str | int], errors: list[CheckError]) -> None:
+        if not self.accepts(value):
+            if isinstance(value, (str, int, float, type(None))):
+                allowed = ", ".join(_quote(v) for v in self.values)
+                errors.append(CheckError(tuple(path), f"Value {_quote(value)} is not one of {allowed}"))
+            else:
+                errors.append(CheckError(tuple(path), _mismatch(self.describe(), value)))
+
+    @override
+    def describe(self) -> str:
+        return f"Literal[{', '.join(_quote(v) for v in self.values)}]"
+
+class ListNode(Node):
+    __slots__ = ("item",)
+
+    def __init__(self, item: Node):
+        super().__init__()
+        self.item = item
+
+    @override
+    def accepts(self, value: Any) -> bool:
+        if not isinstance(value, list):
+            return False
+        item = self.item
+        for element in cast(list[Any], value):
+            if not item.accepts(element):
+                return False
+        return True
+
+    @override
+    def check(self, value: Any, path: list[str | int], errors: list[CheckError]) -> None:
+        if not isinstance(value, list):
+            errors.append(CheckError(tuple(path), _mismatch(self.describe(), value)))
+            return
+        item = self.item
+        for i, element in enumerate(cast(list[Any], value)):
+            if not item.accepts(element):
+                path.append(i)
+                item.check(element, path, errors)
+                path.pop()
+
+    @override
+    def describe(self) -> str:
+        return f"list[{self.item.describe()}]"
+
+class DictNode(Node):
+    __slots__ = ("value",)
+
+    def __init__(self, value: Node):
+        super().__init__()
+        self.value = value
+
+    @override
+    def accepts(self, value: Any) -> bool:
+        if not isinstance(value, dict):
+            return False
+        value_node = self.value
+        for element in cast(dict[str, Any], value).values():
+            if not value_node.accepts(element):
+                return False
+        return True
+
+    @override
+    def check(self, value: Any, path: list[str | int], errors: list[CheckError]) -> None:
+        if not isinstance(value, dict):
+            errors.append(CheckError(tuple(path), _mismatch(self.describe(), value)))
+            return
+        value_node = self.value
+        for key, element in cast(dict[str, Any], value).items():
+            if not value_node.accepts(element):
+                path.append(key)
+                value_node.check(element, path, errors)
+                path.pop()
+
+    @override
+    def describe(self) -> str:
+        return f"dict[str, {self.value.describe()}]"
+
+class TypedDictNode(Node):
+    __slots__ = ("name", "fields", "required")
+
+    def __init__(self, name: str):
+        super().__init__()
+        self.name = name
+        self.fields: dict[str, Node] = {}
+        self.required: frozenset[str] = frozenset()
+
+    @override
+    def accepts(self, value: Any) -> bool:
+        if not isinstance(value, dict):
+            return False
+        obj = cast(dict[str, Any], value)
+        fields = self.fields
+        for key, element in obj.items():
+            node = fields.get(key)
+            if node is None or not node.accepts(element):
+                return False
+        for key in self.required:
+            if key not in obj:
+                return False
+        return True
+
+    @override
+    def check(self, value: Any, path: list[str | int], errors: list[CheckError]) -> None:
+        if not isinstance(value, dict):
+            errors.append(CheckError(tuple(path), _mismatch(self.name, value)))
+            return
+        obj = cast(dict[str, Any], value)
+        fields = self.fields
+        for key in self.fields:
+            if key in self.required and key not in obj:
+                errors.append(CheckError(tuple(path), f'Missing key "{key}" for TypedDict "{self.name}"'))
+        for key, element in obj.items():
+            node = fields.get(key)
+            if node is None:
+                errors.append(CheckError(tuple(path), f'Extra key "{key}" for TypedDict "{self.name}"'))
+            elif not node.accepts(element):
+                path.append(key)
+                node.check(element, path, errors)
+                path.pop()
+
+    @override
+    def describe(self) -> str:
+        return self.name
+
+class UnionNode(Node):
+    __slots__ = ("options", "alias", "discriminator", "_by_tag")
+
+    def __init__(self, options: tuple[Node, ...], alias: str | None = None):
+        super().__init__()
+        self.options = options
+        self.alias = alias
+        self.discriminator: str | None = None
+        self._by_tag: dict[Any, TypedDictNode] = {}
+
+    def find_discriminator(self) -> None:
+        """
+        Looks for a key that every option requires and that has a distinct `Literal` type in each option
+        (like `type` in `coffee_api`), so a value can be dispatched to a single option for checking and
+        error reporting. Must run after the options' fields are compiled.
+        """
+        if not self.options or not all(isinstance(o, TypedDictNode) for o in self.options):
+            return
+        options = cast(tuple[TypedDictNode, ...], self.options)
+        first = options[0]
+        for key in first.fields:
+            by_tag: dict[Any, TypedDictNode] = {}
+            for option in options:
+                node = option.fields.get(key)
+                if key not in option.required or not isinstance(node, LiteralNode):
+                    break
+                if any(tag in by_tag for tag in node.values):
+                    break
+                by_tag.update((tag, option) for tag in node.values)
+            else:
+                self.discriminator = key
+                self._by_tag = by_tag
+                return
+
+    def select(self, value: Any) -> Node | None:
+        """Returns the single option `value` is intended to match, if that can be determined."""
+        if self.discriminator is not None and isinstance(value, dict):
+            tag = cast(dict[str, Any], value).get(self.discriminator)
+            if isinstance(tag, (str, int, float, type(None))):
+                return self._by_tag.get(tag)
+        return None
+
+    @override
+    def accepts(self, value: Any) -> bool:
+        if self.discriminator is not None:
+            selected = self.select(value)
+            return selected is not None and selected.accepts(value)
+        for option in self.options:
+            if option.accepts(value):
+                return True
+        return False
+
+    @override
+    def check(self, value: Any, path: list[str | int], errors: list[CheckError]) -> None:
+        if self.accepts(value):
+            return
+        if self.discriminator is not None and isinstance(value, dict):
+            selected = self.select(value)
+            if selected is not None:
+                selected.check(value, path, errors)
+                return
+            tags = ", ".join(_quote(tag) for tag in self._by_tag)
+            tag = cast(dict[str, Any], value).get(self.discriminator)
+            if tag is None:
+                message = f'Missing key "{self.discriminator}"; expected one of {tags} to select among {self.describe()}'
+            else:
+                message = f'Value {_quote(tag)} for key "{self.discriminator}" is not one of {tags}'
+            errors.append(CheckError(tuple(path), message))
+            return
+
+        # Report the errors of whichever option came closest to matching.
+        best: list[CheckError] | None = None
+        for option in self.options:
+            if not _shallow_match(option, value):
+                continue
+            option_errors: list[CheckError] = []
+            option.check(value, path, option_errors)
+            if best is None or len(option_errors) < len(best):
+                best = option_errors
+        if best is None:
+            errors.append(CheckError(tuple(path), _mismatch(self.describe(), value)))
+        else:
+            errors.extend(best)
+
+    @override
+    def describe(self) -> str:
+        if self.alias is not None:
+            return self.alias
+        return " | ".join(option.describe() for option in self.options)
+
+def _shallow_match(node: Node, value: Any) -> bool:
+    match node:
+        case TypedDictNode() | DictNode():
+            return isinstance(value, dict)
+        case ListNode():
+            return isinstance(value, list)
+        case UnionNode():
+            return any(_shallow_match(option, value) for option in node.options)
+        case _DeferredNode():
+            return _shallow_match(node.target, value)
+        case _:
+            return False
+
+class _DeferredNode(Node):
+    """Stands in for a named type that is still being compiled, which is how recursive aliases are tied."""
+    __slots__ = ("name", "target")
+
+    def __init__(self, name: str):
+        super().__init__()
+        self.name = name
+        self.target: Node = AnyNode()
+
+    @override
+    def accepts(self, value: Any) -> bool:
+        return self.target.accepts(value)
+
+    @override
+    def check(self, value: Any, path: list[str | int], errors: list[CheckError]) -> None:
+        self.target.check(value, path, errors)
+
+    @override
+    def describe(self) -> str:
+        return self.name
+
+def alternatives(node: Node) -> list[Node]:
+    """Flattens unions (and references to named types) into the list of nodes a value may match."""
+    match node:
+        case UnionNode():
+            return [alternative for option in node.options for alternative in alternatives(option)]
+        case _DeferredNode():
+            return alternatives(node.target)
+        case _:
+            return [node]
+
+@dataclass(frozen=True)
+class CompiledSchema:
+    type_name: str
+    root: Node
+
+    def check(self, value: Any) -> list[CheckError]:
+        if self.root.accepts(value):
+            return []
+        errors: list[CheckError] = []
+        self.root.check(value, [], errors)
+        return errors
+
+    def coerce(self, value: Any) -> tuple[Any, list["Coercion"]]:
+        """
+        Applies safe, mechanical fixes to a value the schema rejects, and returns the fixed value (a copy; `value`
+        is not modified) with the fixes applied:
+
+        - a string that matches one of a Literal's strings up to case and whitespace becomes that string,
+        - a string holding an integer (or a number, for floats) becomes that number where one is expected,
+        - a missing or miscased discriminator of a union (like `type` in `coffee_api`) is filled in when
+          exactly one of the union's options fits the object's other keys.
+
+        The result is not guaranteed to be valid, and should be checked again.
+        """
+        coercions: list[Coercion] = []
+        return _coerce(self.root, value, [], coercions), coercions
+
+    def definitions_along(self, value: Any, path: JsonPath) -> list[str]:
+        """
+        Names the TypedDicts and aliased unions that `value` passes through from the root down to `path`,
+        outermost first - the definitions a reader needs to understand an error reported at `path`.
+        """
+        names: list[str] = []
+        node = self.root
+        for key in path:
+            node = _resolve(node, value, names)
+            if isinstance(node, TypedDictNode) and isinstance(key, str) and key in node.fields:
+                node = node.fields[key]
+            elif isinstance(node, ListNode) and isinstance(key, int):
+                node = node.item
+            elif isinstance(node, DictNode) and isinstance(key, str):
+                node = node.value
+            else:
+                return list(dict.fromkeys(names))
+            try:
+                value = value[key]
+            except (LookupError, TypeError):
+                value = None
+        _resolve(node, value, names)
+        return list(dict.fromkeys(names))
+
+def _resolve(node: Node, value: Any, names: list[str]) -> Node:
+    """Follows references and unions to the node `value` is checked against, recording the names passed."""
+    while True:
+        match node:
+            case _DeferredNode():
+                node = node.target
+            case UnionNode():
+                if node.alias is not None:
+                    names.append(node.alias)
+                selected = node.select(value)
+                if selected is None:
+                    candidates = [option for option in node.options if _shallow_match(option, value)]
+                    selected = next((option for option in candidates if option.accepts(value)), None)
+                    if selected is None and len(candidates) == 1:
+                        selected = candidates[0]
+                if selected is None:
+                    return node
+                node = selected
+            case TypedDictNode():
+                names.append(node.name)
+                return node
+            case _:
+                return node
+
+@dataclass(frozen=True)
+class Coercion:
+    path: JsonPath
+    original: Any
+    coerced: Any
+
+    @override
+    def __str__(self) -> str:
+        return f"{format_path(self.path)}: {json.dumps(self.original)} -> {json.dumps(self.coerced)}"
+
+_integer = re.compile(r"[+-]?\d+")
+_number = re.compile(r"[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?")
+
+def _normalize_literal(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+def _coerce(node: Node, value: Any, path: list[str | int], coercions: list[Coercion]) -> Any:
+    if node.accepts(value):
+        return value
+    match node:
+        case _DeferredNode():
+            return _coerce(node.target, value, path, coercions)
+        case LiteralNode() if isinstance(value, str):
+            normalized = _normalize_literal(value)
+            matches = [v for v in node.values if isinstance(v, str) and _normalize_literal(v) == normalized]
+            if len(matches) == 1:
+                coercions.append(Coercion(tuple(path), value, matches[0]))
+                return matches[0]
+        case ScalarNode(kind="int") if isinstance(value, str) and _integer.fullmatch(value.strip()):
+            coercions.append(Coercion(tuple(path), value, int(value)))
+            return int(value)
+        case ScalarNode(kind="float") if isinstance(value, str) and _number.fullmatch(value.strip()):
+            coerced = int(value) if _integer.fullmatch(value.strip()) else float(value)
+            coercions.append(Coercion(tuple(path), value, coerced))
+            return coerced
+        case ListNode() if isinstance(value, list):
+            items = cast(list[Any], value)
+            coerced_items: list[Any] = []
+            for i, item in enumerate(items):
+                path.append(i)
+                coerced_items.append(_coerce(node.item, item, path, coercions))
+                path.pop()
+            return coerced_items
+        case DictNode() if isinstance(value, dict):
+            entries = cast(dict[str, Any], value)
+            coerced_entries: dict[str, Any] = {}
+            for key, element in entries.items():
+                path.append(key)
+                coerced_entries[key] = _coerce(node.value, element, path, coercions)
+                path.pop()
+            return coerced_entries
+        case TypedDictNode() if isinstance(value, dict):
+            entries = cast(dict[str, Any], value)
+            coerced_entries = {}
+            for key, element in entries.items():
+                field = node.fields.get(key)
+                if field is None:
+                    coerced_entries[key] = element
+                    continue
+                path.append(key)
+                coerced_entries[key] = _coerce(field, element, path, coercions)
+                path.pop()
+            return coerced_entries
+        case UnionNode():
+            return _coerce_union(node, value, path, coercions)
+        case _:
+            pass
+    return value
+
+def coercible(node: Node, value: Any) -> bool:
+    """Whether `value` is accepted by `node`, or would be once `CompiledSchema.coerce` has applied its coercions."""
+    return node.accepts(value) or node.accepts(_coerce(node, value, [], []))
+
+def _coerce_union(node: UnionNode, value: Any, path: list[str | int], coercions: list[Coercion]) -> Any:
+    if node.discriminator is not None and isinstance(value, dict):
+        obj = cast(dict[str, Any], value)
+        key = node.discriminator
+        option = node.select(obj)
+        if option is None:
+            tag, option = _infer_tag(node, obj)
+            if option is None:
+                return obj
+            path.append(key)
+            coercions.append(Coercion(tuple(path), obj.get(key), tag))
+            path.pop()
+            retagged: dict[str, Any] = {key: tag}
+            retagged.update((k, v) for k, v in obj.items() if k != key)
+            obj = retagged
+        return _coerce(option, obj, path, coercions)
+
+    # Without a discriminator, take the first option the coerced value satisfies.
+    for option in node.options:
+        option_coercions: list[Coercion] = []
+        coerced = _coerce(option, value, path, option_coercions)
+        if option.accepts(coerced):
+            coercions.extend(option_coercions)
+            return coerced
+    return value
+
+def _infer_tag(node: UnionNode, obj: dict[str, Any]) -> tuple[Any, TypedDictNode | None]:
+    """Finds the discriminator value for an object whose own is missing or miscased."""
+    key = cast(str, node.discriminator)
+    tag = obj.get(key)
+    if isinstance(tag, str):
+        normalized = _normalize_literal(tag)
+        matches = [t for t in node._by_tag if isinstance(t, str) and _normalize_literal(t) == normalized] # pyright: ignore[reportPrivateUsage]
+        if len(matches) == 1:
+            return matches[0], node._by_tag[matches[0]] # pyright: ignore[reportPrivateUsage]
+    if key in obj:
+        return None, None
+    # Every other key must belong to the option, and every Literal-typed one must match it.
+    fits: list[tuple[Any, TypedDictNode]] = []
+    for candidate_tag, option in node._by_tag.items(): # pyright: ignore[reportPrivateUsage]
+        if all(k in option.fields and _literal_fits(option.fields[k], v) for k, v in obj.items()):
+            fits.append((candidate_tag, option))
+    if len(fits) == 1:
+        return fits[0]
+    return None, None
+
+def _literal_fits(node: Node, value: Any) -> bool:
+    """Whether `value` could be coerced to `node` if it is a Literal; other nodes are not considered."""
+    while isinstance(node, _DeferredNode):
+        node = node.target
+    if not isinstance(node, LiteralNode) or node.accepts(value):
+        return True
+    return isinstance(value, str) and any(
+        isinstance(v, str) and _normalize_literal(v) == _normalize_literal(value) for v in node.values
+    )
+
+def load_schema(schema: str, module_name: str = "typechat_schema") -> dict[str, Any]:
+    """
+    Executes schema source text and returns the resulting module namespace.
+    Schemas are trusted code - they are the same modules the application itself imports.
+    """
+    namespace: dict[str, Any] = {"__name__": module_name}
+    exec(compile(schema, f"<{module_name}>", "exec"), namespace)
+    return namespace
+
+def compile_schema(schema: str, type_name: str) -> CompiledSchema:
+    namespace = load_schema(schema)
+    if type_name not in namespace:
+        raise SchemaCompileError(f'The schema does not define "{type_name}".')
+    return compile_namespace(namespace, type_name)
+
+def compile_namespace(namespace: dict[str, Any], type_name: str) -> CompiledSchema:
+    compiler = _Compiler(namespace)
+    root = compiler.compile_named(type_name)
+    for union in compiler.unions:
+        union.find_discriminator()
+    return CompiledSchema(type_name, root)
+
+_scalar_kinds: dict[Any, str] = {
+    str: "str",
+    int: "int",
+    float: "float",
+    bool: "bool",
+    None: "None",
+    type(None): "None",
+}
+
+class _Compiler:
+    def __init__(self, namespace: dict[str, Any]):
+        super().__init__()
+        self.namespace = namespace
+        self.by_name: dict[str, Node] = {}
+        self.typed_dicts: dict[type, TypedDictNode] = {}
+        self.unions: list[UnionNode] = []
+        # Unions are described by their alias (e.g. "Product") rather than spelled out in error messages.
+        self.aliases: dict[Any, str] = {}
+        for name, value in namespace.items():
+            if typing.get_origin(value) in (Union, types.UnionType):
+                self.aliases.setdefault(value, name)
+
+    def compile_named(self, name: str) -> Node:
+        if name in self.by_name:
+            return self.by_name[name]
+        deferred = _DeferredNode(name)
+        self.by_name[name] = deferred
+        try:
+            tp = eval(name, self.namespace)
+        except Exception as err:
+            raise SchemaCompileError(f'Could not resolve the type "{name}": {err}') from err
+        node = self.compile(tp)
+        if isinstance(node, UnionNode) and node.alias is None:
+            node.alias = name
+        deferred.target = node
+        self.by_name[name] = node
+        return node
+
+    def compile(self, tp: Any) -> Node:
+        if isinstance(tp, str):
+            return self.compile_named(tp)
+        if isinstance(tp, typing.ForwardRef):
+            return self.compile_named(tp.__forward_arg__)
+        if tp is Any or tp is object:
+            return AnyNode()
+        if tp in _scalar_kinds:
+            return ScalarNode(_scalar_kinds[tp])
+        if typing.is_typeddict(tp):
+            return self.compile_typed_dict(cast(type, tp))
+
+        origin = typing.get_origin(tp)
+        args = typing.get_args(tp)
+        if origin is Literal:
+            return LiteralNode(args)
+        if origin is Union or origin is types.UnionType:
+            options = tuple(self.compile(arg) for arg in args)
+            union = UnionNode(options, self.aliases.get(tp))
+            self.unions.append(union)
+            return union
+        if origin in (list, collections.abc.Sequence, collections.abc.MutableSequence, collections.abc.Iterable):
+            return ListNode(self.compile(args[0]) if args else AnyNode())
+        if origin in (dict, collections.abc.Mapping, collections.abc.MutableMapping):
+            if args and args[0] is not str:
+                raise SchemaCompileError(f"Only dicts with str keys can be checked, not {tp!r}.")
+            return DictNode(self.compile(args[1]) if args else AnyNode())
+        if origin in (Required, NotRequired, typing.Annotated):
+            return self.compile(args[0])
+        if tp in (list, dict):
+            return ListNode(AnyNode()) if tp is list else DictNode(AnyNode())
+        raise SchemaCompileError(f"Unsupported type in schema: {tp!r}")
+
+    def compile_typed_dict(self, tp: type) -> TypedDictNode:
+        if tp in self.typed_dicts:
+            return self.typed_dicts[tp]
+        node = TypedDictNode(tp.__name__)
+        self.typed_dicts[tp] = node
+        try:
+            hints = typing.get_type_hints(tp, globalns=self.namespace, include_extras=True)
+        except Exception as err:
+            raise SchemaCompileError(f'Could not resolve the fields of "{tp.__name__}": {err}') from err
+        required_keys = cast(frozenset[str], getattr(tp, "__required_keys__", frozenset(hints)))
+        required: set[str] = set()
+        for key, hint in hints.items():
+            is_required = key in required_keys
+            origin = typing.get_origin(hint)
+            if origin is NotRequired:
+                is_required = False
+            elif origin is Required:
+                is_required = True
+            node.fields[key] = self.compile(hint)
+            if is_required:
+                required.add(key)
+        node.required = frozenset(required)
+        return node
@@ -0,0 +1,331 @@
+from dataclasses import dataclass
+import inspect
+import json
+import re
+from typing import Any, Mapping, Sequence
+
+from schema_checker import (AnyNode, CompiledSchema, DictNode, ListNode, LiteralNode, Node, ScalarNode, TypedDictNode,
+                            UnionNode, _DeferredNode) # pyright: ignore[reportPrivateUsage]
+
+# Exports a compiled schema - the same structure the native validator checks responses with - as a JSON
+# Schema and as a grammar (in the GBNF notation of llama.cpp and compatible servers), for models that can
+# constrain their output to either. Constrained output still goes through the validator: the JSON Schema
+# cannot say everything a TypedDict can (like mypy's promotion of int to float), and the grammar fixes the
+# order of keys.
+#
+# For programs, pass the API's signatures (see `program.signatures.api_signatures`) to narrow the program
+# schema's `FunctionCall` to the API's methods and the arguments each one accepts.
+
+ApiSignatures = Mapping[str, Sequence[inspect.Signature]]
+
+@dataclass(frozen=True)
+class OutputFormat:
+    """The structure a translator's responses must have, for models that support constrained output."""
+    name: str
+    json_schema: dict[str, Any]
+    grammar: str
+
+def output_format(compiled: CompiledSchema, api: ApiSignatures | None = None) -> OutputFormat:
+    return OutputFormat(compiled.type_name, json_schema(compiled, api), grammar(compiled, api))
+
+def json_schema(compiled: CompiledSchema, api: ApiSignatures | None = None) -> dict[str, Any]:
+    """A JSON Schema for the values `compiled` accepts. Named types become `$defs`, and the root type the document."""
+    return _JsonSchemaWriter(compiled.root, api).document()
+
+def grammar(compiled: CompiledSchema, api: ApiSignatures | None = None) -> str:
+    """A grammar for the JSON text of the values `compiled` accepts, starting from the `root` rule."""
+    return _GrammarWriter(compiled.root, api).document()
+
+def _named(node: Node) -> tuple[str | None, Node]:
+    """The name a node is defined under, if any, and the node that defines it."""
+    match node:
+        case _DeferredNode():
+            target = node.target
+            while isinstance(target, _DeferredNode):
+                target = target.target
+            return node.name, target
+        case TypedDictNode():
+            return node.name, node
+        case UnionNode(alias=str(alias)):
+            return alias, node
+        case _:
+            return None, node
+
+@dataclass(frozen=True)
+class _CallShape:
+    """What a method accepts, merged across its overloads. None means no limit."""
+    max_positional: int | None
+    keywords: frozenset[str] | None
+
+def _call_shape(signatures: Sequence[inspect.Signature]) -> _CallShape:
+    max_positional: int | None = 0
+    keywords: set[str] | None = set()
+    for signature in signatures:
+        positional = 0
+        for parameter in signature.parameters.values():
+            match parameter.kind:
+                case inspect.Parameter.POSITIONAL_ONLY:
+                    positional += 1
+                case inspect.Parameter.POSITIONAL_OR_KEYWORD:
+                    positional += 1
+                    if keywords is not None:
+                        keywords.add(parameter.name)
+                case inspect.Parameter.KEYWORD_ONLY:
+                    if keywords is not None:
+                        keywords.add(parameter.name)
+                case inspect.Parameter.VAR_POSITIONAL:
+                    max_positional = None
+                case inspect.Parameter.VAR_KEYWORD:
+                    keywords = None
+        if max_positional is not None:
+            max_positional = max(max_positional, positional)
+    return _CallShape(max_positional, frozenset(keywords) if keywords is not None else None)
+
+def _is_function_call(node: Node, api: ApiSignatures | None) -> bool:
+    return api is not None and isinstance(node, TypedDictNode) and node.name == "FunctionCall"
+
+class _JsonSchemaWriter:
+    def __init__(self, root: Node, api: ApiSignatures | None):
+        super().__init__()
+        self.root = _named(root)[1]
+        self.api = api
+        self.definitions: dict[str, dict[str, Any]] = {}
+        self.names: dict[int, str] = {}
+
+    def document(self) -> dict[str, Any]:
+        document = self.body(self.root)
+        if self.definitions:
+            document["$defs"] = self.definitions
+        return document
+
+    def reference(self, node: Node) -> dict[str, Any]:
+        name, target = _named(node)
+        if name is None:
+            return self.body(target)
+        if target is self.root:
+            return {"$ref": "#"}
+        if id(target) not in self.names:
+            unique_name = name
+            while unique_name in self.definitions:
+                unique_name += "_"
+            self.names[id(target)] = unique_name
+            # Reserves the name before the body is written, so recursive references find it.
+            self.definitions[unique_name] = {}
+            self.definitions[unique_name] = self.body(target)
+        return {"$ref": f"#/$defs/{self.names[id(target)]}"}
+
+    def body(self, node: Node) -> dict[str, Any]:
+        match node:
+            case AnyNode():
+                return {}
+            case ScalarNode(kind=kind):
+                return {"type": _json_types[kind]}
+            case LiteralNode(values=values):
+                return {"const": values[0]} if len(values) == 1 else {"enum": list(values)}
+            case ListNode(item=item):
+                return {"type": "array", "items": self.reference(item)}
+            case DictNode(value=value):
+                return {"type": "object", "additionalProperties": self.reference(value)}
+            case TypedDictNode() if _is_function_call(node, self.api):
+                return self.function_call(node)
+            case TypedDictNode(fields=fields, required=required):
+                return {
+                    "type": "object",
+                    "properties": {key: self.reference(field) for key, field in fields.items()},
+                    "required": [key for key in fields if key in required],
+                    "additionalProperties": False,
+                }
+            case UnionNode(options=options):
+                return {"anyOf": [self.reference(option) for option in options]}
+            case _DeferredNode():
+                return self.body(_named(node)[1])
+            case _:
+                raise TypeError(f"Cannot export a '{type(node).__name__}'.")
+
+    def function_call(self, node: TypedDictNode) -> dict[str, Any]:
+        assert self.api is not None
+        expression = self.reference(_argument_node(node))
+        calls: list[dict[str, Any]] = []
+        for name, signatures in self.api.items():
+            shape = _call_shape(signatures)
+            args: dict[str, Any] = {"type": "array", "items": expression}
+            if shape.max_positional is not None:
+                args["maxItems"] = shape.max_positional
+            kwargs: dict[str, Any] = {"type": "object"}
+            if shape.keywords is None:
+                kwargs["additionalProperties"] = expression
+            else:
+                kwargs["properties"] = {keyword: expression for keyword in sorted(shape.keywords)}
+                kwargs["additionalProperties"] = False
+            calls.append({
+                "type": "object",
+                "properties": {"@func": {"const": name}, "@args": args, "@kwargs": kwargs},
+                "required": ["@func"],
+                "additionalProperties": False,
+            })
+        return {"anyOf": calls}
+
+def _argument_node(function_call: TypedDictNode) -> Node:
+    args = function_call.fields.get("@args")
+    return args.item if isinstance(args, ListNode) else AnyNode()
+
+_json_types = {"str": "string", "int": "integer", "float": "number", "bool": "boolean", "None": "null"}
+
+# The grammar's building blocks. Every value rule matches a value without surrounding whitespace.
+_primitive_rules = {
+    "ws": r'[ \t\n\r]*',
+    "string": r'"\"" ([^"\\\x00-\x1f] | "\\" (["\\/bfnrt] | "u" [0-9a-fA-F] [0-9a-fA-F] [0-9a-fA-F] [0-9a-fA-F]))* "\""',
+    "integer": r'"-"? ("0" | [1-9] [0-9]*)',
+    "number": r'integer ("." [0-9]+)? ([eE] [-+]? [0-9]+)?',
+    "boolean": r'"true" | "false"',
+    "null": r'"null"',
+    "value": r'object | array | string | number | boolean | null',
+    "object": r'"{" ws (string ws ":" ws value ws ("," ws string ws ":" ws value ws)*)? "}"',
+    "array": r'"[" ws (value ws ("," ws value ws)*)? "]"',
+}
+_primitive_dependencies = {
+    "number": ("integer",),
+    "value": ("object", "array", "string", "number", "boolean", "null"),
+    "object": ("ws", "string", "value"),
+    "array": ("ws", "value"),
+}
+_scalar_rules = {"str": "string", "int": "integer", "float": "number", "bool": "boolean", "None": "null"}
+_invalid_rule_characters = re.compile(r"[^A-Za-z0-9-]+")
+
+def _literal(text: str) -> str:
+    """A grammar literal matching `text`."""
+    escaped = text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n").replace("\r", "\\r").replace("\t", "\\t")
+    return f'"{escaped}"'
+
+def _json_literal(value: Any) -> str:
+    """A grammar literal matching `value` written as JSON."""
+    return _literal(json.dumps(value, ensure_ascii=False))
+
+def _alternatives(expressions: Sequence[str]) -> str:
+    return expressions[0] if len(expressions) == 1 else f"({' | '.join(expressions)})"
+
+class _GrammarWriter:
+    def __init__(self, root: Node, api: ApiSignatures | None):
+        super().__init__()
+        self.api = api
+        self.rules: dict[str, str] = {"root": ""}
+        self.names: dict[int, str] = {}
+        self.primitives: set[str] = {"ws"}
+        self.rules["root"] = f"ws {self.reference(root)} ws"
+
+    def document(self) -> str:
+        pending = list(self.primitives)
+        while pending:
+            for dependency in _primitive_dependencies.get(pending.pop(), ()):
+                if dependency not in self.primitives:
+                    self.primitives.add(dependency)
+                    pending.append(dependency)
+        rules = dict(self.rules)
+        rules.update((name, body) for name, body in _primitive_rules.items() if name in self.primitives)
+        return "".join(f"{name} ::= {body}\n" for name, body in rules.items())
+
+    def rule(self, name: str, key: object, build: Any) -> str:
+        """Defines a rule for `key` (once), named after `name`, with the body `build()` returns."""
+        if id(key) not in self.names:
+            base = _invalid_rule_characters.sub("-", name).strip("-") or "rule"
+            unique_name = base
+            suffix = 1
+            while unique_name in self.rules or unique_name in _primitive_rules:
+                suffix += 1
+                unique_name = f"{base}-{suffix}"
+            self.names[id(key)] = unique_name
+            self.rules[unique_name] = ""
+            self.rules[unique_name] = build()
+        return self.names[id(key)]
+
+    def primitive(self, name: str) -> str:
+        self.primitives.add(name)
+        return name
+
+    def reference(self, node: Node) -> str:
+        """An expression matching `node`'s values: a rule name, a literal, or a parenthesized group."""
+        name, target = _named(node)
+        if name is not None:
+            return self.rule(name, target, lambda: self.body(target))
+        body = self.body(target)
+        return body if _is_atom(body) else f"({body})"
+
+    def body(self, node: Node) -> str:
+        match node:
+            case AnyNode():
+                return self.primitive("value")
+            case ScalarNode(kind=kind):
+                return self.primitive(_scalar_rules[kind])
+            case LiteralNode(values=values):
+                return " | ".join(_json_literal(value) for value in values)
+            case ListNode(item=item):
+                return self.array(self.reference(item), None)
+            case DictNode(value=value):
+                key = self.primitive("string")
+                entry = f'{key} ws ":" ws {self.reference(value)} ws'
+                return f'"{{" ws ({entry} ("," ws {entry})*)? "}}"'
+            case TypedDictNode() if _is_function_call(node, self.api):
+                return self.function_call(node)
+            case TypedDictNode(fields=fields, required=required):
+                entries = {key: f'{_json_literal(key)} ws ":" ws {self.reference(field)} ws' for key, field in fields.items()}
+                return self.object([entries[key] for key in fields if key in required], [entries[key] for key in fields if key not in required])
+            case UnionNode(options=options):
+                return " | ".join(self.reference(option) for option in options)
+            case _DeferredNode():
+                return self.body(_named(node)[1])
+            case _:
+                raise TypeError(f"Cannot export a '{type(node).__name__}'.")
+
+    def object(self, required: list[str], optional: list[str]) -> str:
+        """An object with every `required` entry, then any of the `optional` ones, in order."""
+        if required:
+            parts = [" \",\" ws ".join(required), *(f'("," ws {entry})?' for entry in optional)]
+            return f'"{{" ws {" ".join(parts)} "}}"'
+        if not optional:
+            return '"{" ws "}"'
+        # Without a required entry to start with, the first entry present decides where the commas go.
+        starts = [
+            " ".join([entry, *(f'("," ws {later})?' for later in optional[i + 1:])])
+            for i, entry in enumerate(optional)
+        ]
+        return f'"{{" ws ({" | ".join(starts)})? "}}"'
+
+    def array(self, item: str, max_items: int | None) -> str:
+        if max_items is None:
+            return f'"[" ws ({item} ws ("," ws {item} ws)*)? "]"'
+        if max_items == 0:
+            return '"[" ws "]"'
+        items = f"{item} ws"
+        for _ in range(max_items - 1):
+            items = f'{item} ws ("," ws {items})?'
+        return f'"[" ws ({items})? "]"'
+
+    def function_call(self, node: TypedDictNode) -> str:
+        assert self.api is not None
+        expression = self.reference(_argument_node(node))
+        calls: list[str] = []
+        for name, signatures in self.api.items():
+            shape = _call_shape(signatures)
+            calls.append(self.rule(f"call-{name}", signatures, lambda: self.call(name, shape, expression)))
+        return " | ".join(calls)
+
+    def call(self, name: str, shape: _CallShape, expression: str) -> str:
+        args = self.array(expression, shape.max_positional)
+        if shape.keywords is None:
+            keyword = self.primitive("string")
+        elif shape.keywords:
+            keyword = _alternatives([_json_literal(keyword) for keyword in sorted(shape.keywords)])
+        else:
+            keyword = None
+        if keyword is None:
+            kwargs = '"{" ws "}"'
+        else:
+            entry = f'{keyword} ws ":" ws {expression} ws'
+            kwargs = f'"{{" ws ({entry} ("," ws {entry})*)? "}}"'
+        return self.object(
+            [f'{_json_literal("@func")} ws ":" ws {_json_literal(name)} ws'],
+            [f'{_json_literal("@args")} ws ":" ws {args} ws', f'{_json_literal("@kwargs")} ws ":" ws {kwargs} ws'],
+        )
+
+def _is_atom(expression: str) -> bool:
+    return re.fullmatch(r'[A-Za-z0-9-]+|"(?:[^"\\]|\\.)*"', expression) is not None
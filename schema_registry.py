@@ -0,0 +1,140 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+import importlib.util
+import threading
+from typing import Any, Callable, Iterable
+
+from typechat import (AsyncModel, Checker, Failure, Model, ProgramTranslator, ProgramValidator, Result, Success,
+                      TypedDictTranslator, TypedDictValidator, ValidationMode)
+from translation_cache import schema_hash
+
+# Serving several schemas (coffee, math, csv, ...) from one process should not mean one validator - with its own
+# verdict memo - per request, nor re-reading schema modules from disk. A `SchemaRegistry` loads each schema once,
+# identifies it by the hash of its source, and hands out one shared validator per schema and type, whose natively
+# compiled form and verdicts stay warm for as long as the schema stays in the registry.
+
+@dataclass(frozen=True)
+class SchemaEntry:
+    name: str
+    source: str
+    # Stable across processes and restarts; changes whenever the schema's source does.
+    hash: str
+
+class _LoadedSchema:
+    __slots__ = ("entry", "validators")
+
+    def __init__(self, entry: SchemaEntry):
+        super().__init__()
+        self.entry = entry
+        # Keyed by type name; programs are validated against the "API" type.
+        self.validators: dict[str, TypedDictValidator[Any]] = {}
+
+class SchemaRegistry:
+    """
+    Loads schemas by module name (e.g. "coffee_api") or from source, and shares validators for them.
+
+    At most `max_schemas` schemas are kept; the least recently used one is evicted, with its validators, when
+    another is loaded. Evicted schemas are loaded again on their next use. Validators use `checker` for
+    anything checked with mypy, or the validators' default checker if it is None.
+    """
+    def __init__(
+        self,
+        max_schemas: int = 16,
+        mode: ValidationMode = "native",
+        checker: Checker | None = None,
+    ):
+        super().__init__()
+        self.max_schemas = max_schemas
+        self.mode: ValidationMode = mode
+        self.checker = checker
+        self._schemas: OrderedDict[str, _LoadedSchema] = OrderedDict()
+        self._lock = threading.RLock()
+
+    def load(self, name: str) -> SchemaEntry:
+        """Returns the schema defined by the module `name`, reading its source the first time it is used."""
+        with self._lock:
+            loaded = self._schemas.get(name)
+            if loaded is not None:
+                self._schemas.move_to_end(name)
+                return loaded.entry
+        return self.register(name, _read_module_source(name))
+
+    def register(self, name: str, source: str) -> SchemaEntry:
+        """Adds (or replaces) the schema `name` with the given source."""
+        entry = SchemaEntry(name, source, schema_hash(source))
+        with self._lock:
+            loaded = self._schemas.get(name)
+            if loaded is None or loaded.entry.hash != entry.hash:
+                self._schemas[name] = _LoadedSchema(entry)
+            self._schemas.move_to_end(name)
+            while len(self._schemas) > self.max_schemas:
+                self._schemas.popitem(last=False)
+            return self._schemas[name].entry
+
+    def preload(self, schemas: Iterable[str | tuple[str, str]], warm_checker: bool = False) -> Result[None]:
+        """
+        Loads schemas ahead of the first request. Each item is a module name, whose validator is created for
+        programs, or a (module name, type name) pair. The native schema is compiled (or, for mypy, the checker
+        is warmed with the bare schema if `warm_checker` is set) so the first validation does not pay for it.
+        """
+        for item in schemas:
+            name, type_name = (item, None) if isinstance(item, str) else item
+            validator = self.program_validator(name) if type_name is None else self.validator(name, type_name)
+            if validator.compiled_schema() is not None:
+                continue
+            if warm_checker:
+                warmed = validator.checker.check(validator.schema, "")
+                if isinstance(warmed, Failure):
+                    return Failure(f"Schema '{name}' did not type-check:\n{warmed.message}")
+        return Success(None)
+
+    def validator(self, name: str, type_name: str) -> TypedDictValidator[Any]:
+        """The shared validator for responses of type `type_name` in schema `name`."""
+        def create(entry: SchemaEntry) -> TypedDictValidator[Any]:
+            if self.checker is None:
+                return TypedDictValidator(entry.source, type_name, self.mode)
+            return TypedDictValidator(entry.source, type_name, self.mode, self.checker)
+        return self._validator(name, type_name, create)
+
+    def program_validator(self, name: str) -> ProgramValidator:
+        """The shared validator for programs against the `API` Protocol in schema `name`."""
+        def create(entry: SchemaEntry) -> ProgramValidator:
+            return ProgramValidator(entry.source) if self.checker is None else ProgramValidator(entry.source, self.checker)
+        validator = self._validator(name, "API", create)
+        assert isinstance(validator, ProgramValidator)
+        return validator
+
+    def translator(self, model: Model | AsyncModel, name: str, type_name: str) -> TypedDictTranslator[Any]:
+        return TypedDictTranslator(model, self.validator(name, type_name))
+
+    def program_translator(self, model: Model | AsyncModel, name: str) -> ProgramTranslator:
+        return ProgramTranslator(model, self.program_validator(name))
+
+    def evict(self, name: str) -> bool:
+        with self._lock:
+            return self._schemas.pop(name, None) is not None
+
+    def __contains__(self, name: str) -> bool:
+        with self._lock:
+            return name in self._schemas
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._schemas)
+
+    def _validator(self, name: str, type_name: str, create: Callable[[SchemaEntry], TypedDictValidator[Any]]) -> TypedDictValidator[Any]:
+        with self._lock:
+            self.load(name)
+            loaded = self._schemas[name]
+            validator = loaded.validators.get(type_name)
+            if validator is None:
+                validator = loaded.validators[type_name] = create(loaded.entry)
+            return validator
+
+def _read_module_source(name: str) -> str:
+    # Only the source is needed, so the module is located but never imported.
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.origin is None:
+        raise ModuleNotFoundError(f"No schema module named '{name}'", name=name)
+    with open(spec.origin, "r") as schema_file:
+        return schema_file.read()
@@ -0,0 +1,221 @@
+import json
+from dataclasses import dataclass, field
+from typing import Any, cast
+
+from schema_checker import AnyNode, CheckError, CompiledSchema, DictNode, ListNode, LiteralNode, Node, TypedDictNode, alternatives, coercible
+
+# Incrementally scans a streamed model response for its first top-level JSON object.
+#
+# The scanner recognizes the moment that object closes, so the rest of the stream can be dropped, and - given
+# a compiled schema - checks each scalar against the schema as soon as it is complete. That flags a prefix
+# that no continuation could make valid (an unknown `type` Literal in a coffee `Cart`, a key that no candidate
+# TypedDict has, ...) before the model finishes generating.
+#
+# The prefix check is deliberately conservative: anything it cannot judge is left for full validation. With
+# `accept_coercible`, scalars the schema's local repairs would fix (like "Latte" for a Literal "latte") are
+# accepted too, so that a response those repairs could save is not cut off and sent back to the model.
+
+_whitespace = frozenset(" \t\r\n")
+_delimiters = frozenset(" \t\r\n,:]}")
+
+@dataclass
+class _Frame:
+    is_object: bool
+    # Whether the container's contents are checked against the schema. Containers typed as `Any`, and
+    # everything inside them, are not.
+    checked: bool
+    # Schema nodes the container may still match.
+    candidates: list[Node]
+    expect_key: bool = True
+    key: str | None = None
+    index: int = -1
+    # The candidates for the value currently being parsed in this container.
+    value_candidates: list[Node] = field(default_factory=lambda: [])
+
+class JsonStreamScanner:
+    def __init__(self, schema: CompiledSchema | None = None, accept_coercible: bool = False):
+        super().__init__()
+        self._schema = schema
+        self._accept_coercible = accept_coercible
+        self._chunks: list[str] = []
+        self._stack: list[_Frame] = []
+        self._started = False
+        self._in_string = False
+        self._escaped = False
+        self._token: list[str] = []
+        # Set once the top-level object has closed.
+        self.complete = False
+        # Set if the prefix seen so far can no longer be completed into a valid value.
+        self.rejection: CheckError | None = None
+        # Set if the text is not JSON the scanner can follow; full validation will report why.
+        self.malformed = False
+
+    @property
+    def text(self) -> str:
+        """Everything fed to the scanner, up to where it stopped."""
+        return "".join(self._chunks)
+
+    def feed(self, chunk: str) -> bool:
+        """Consumes the next chunk of the stream and returns whether the stream can be cut off."""
+        if self.malformed:
+            self._chunks.append(chunk)
+            return False
+        for i, char in enumerate(chunk):
+            self._scan(char)
+            if self.complete or self.rejection is not None or self.malformed:
+                self._chunks.append(chunk[:i + 1])
+                return self.complete or self.rejection is not None
+        self._chunks.append(chunk)
+        return False
+
+    def _scan(self, char: str) -> None:
+        if not self._started:
+            if char == "{":
+                self._started = True
+                self._start_container(is_object=True)
+            return
+        if self._in_string:
+            if self._escaped:
+                self._escaped = False
+            elif char == "\\":
+                self._escaped = True
+            elif char == '"':
+                self._in_string = False
+                try:
+                    self._on_string(json.loads(f'"{"".join(self._token)}"'))
+                except ValueError:
+                    self.malformed = True
+                self._token.clear()
+                return
+            self._token.append(char)
+            return
+
+        if self._token and char in _delimiters:
+            self._end_token()
+            if self.malformed or self.rejection is not None:
+                return
+        match char:
+            case _ if char in _whitespace:
+                pass
+            case '"':
+                self._in_string = True
+            case "{":
+                self._start_container(is_object=True)
+            case "[":
+                self._start_container(is_object=False)
+            case "}" | "]":
+                if not self._stack or self._stack[-1].is_object != (char == "}"):
+                    self.malformed = True
+                    return
+                self._stack.pop()
+                if not self._stack:
+                    self.complete = True
+            case ",":
+                if self._stack and self._stack[-1].is_object:
+                    self._stack[-1].expect_key = True
+            case ":":
+                pass
+            case _:
+                self._token.append(char)
+
+    def _end_token(self) -> None:
+        token = "".join(self._token)
+        self._token.clear()
+        try:
+            value = json.loads(token)
+        except ValueError:
+            self.malformed = True
+            return
+        self._on_value(value)
+
+    def _on_string(self, value: str) -> None:
+        frame = self._stack[-1]
+        if frame.is_object and frame.expect_key:
+            frame.expect_key = False
+            frame.key = value
+            if frame.checked:
+                self._on_key(frame, value)
+        else:
+            self._on_value(value)
+
+    def _start_container(self, is_object: bool) -> None:
+        if self._stack:
+            expected = self._start_value()
+            checked = self._stack[-1].checked
+        else:
+            expected = alternatives(self._schema.root) if self._schema is not None else []
+            checked = self._schema is not None
+        candidates: list[Node] = []
+        if checked and any(isinstance(node, AnyNode) for node in expected):
+            checked = False
+        elif checked:
+            kinds = (TypedDictNode, DictNode) if is_object else (ListNode,)
+            candidates = [node for node in expected if isinstance(node, kinds)]
+            if not candidates:
+                described = _describe(expected)
+                got = "dict" if is_object else "list"
+                self._reject(f'Incompatible types (expression has type "{got}", expected "{described}")')
+        self._stack.append(_Frame(is_object, checked, candidates))
+
+    def _start_value(self) -> list[Node]:
+        """Moves the innermost container on to its next value and returns the nodes that value may match."""
+        frame = self._stack[-1]
+        if frame.is_object:
+            return frame.value_candidates
+        frame.index += 1
+        return [alternative for node in frame.candidates for alternative in alternatives(cast(ListNode, node).item)]
+
+    def _on_key(self, frame: _Frame, key: str) -> None:
+        remaining: list[Node] = []
+        value_candidates: list[Node] = []
+        for node in frame.candidates:
+            if isinstance(node, TypedDictNode):
+                if key in node.fields:
+                    remaining.append(node)
+                    value_candidates.extend(alternatives(node.fields[key]))
+            elif isinstance(node, DictNode):
+                remaining.append(node)
+                value_candidates.extend(alternatives(node.value))
+        if not remaining:
+            names = ", ".join(f'"{node.describe()}"' for node in frame.candidates)
+            self._reject(f'Extra key "{key}" for TypedDict {names}', include_key=False)
+            return
+        frame.candidates = remaining
+        frame.value_candidates = value_candidates
+
+    def _on_value(self, value: Any) -> None:
+        frame = self._stack[-1]
+        expected = self._start_value()
+        if not frame.checked or any(isinstance(node, AnyNode) for node in expected):
+            return
+        if not any(self._fits(node, value) for node in expected):
+            described = _describe(expected)
+            self._reject(f"Value {json.dumps(value)} is not allowed here; expected {described}")
+            return
+        if frame.is_object and frame.key is not None:
+            # Narrow the object's candidates, e.g. by its "type" discriminator.
+            key = frame.key
+            frame.candidates = [
+                node for node in frame.candidates
+                if not isinstance(node, TypedDictNode) or any(self._fits(n, value) for n in alternatives(node.fields[key]))
+            ]
+
+    def _fits(self, node: Node, value: Any) -> bool:
+        return coercible(node, value) if self._accept_coercible else node.accepts(value)
+
+    def _reject(self, message: str, include_key: bool = True) -> None:
+        path: list[str | int] = []
+        for i, frame in enumerate(self._stack):
+            is_innermost = i == len(self._stack) - 1
+            if frame.is_object and frame.key is not None and (include_key or not is_innermost):
+                path.append(frame.key)
+            elif not frame.is_object and frame.index >= 0:
+                path.append(frame.index)
+        self.rejection = CheckError(tuple(path), message)
+
+def _describe(nodes: list[Node]) -> str:
+    if nodes and all(isinstance(node, LiteralNode) for node in nodes):
+        # Alternatives of a discriminated union each contribute a one-value Literal; list them as one.
+        values = [value for node in nodes for value in cast(LiteralNode, node).values]
+        return LiteralNode(tuple(dict.fromkeys(values))).describe()
+    return " | ".join(node.describe() for node in nodes)
@@ -0,0 +1,161 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+import threading
+import time
+from typing import Any, Protocol
+from typing_extensions import override
+
+# Caches of successful translations, keyed by everything that determines a translation's result: the schema,
+# the target type, the model, and the user intent with its whitespace normalized. Case is kept: it can matter to
+# the translation ("read Data.csv" and "read data.csv" name different files). Values are the validated JSON text.
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+class TranslationCache(Protocol):
+    stats: CacheStats
+
+    def get(self, key: str) -> str | None:
+        ...
+
+    def put(self, key: str, value: str) -> None:
+        ...
+
+@lru_cache(maxsize=64)
+def schema_hash(schema: str) -> str:
+    import hashlib
+    return hashlib.sha256(schema.encode()).hexdigest()
+
+def normalize_intent(intent: str) -> str:
+    return " ".join(intent.split())
+
+def model_identity(model: Any) -> str:
+    """
+    Identifies a model by its `model_name` if it has one, and otherwise by its class.
+    Deliberately avoids `repr`, which for most model classes includes credentials.
+    """
+    model_name = getattr(model, "model_name", None)
+    model_class = f"{type(model).__module__}.{type(model).__qualname__}"
+    return f"{model_class}:{model_name}" if model_name else model_class
+
+def translation_cache_key(schema: str, type_name: str, model: Any, intent: str) -> str:
+    import hashlib
+    parts = [schema_hash(schema), type_name, model_identity(model), normalize_intent(intent)]
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+class LRUCache(TranslationCache):
+    """An in-memory cache holding at most `max_entries` entries, each for at most `ttl` seconds if given."""
+
+    def __init__(self, max_entries: int = 1024, ttl: float | None = None):
+        super().__init__()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @override
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at >= time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.stats.hits += 1
+                    return value
+                del self._entries[key]
+                self.stats.evictions += 1
+            self.stats.misses += 1
+            return None
+
+    @override
+    def put(self, key: str, value: str) -> None:
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class SqliteCache(TranslationCache):
+    """An on-disk cache that survives restarts and can be shared between processes."""
+
+    def __init__(self, path: str, ttl: float | None = None):
+        super().__init__()
+        self.path = path
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        import sqlite3
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS translations (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)")
+
+    @override
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, expires_at FROM translations WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                value, expires_at = row
+                if expires_at is None or expires_at >= time.time():
+                    self.stats.hits += 1
+                    return value
+                with self._connection:
+                    self._connection.execute("DELETE FROM translations WHERE key = ?", (key,))
+                self.stats.evictions += 1
+            self.stats.misses += 1
+            return None
+
+    @override
+    def put(self, key: str, value: str) -> None:
+        # Wall-clock time rather than a monotonic clock, since entries outlive the process.
+        expires_at = time.time() + self.ttl if self.ttl is not None else None
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO translations (key, value, expires_at) VALUES (?, ?, ?)", (key, value, expires_at))
+
+    def close(self) -> None:
+        self._connection.close()
+
+class TieredCache(TranslationCache):
+    """Checks an in-memory tier first, then a slower (typically on-disk) tier, promoting what it finds there."""
+
+    def __init__(self, memory: TranslationCache, disk: TranslationCache):
+        super().__init__()
+        self.memory = memory
+        self.disk = disk
+        self.stats = CacheStats()
+
+    @override
+    def get(self, key: str) -> str | None:
+        value = self.memory.get(key)
+        if value is None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+        if value is None:
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+        return value
+
+    @override
+    def put(self, key: str, value: str) -> None:
+        self.memory.put(key, value)
+        self.disk.put(key, value)
@@ -0,0 +1,408 @@
+import argparse
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor
+import contextlib
+from dataclasses import dataclass, replace
+from functools import partial
+import json
+import time
+from typing import Any, Sequence, cast
+
+from metrics import LatencyHistogram, TranslationMetrics
+from openai_model import OpenAIModel
+from replay_model import ReplayModel
+from schema_registry import SchemaRegistry
+from typechat import AsyncModel, Failure, Model, RepairStrategy, Result, Success, TypedDictTranslator, TypedDictValidator
+
+# A long-running translation server: translators for several schemas are loaded once and kept warm, and
+# requests arrive over TCP as line-delimited JSON. Each line is one request, answered by one line:
+#
+#     {"id": 1, "schema": "math_api", "request": "add 2 and 3"}
+#     {"id": 1, "ok": true, "value": {"@steps": [...]}}
+#     {"id": 2, "op": "stats"}
+#     {"id": 2, "ok": true, "value": {"server": {...}, "validation": {...}, "schemas": {...}}}
+#
+# A connection may send any number of requests without waiting for replies, which come back in the order
+# they finish, tagged with the request's `id`. Failed translations and malformed requests get `"ok": false`
+# and an `"error"` message.
+#
+# Translations wait in a bounded queue for one of a fixed number of workers. When the queue is full, the
+# server stops reading from connections until there is room, so clients are slowed down by TCP flow control
+# rather than piling up work in memory. Calls to a synchronous model run on one thread pool and validations
+# on another, so slow model calls cannot starve validation. Validations that arrive within a few milliseconds
+# of each other are handed to the validation pool as one job per validator, with identical responses (common
+# at temperature 0) validated once.
+
+@dataclass(frozen=True)
+class ServedSchema:
+    # Module defining the schema, e.g. "coffee_api". Requests name the schema by it.
+    name: str
+    # The type responses are validated against, or None to translate into programs against its `API`.
+    type_name: str | None = None
+
+    @staticmethod
+    def parse(text: str) -> "ServedSchema":
+        """Parses "module" (programs) or "module:Type", as given on the command line."""
+        name, _, type_name = text.partition(":")
+        return ServedSchema(name, type_name or None)
+
+class ValidationBatcher:
+    """
+    Collects validations that arrive within `window` seconds of the first one, up to `max_batch`, and runs
+    them on `executor` as one job per validator.
+    """
+    def __init__(self, executor: Executor, window: float = 0.002, max_batch: int = 64):
+        super().__init__()
+        self.executor = executor
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.validations = 0
+        self.deduplicated = 0
+        self.largest_batch = 0
+        self._queue: asyncio.Queue[tuple[TypedDictValidator[Any], str, asyncio.Future[Result[Any]]]] = asyncio.Queue()
+        self._jobs: set[asyncio.Task[None]] = set()
+
+    async def validate(self, validator: TypedDictValidator[Any], json_text: str) -> Result[Any]:
+        future: asyncio.Future[Result[Any]] = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((validator, json_text, future))
+        return await future
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except TimeoutError:
+                    break
+            self.batches += 1
+            self.validations += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+            groups: dict[int, list[tuple[TypedDictValidator[Any], str, asyncio.Future[Result[Any]]]]] = {}
+            for item in batch:
+                groups.setdefault(id(item[0]), []).append(item)
+            for group in groups.values():
+                job = asyncio.create_task(self._run_group(group))
+                self._jobs.add(job)
+                job.add_done_callback(self._jobs.discard)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "validations": self.validations,
+            "deduplicated": self.deduplicated,
+            "mean_batch": round(self.validations / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch,
+            "waiting": self._queue.qsize(),
+        }
+
+    async def _run_group(self, group: list[tuple[TypedDictValidator[Any], str, asyncio.Future[Result[Any]]]]) -> None:
+        validator = group[0][0]
+        json_texts = list(dict.fromkeys(json_text for _, json_text, _ in group))
+        self.deduplicated += len(group) - len(json_texts)
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self.executor, _validate_all, validator, json_texts)
+        except Exception as err:
+            for _, _, future in group:
+                if not future.done():
+                    future.set_exception(err)
+            return
+        by_text = dict(zip(json_texts, results))
+        for _, json_text, future in group:
+            if not future.done():
+                future.set_result(by_text[json_text])
+
+def _validate_all(validator: TypedDictValidator[Any], json_texts: list[str]) -> list[Result[Any]]:
+    return [validator.validate(json_text) for json_text in json_texts]
+
+@dataclass
+class _Job:
+    translator: TypedDictTranslator[Any]
+    request: str
+    future: asyncio.Future[Result[Any]]
+    enqueued: float
+
+class TranslationServer:
+    """
+    Serves translations for `schemas` with `model`, over TCP once `start`ed. Validators are shared through
+    `registry` (a new one by default), and checked against the schemas' type checker on start if
+    `warm_checker` is set.
+
+    At most `max_pending` translations wait in the queue, and `workers` run at once; of those, at most
+    `model_workers` call a synchronous model at the same time. Validations run on `validation_workers`
+    threads, batched over `batch_window` seconds. Failed translations are repaired with `repair`, or with a
+    default `RepairStrategy` if it is None.
+    """
+    def __init__(
+        self,
+        model: Model | AsyncModel,
+        schemas: Sequence[ServedSchema],
+        registry: SchemaRegistry | None = None,
+        max_pending: int = 256,
+        workers: int = 32,
+        model_workers: int = 16,
+        validation_workers: int = 4,
+        batch_window: float = 0.002,
+        max_batch: int = 64,
+        repair: RepairStrategy | None = None,
+        warm_checker: bool = True,
+    ):
+        super().__init__()
+        if max_pending < 1 or workers < 1 or model_workers < 1 or validation_workers < 1:
+            raise ValueError("A server needs room for at least one pending request and one worker of each kind.")
+        names = [schema.name for schema in schemas]
+        if len(set(names)) != len(names):
+            raise ValueError("Each schema can only be served once.")
+        self.schemas = tuple(schemas)
+        self.registry = registry if registry is not None else SchemaRegistry()
+        self.max_pending = max_pending
+        self.workers = workers
+        self.warm_checker = warm_checker
+        self.model_executor = ThreadPoolExecutor(model_workers, thread_name_prefix="model")
+        self.validation_executor = ThreadPoolExecutor(validation_workers, thread_name_prefix="validation")
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        if repair is None:
+            repair = RepairStrategy()
+        self.metrics: dict[str, TranslationMetrics] = {}
+        self.translators: dict[str, TypedDictTranslator[Any]] = {}
+        for schema in self.schemas:
+            metrics = self.metrics[schema.name] = TranslationMetrics()
+            if schema.type_name is None:
+                translator: TypedDictTranslator[Any] = self.registry.program_translator(model, schema.name)
+            else:
+                translator = self.registry.translator(model, schema.name, schema.type_name)
+            self.translators[schema.name] = replace(translator, executor=self.model_executor, observer=metrics, repair=repair)
+        self.counters: dict[str, int] = dict.fromkeys(
+            ("connections", "open_connections", "requests", "malformed", "completed", "succeeded", "failed"), 0)
+        self.in_flight = 0
+        self.queue_wait = LatencyHistogram()
+        self.latency = LatencyHistogram()
+        self._queue: asyncio.Queue[_Job] | None = None
+        self._batcher: ValidationBatcher | None = None
+        self._server: asyncio.Server | None = None
+        self._tasks: list[asyncio.Task[None]] = []
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> Result[int]:
+        """
+        Loads the schemas, starts the workers, and listens on `host` and `port`. Returns the bound port. If
+        the schemas fail to load, or listening raises, the server is stopped and cannot be started again.
+        """
+        loop = asyncio.get_running_loop()
+        preload_items = [schema.name if schema.type_name is None else (schema.name, schema.type_name) for schema in self.schemas]
+        try:
+            preloaded = await loop.run_in_executor(self.validation_executor, self.registry.preload, preload_items, self.warm_checker)
+            if isinstance(preloaded, Failure):
+                await self.stop()
+                return preloaded
+            self._queue = asyncio.Queue(self.max_pending)
+            self._batcher = ValidationBatcher(self.validation_executor, self.batch_window, self.max_batch)
+            self._tasks = [asyncio.create_task(self._batcher.run())]
+            self._tasks += [asyncio.create_task(self._work(self._queue, self._batcher)) for _ in range(self.workers)]
+            # Requests are single lines, but may be long; the default limit is 64 KiB.
+            self._server = await asyncio.start_server(self._serve_connection, host, port, limit=1 << 20)
+        except Exception:
+            # Otherwise the thread pools, and any workers already started, would outlive the failed start.
+            await self.stop()
+            raise
+        return Success(self._server.sockets[0].getsockname()[1])
+
+    async def serve_forever(self) -> None:
+        if self._server is None:
+            raise RuntimeError("The server has not been started.")
+        await self._server.serve_forever()
+
+    async def stop(self) -> None:
+        """Stops listening, cancels the workers and any queued translations, and shuts down the thread pools."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._queue is not None:
+            while not self._queue.empty():
+                self._queue.get_nowait().future.cancel()
+        self.model_executor.shutdown(wait=False, cancel_futures=True)
+        self.validation_executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "server": {
+                **self.counters,
+                "queued": self._queue.qsize() if self._queue is not None else 0,
+                "max_pending": self.max_pending,
+                "in_flight": self.in_flight,
+                "workers": self.workers,
+                "queue_wait": self.queue_wait.summary(),
+                "latency": self.latency.summary(),
+            },
+            "validation": self._batcher.stats() if self._batcher is not None else {},
+            "schemas": {name: metrics.snapshot() for name, metrics in self.metrics.items()},
+        }
+
+    async def _work(self, queue: asyncio.Queue[_Job], batcher: ValidationBatcher) -> None:
+        while True:
+            job = await queue.get()
+            if job.future.cancelled():
+                continue
+            self.queue_wait.record(time.perf_counter() - job.enqueued)
+            self.in_flight += 1
+            try:
+                validate = partial(batcher.validate, job.translator.validator)
+                result = await job.translator.translate_async(job.request, validate=validate)
+            except Exception as err:
+                result = Failure(f"The translation raised {type(err).__name__}: {err}")
+            finally:
+                self.in_flight -= 1
+            self.latency.record(time.perf_counter() - job.enqueued)
+            self.counters["completed"] += 1
+            self.counters["succeeded" if isinstance(result, Success) else "failed"] += 1
+            if not job.future.done():
+                job.future.set_result(result)
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        assert self._queue is not None
+        self.counters["connections"] += 1
+        self.counters["open_connections"] += 1
+        write_lock = asyncio.Lock()
+        replies: set[asyncio.Task[None]] = set()
+
+        async def send(message: dict[str, Any]) -> None:
+            async with write_lock:
+                writer.write(json.dumps(message).encode() + b"\n")
+                await writer.drain()
+
+        async def send_result(request_id: Any, future: asyncio.Future[Result[Any]]) -> None:
+            result = await future
+            if isinstance(result, Success):
+                await send({"id": request_id, "ok": True, "value": result.value})
+            else:
+                await send({"id": request_id, "ok": False, "error": result.message})
+
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    await send({"id": None, "ok": False, "error": "The request line is too long."})
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                parsed = _parse_request(line)
+                if isinstance(parsed, Failure):
+                    self.counters["malformed"] += 1
+                    await send({"id": None, "ok": False, "error": parsed.message})
+                    continue
+                message = parsed.value
+                request_id = message.get("id")
+                op = message.get("op", "translate")
+                if op == "stats":
+                    await send({"id": request_id, "ok": True, "value": self.stats()})
+                    continue
+                translator = self.translators.get(message.get("schema", ""))
+                request = message.get("request")
+                if op != "translate" or translator is None or not isinstance(request, str):
+                    self.counters["malformed"] += 1
+                    error = _request_error(op, message, self.translators)
+                    await send({"id": request_id, "ok": False, "error": error})
+                    continue
+                self.counters["requests"] += 1
+                future: asyncio.Future[Result[Any]] = asyncio.get_running_loop().create_future()
+                # Waits while the queue is full, which stops reading from this connection: the backpressure.
+                await self._queue.put(_Job(translator, request, future, time.perf_counter()))
+                reply = asyncio.create_task(send_result(request_id, future))
+                replies.add(reply)
+                reply.add_done_callback(replies.discard)
+            # A client may stop sending before it has all its replies.
+            await asyncio.gather(*replies, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            for reply in replies:
+                reply.cancel()
+            self.counters["open_connections"] -= 1
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+def _parse_request(line: bytes) -> Result[dict[str, Any]]:
+    try:
+        message = json.loads(line)
+    except ValueError:
+        return Failure("The request is not valid JSON.")
+    if not isinstance(message, dict):
+        return Failure("The request must be a JSON object.")
+    return Success(cast(dict[str, Any], message))
+
+def _request_error(op: Any, message: dict[str, Any], translators: dict[str, TypedDictTranslator[Any]]) -> str:
+    if op != "translate":
+        return f"Unknown op {json.dumps(op)}; expected \"translate\" or \"stats\"."
+    if message.get("schema") not in translators:
+        return f"Unknown schema {json.dumps(message.get('schema'))}; this server serves {', '.join(translators)}."
+    return "A translation needs a \"request\" string."
+
+def replay_model(paths: Sequence[str], latency: float = 0.0) -> ReplayModel:
+    """A `ReplayModel` answering from every corpus in `paths`, for running the server without a real model."""
+    responses: dict[str, list[str]] = {}
+    for path in paths:
+        responses.update(ReplayModel.from_jsonl(path).responses)
+    return ReplayModel(responses, latency)
+
+async def serve(server: TranslationServer, host: str, port: int) -> None:
+    started = await server.start(host, port)
+    if isinstance(started, Failure):
+        raise SystemExit(started.message)
+    print(f"Serving {', '.join(schema.name for schema in server.schemas)} on {host}:{started.value}", flush=True)
+    try:
+        await server.serve_forever()
+    finally:
+        await server.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serves translations as line-delimited JSON over TCP.")
+    parser.add_argument("--schema", action="append", dest="schemas", metavar="MODULE[:TYPE]",
+                        help="a schema to serve: a module for programs against its API, or module:Type (repeatable)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--replay", nargs="+", metavar="JSONL", help="answer from recorded responses instead of OpenAI")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated model latency in seconds, with --replay")
+    parser.add_argument("--max-pending", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--model-workers", type=int, default=16)
+    parser.add_argument("--validation-workers", type=int, default=4)
+    parser.add_argument("--batch-window-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    model: Model
+    if args.replay:
+        model = replay_model(args.replay, args.latency)
+    else:
+        from dotenv import dotenv_values
+        vals = dotenv_values()
+        model = OpenAIModel(model_name=vals["OPENAI_MODEL"] or "", api_key=vals["OPENAI_API_KEY"] or "")
+    schemas = [ServedSchema.parse(text) for text in args.schemas or ["coffee_api:Cart", "math_api", "csv_api"]]
+    server = TranslationServer(
+        model,
+        schemas,
+        max_pending=args.max_pending,
+        workers=args.workers,
+        model_workers=args.model_workers,
+        validation_workers=args.validation_workers,
+        batch_window=args.batch_window_ms / 1000,
+    )
+    try:
+        asyncio.run(serve(server, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
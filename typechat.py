@@ -1,13 +1,29 @@
-from dataclasses import dataclass
+import atexit
+from dataclasses import dataclass, field
+from functools import cached_property, lru_cache
 import json
-import tempfile
+import os
+import queue
+import threading
+import time
 from textwrap import dedent
-from typing import Generic, Protocol, TypeVar, cast
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Generator, Generic, Iterable, Iterator, Literal, Protocol, Sequence, TypeGuard, TypeVar, cast
 from typing_extensions import override
 
-import mypy.api
-
 import program.schema
+from translation_cache import LRUCache, TranslationCache, schema_hash, translation_cache_key
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor, ProcessPoolExecutor
+    import inspect
+
+    from schema_checker import Coercion, CompiledSchema
+    from schema_export import OutputFormat
+
+# Short-lived worker processes pay for every import, so heavy modules - mypy, asyncio, concurrent.futures,
+# tempfile, inspect - are imported where they are first needed rather than here. So are this package's
+# modules for native validation, rendering, repair prompts and streaming: the schema compiler alone costs
+# more to import than the rest of this module, and a translator that only uses mypy never needs it.
 
 T = TypeVar("T", covariant=True)
 
@@ -21,169 +37,932 @@ class Failure:
 
 Result = Success[T] | Failure
 
+@dataclass
+class ValidationFailure(Failure):
+    """A failed validation, with the details a targeted repair prompt is built from."""
+    json_text: str
+    # One line per problem, e.g. `$.items[0].quantity: Incompatible types ...` or a condensed mypy error.
+    errors: list[str]
+    # Names of the schema's definitions (types, aliases, or methods of the API) the problems involve.
+    definitions: list[str]
+
 class Model(Protocol):
     def complete(self, input: str) -> Result[str]:
         ...
 
-# TODO: just use the object_hook and some custom __str__s on `json.loads`
-def expr_to_text(expr: program.schema.Expression, for_program: bool) -> str:
-    match expr:
-        case { "@ref": int(index) } if for_program:
-            return f"STEP{index + 1}"
-        case { "@ref": index } if for_program:
-            # TODO: provide an error while generating the program in these cases
-            return f"NON_INTEGRAL_REF"
-        case { "@func": _ } if for_program:
-            return call_to_text(cast(program.schema.FunctionCall, expr))
-        case list():
-            elements_str = ", ".join(expr_to_text(item, for_program) for item in expr)
-            return f"[{elements_str}]"
-        case dict():
-            elements_strs: list[str] = []
-            for key, value in expr.items():
-                k_str = json.dumps(key) # no need to handle all expressions as keys
-                v_str = expr_to_text(value, for_program)
-                elements_strs.append(f"{k_str}: {v_str}")
-            elements_str = ", ".join(elements_strs)
-            return f"{{{elements_str}}}"
-        case bool() | int() | float() | None:
-            return str(expr)
-        case str():
-            return json.dumps(expr)
-        case _:
-            print(type(expr))
-            print("UNEXPECTED")
-            raise TypeError()
+class AsyncModel(Protocol):
+    async def complete(self, input: str) -> Result[str]:
+        ...
 
-def call_to_text(call: program.schema.FunctionCall) -> str:
-    func_name = call["@func"]
-    arg_strs: list[str] = []
+class StreamingModel(Model, Protocol):
+    def stream(self, input: str) -> Result[Iterator[str]]:
+        """Returns the completion in chunks, as the model generates it."""
+        ...
 
-    if "@args" in call and call["@args"]:
-        args = call["@args"]
-        for arg in args:
-            arg_strs.append(expr_to_text(arg, for_program=True))
+class StructuredModel(Model, Protocol):
+    def complete_structured(self, input: str, output: "OutputFormat") -> Result[str]:
+        """
+        Returns a completion constrained to `output`, e.g. with the provider's structured output support (using
+        `output.json_schema`) or with grammar-constrained decoding (using `output.grammar`).
+        """
+        ...
 
-    if "@kwargs" in call and call["@kwargs"]:
-        kwargs = call["@kwargs"]
-        for k, v in kwargs.items():
-            arg_strs.append(f"{k}={expr_to_text(v, for_program=True)}")
+class TranslationObserver:
+    """
+    Receives an event for each stage of a translation, with the time the stage took and its payload, e.g. to
+    find out whether slow translations come from the model, validation, or repairs. Every method does nothing
+    by default, so observers only override the events they need.
 
-    all_args_str = ", ".join(arg_strs)
+    Events for concurrent translations (`translate_async`, `translate_many`) may arrive from several threads
+    and interleave. Times are wall-clock seconds as seen by the translation, so for the async API they include
+    time spent waiting for the executor.
+    """
+    def on_translation_start(self, request: str) -> None:
+        pass
 
-    return f"api.{func_name}({all_args_str})"
+    def on_translation_end(self, request: str, result: Result[Any], seconds: float) -> None:
+        pass
+
+    def on_cache_hit(self, request: str) -> None:
+        pass
+
+    def on_prompt_built(self, prompt: str, seconds: float) -> None:
+        pass
+
+    def on_model_call_start(self, prompt: str) -> None:
+        pass
+
+    def on_model_call_end(self, prompt: str, response: Result[str] | str, seconds: float) -> None:
+        """`response` is a plain string for a streamed response that was cut off because it could not be valid."""
+        pass
+
+    def on_extraction(self, response: str, json_text: str | None, seconds: float) -> None:
+        """`json_text` is the JSON object found in the model's response, or None if there was none."""
+        pass
+
+    def on_validation_start(self, json_text: str) -> None:
+        pass
+
+    def on_validation_end(self, json_text: str, result: Result[Any], seconds: float) -> None:
+        pass
+
+    def on_local_repair(self, json_text: str, coercions: "list[Coercion]", result: Result[Any]) -> None:
+        """Reports the coercions applied to a response that failed validation, and the coerced response's result."""
+        pass
+
+    def on_repair_attempt(self, attempt: int, error_message: str) -> None:
+        pass
+
+def expr_to_text(expr: program.schema.Expression, for_program: bool) -> str:
+    from rendering import render_expression
+    return render_expression(expr, for_program)
+
+def call_to_text(call: program.schema.FunctionCall) -> str:
+    from rendering import render_call
+    return render_call(call)
 
 def program_to_text(p: program.schema.Program):
-    steps = p["@steps"]
-    step_strs: list[str] = []
-    for i, call in enumerate(steps, 1):
-        step_strs.append(f"\n    STEP{i} = {call_to_text(call)}")
+    from rendering import render_program
+    return render_program(p)
 
-    step_strs.append(f"\n    return STEP{len(steps)}")
-    all_steps_str = "".join(step_strs)
+class Checker(Protocol):
+    def check(self, schema: str, source: str) -> Result[None]:
+        """Type-checks `source`, which may refer to any of the definitions in `schema`."""
+        ...
 
-    return f"def fn(api: API):{all_steps_str}"
+class _SingleFileChecker(Checker):
+    """Runs mypy over a scratch file. Not safe to share between threads - use a `CheckerPool` for that."""
 
-class _SingleFileChecker:
-    f = tempfile.NamedTemporaryFile(mode="r+", encoding="utf8")
+    def __init__(self):
+        super().__init__()
+        import tempfile
+        self.f = tempfile.NamedTemporaryFile(mode="r+", encoding="utf8")
+        self._mtime = int(time.time())
 
-    def check(self, file_contents: str) -> Result[None]:
+    @override
+    def check(self, schema: str, source: str) -> Result[None]:
         self.f.truncate(0)
         self.f.seek(0)
-        self.f.write(file_contents)
+        self.f.write(schema)
+        self.f.write("\n")
+        self.f.write(source)
         self.f.write("\n")
         self.f.flush()
-        mypy_stdout, _mypy_stderr, exit_status = mypy.api.run([self.f.name])
+        # mypy's incremental cache trusts a file whose size and whole-second mtime are unchanged, so two
+        # same-length sources written within a second would get the first one's verdict. Give every write
+        # its own mtime.
+        self._mtime += 1
+        os.utime(self.f.name, (self._mtime, self._mtime))
+        import mypy.api
+        with _mypy_lock:
+            mypy_stdout, _mypy_stderr, exit_status = mypy.api.run([self.f.name])
         if exit_status != 0:
             return Failure(mypy_stdout)
         return Success(None)
 
+# mypy keeps global state while it runs, so in-process runs must not overlap - even from different files.
+_mypy_lock = threading.Lock()
+
+_worker_checker: _SingleFileChecker | None = None
+
+def _check_in_worker(schema: str, source: str) -> Result[None]:
+    global _worker_checker
+    if _worker_checker is None:
+        _worker_checker = _SingleFileChecker()
+    return _worker_checker.check(schema, source)
+
+PoolKind = Literal["thread", "process"]
+
+class CheckerPool(Checker):
+    """
+    Runs up to `size` checks at once (by default, one per CPU), each worker with its own scratch file.
+
+    In-process mypy runs cannot overlap, so checks only run in parallel with `kind="process"`, where each
+    worker process runs its own mypy. A "thread" pool makes a checker safe to share between threads, but its
+    checks all run in this process under `_mypy_lock`, one at a time, whatever its `size`: a larger size only
+    keeps more scratch files. Its size is 1 by default.
+    """
+
+    def __init__(self, size: int | None = None, kind: PoolKind = "process"):
+        super().__init__()
+        if size is None:
+            size = (os.cpu_count() or 1) if kind == "process" else 1
+        if size < 1:
+            raise ValueError("A checker pool needs at least one worker.")
+        self.size = size
+        self.kind = kind
+        self._lock = threading.Lock()
+        self._executor: "ProcessPoolExecutor | None" = None
+        self._idle: queue.LifoQueue[_SingleFileChecker] = queue.LifoQueue()
+        self._created = 0
+
+    @override
+    def check(self, schema: str, source: str) -> Result[None]:
+        if self.kind == "process":
+            return self._process_executor().submit(_check_in_worker, schema, source).result()
+        checker = self._acquire()
+        try:
+            return checker.check(schema, source)
+        finally:
+            self._idle.put(checker)
+
+    def check_many(self, checks: Iterable[tuple[str, str]]) -> list[Result[None]]:
+        """Runs several (schema, source) checks, concurrently in a "process" pool, and returns their results in order."""
+        checks = list(checks)
+        if self.kind == "process":
+            executor = self._process_executor()
+            futures = [executor.submit(_check_in_worker, schema, source) for schema, source in checks]
+            return [future.result() for future in futures]
+        def check(schema_and_source: tuple[str, str]) -> Result[None]:
+            return self.check(*schema_and_source)
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(self.size) as executor:
+            return list(executor.map(check, checks))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def _process_executor(self) -> "ProcessPoolExecutor":
+        with self._lock:
+            if self._executor is None:
+                from concurrent.futures import ProcessPoolExecutor
+                self._executor = ProcessPoolExecutor(self.size)
+            return self._executor
+
+    def _acquire(self) -> _SingleFileChecker:
+        with self._lock:
+            if self._idle.empty() and self._created < self.size:
+                self._created += 1
+                return _SingleFileChecker()
+        return self._idle.get()
+
+# Shared by every validator that is not given a checker of its own. A single worker keeps the previous
+# one-check-at-a-time behavior while making concurrent validations safe.
+_default_checker = CheckerPool(size=1, kind="thread")
+
+class DaemonChecker(Checker):
+    """
+    Keeps a mypy daemon (dmypy) warm across checks.
+
+    Each schema is written once to its own module, and checked sources star-import from it. After the first
+    check of a schema, only the file holding the checked source is reported to the daemon as changed, so
+    mypy re-analyzes just that file against the already-analyzed schema.
+    """
+
+    def __init__(self):
+        super().__init__()
+        import tempfile
+        self._dir = tempfile.TemporaryDirectory(prefix="typechat-dmypy-")
+        self._status_file = os.path.join(self._dir.name, ".dmypy.json")
+        self._cache_dir = os.path.join(self._dir.name, ".mypy_cache")
+        # Maps schema text to the path of the file its sources are written to.
+        self._source_files: dict[str, str] = {}
+        self._started = False
+        self._lock = threading.Lock()
+        atexit.register(self.stop)
+
+    @override
+    def check(self, schema: str, source: str) -> Result[None]:
+        with self._lock:
+            source_file = self._source_files.get(schema)
+            is_new_schema = source_file is None
+            if source_file is None:
+                source_file = self._add_schema(schema)
+            with open(source_file, "w", encoding="utf8") as f:
+                f.write(f"{self._schema_import(schema)}\n{source}\n")
+
+            if is_new_schema or not self._started:
+                files = [path for source_file in self._source_files.values() for path in self._schema_and_source(source_file)]
+                command = ["run", "--", "--cache-dir", self._cache_dir, "--follow-imports=error", *files]
+            else:
+                command = ["recheck", "--update", source_file]
+            mypy_stdout, mypy_stderr, exit_status = self._run_dmypy(command)
+            # Exit status 1 means type errors were found; anything else means the daemon itself failed.
+            self._started = self._started or exit_status in (0, 1)
+            other_schemas = tuple(
+                f"{path}:" for other in self._source_files.values() if other != source_file
+                for path in self._schema_and_source(other)
+            )
+
+        if exit_status == 0:
+            return Success(None)
+        # The daemon reports errors for every file in the build, including stale sources of other schemas.
+        lines = mypy_stdout.splitlines()
+        errors = [line for line in lines if line.startswith(f"{source_file}:")]
+        if any(": error:" in line for line in errors):
+            return Failure("\n".join(errors))
+        if exit_status != 1:
+            return Failure(mypy_stdout + mypy_stderr)
+        # Only errors in other schemas' modules and sources belong to other checks; any other error (in this
+        # schema's module, or a module it imports) fails this check too.
+        unexplained = [line for line in lines if ": error:" in line and not line.startswith(other_schemas)]
+        if unexplained:
+            return Failure("\n".join(unexplained))
+        return Success(None)
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._started:
+                self._run_dmypy(["stop"])
+                self._started = False
+
+    def _add_schema(self, schema: str) -> str:
+        module_name = self._schema_module(schema)
+        with open(os.path.join(self._dir.name, f"{module_name}.py"), "w", encoding="utf8") as f:
+            f.write(schema)
+        source_file = os.path.join(self._dir.name, f"{module_name}_source.py")
+        self._source_files[schema] = source_file
+        return source_file
+
+    def _schema_and_source(self, source_file: str) -> tuple[str, str]:
+        # `recheck --update` needs every module in the build to be listed explicitly rather than followed.
+        return (source_file.removesuffix("_source.py") + ".py", source_file)
+
+    def _schema_import(self, schema: str) -> str:
+        return f"from {self._schema_module(schema)} import *"
+
+    def _schema_module(self, schema: str) -> str:
+        import hashlib
+        return f"schema_{hashlib.sha256(schema.encode()).hexdigest()[:16]}"
+
+    def _run_dmypy(self, command: list[str]) -> tuple[str, str, int]:
+        import mypy.api
+        return mypy.api.run_dmypy(["--status-file", self._status_file, *command])
+
+# "native" checks parsed JSON against a compiled form of the schema, falling back to mypy for schemas
+# that use constructs the native checker does not support. "mypy" always type-checks a generated program.
+ValidationMode = Literal["native", "mypy"]
+
+# Schemas and prompt prefixes built ahead of time (see `schema_artifacts`), keyed by the schema's hash so a
+# precompiled form is only ever used for exactly the source it was built from.
+_precompiled_schemas: "dict[tuple[str, str], CompiledSchema | None]" = {}
+_precompiled_prompt_prefixes: dict[tuple[type, str, str], str] = {}
+
+def install_precompiled(
+    schema_hash: str,
+    type_name: str,
+    compiled: "CompiledSchema | None",
+    prompt_prefixes: dict[type, str],
+) -> None:
+    """
+    Registers a schema compiled ahead of time, along with the prompt prefixes built for it, keyed by the
+    translator class that built each one.
+    """
+    _precompiled_schemas[(schema_hash, type_name)] = compiled
+    for translator_class, prefix in prompt_prefixes.items():
+        _precompiled_prompt_prefixes[(translator_class, schema_hash, type_name)] = prefix
+
+@lru_cache(maxsize=64)
+def _compile_native_schema(schema: str, type_name: str) -> "CompiledSchema | None":
+    key = (schema_hash(schema), type_name)
+    if key in _precompiled_schemas:
+        return _precompiled_schemas[key]
+    from schema_checker import SchemaCompileError, compile_schema
+    try:
+        return compile_schema(schema, type_name)
+    except SchemaCompileError:
+        return None
+
+@lru_cache(maxsize=64)
+def _output_format(schema: str, type_name: str) -> "OutputFormat | None":
+    from schema_export import output_format
+    compiled = _compile_native_schema(schema, type_name)
+    return output_format(compiled) if compiled is not None else None
+
 @dataclass
 class TypedDictValidator(Generic[T]):
     schema: str
     type_name: str
-    _checker = _SingleFileChecker()
+    mode: ValidationMode = "native"
+    checker: Checker = field(default=_default_checker, repr=False, compare=False)
+    # How many type-checker verdicts to remember, keyed by schema and canonicalized JSON. Repeated
+    # responses (common at temperature 0, and in repair attempts) then skip the checker entirely.
+    memo_size: int = field(default=256, repr=False, compare=False)
+    _verdicts: LRUCache = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self._verdicts = LRUCache(self.memo_size)
+
+    def validate_many(self, json_texts: Sequence[str], max_workers: int | None = None) -> list[Result[T]]:
+        """
+        Validates several responses concurrently. Checks only overlap if the validator's checker allows it,
+        e.g. a `CheckerPool` with more than one worker.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers) as executor:
+            return list(executor.map(self.validate, json_texts))
 
     def validate(self, json_text: str) -> Result[T]:
+        compiled = self.compiled_schema()
+        if compiled is not None:
+            return self._validate_native(json_text, compiled)
+        return self._validate_with_mypy(json_text)
+
+    def compiled_schema(self) -> "CompiledSchema | None":
+        """The natively compiled schema, or None if this validator checks with mypy."""
+        if self.mode != "native":
+            return None
+        return _compile_native_schema(self.schema, self.type_name)
+
+    def output_format(self) -> "OutputFormat | None":
+        """The JSON Schema and grammar responses must follow, or None if the schema cannot be compiled natively."""
+        return _output_format(self.schema, self.type_name)
+
+    def repair_locally(self, json_text: str) -> "tuple[str, list[Coercion]] | None":
+        """
+        Applies the schema's safe coercions (see `CompiledSchema.coerce`) to a response that failed validation.
+        Returns the coerced JSON and the coercions made, or None if none apply. Works in either mode, as long
+        as the schema can be compiled natively.
+        """
+        compiled = _compile_native_schema(self.schema, self.type_name)
+        if compiled is None:
+            return None
+        try:
+            value = json.loads(json_text)
+        except ValueError:
+            return None
+        coerced, coercions = compiled.coerce(value)
+        if not coercions:
+            return None
+        return json.dumps(coerced, indent=2), coercions
+
+    def _validate_native(self, json_text: str, compiled: "CompiledSchema") -> Result[T]:
+        try:
+            typed_dict = json.loads(json_text)
+            errors = compiled.check(typed_dict)
+        except Exception as err:
+            return Failure(f"{str(err)}\nJSON Text was:\n{json_text}")
+        if not errors:
+            return Success(typed_dict)
+        error_lines = [str(error) for error in errors]
+        errors_text = "\n".join(error_lines)
+        err_text = f"JSON Text was:\n{json_text}\n\nCheck result was:\n{errors_text}"
+        definitions = [name for error in errors for name in compiled.definitions_along(typed_dict, error.path)]
+        return ValidationFailure(err_text, json_text, error_lines, list(dict.fromkeys(definitions)))
+
+    def _validate_with_mypy(self, json_text: str) -> Result[T]:
         program_text = None
         try:
             typed_dict = json.loads(json_text)
             expr_text = expr_to_text(typed_dict, for_program=False)
-            program_text = f"{self.schema}\nTESTED_VAR: {self.type_name} = {expr_text}"
-            check_result = self._checker.check(program_text)
+            source = f"TESTED_VAR: {self.type_name} = {expr_text}"
+            program_text = f"{self.schema}\n{source}"
+            check_result = self._check_memoized(typed_dict, source)
         except Exception as err:
             err_text = f"{str(err)}\nJSON Text was:\n{json_text}\nand constructed program was:\n{program_text or 'NOT_SET'}"
             return Failure(err_text)
         if isinstance(check_result, Success):
             return Success(typed_dict)
         err_text = f"JSON Text was:\n{json_text}\nand constructed program was:\n{program_text or 'NOT_SET'}\n\nCheck result was {check_result.message}"
-        return Failure(err_text)
+        from repair import condense_mypy_output, quoted_names
+        errors = condense_mypy_output(check_result.message, for_program=False)
+        return ValidationFailure(err_text, json_text, errors, quoted_names(errors) or [self.type_name])
+
+    def _check_memoized(self, value: object, source: str) -> Result[None]:
+        # Keying on the schema's hash means a changed schema never sees verdicts reached under the old one.
+        canonical_json = json.dumps(value, sort_keys=True, separators=(",", ":"))
+        key = f"{schema_hash(self.schema)}:{self.type_name}:{canonical_json}"
+        verdict = self._verdicts.get(key)
+        if verdict is not None:
+            return Success(None) if verdict == "" else Failure(verdict)
+        check_result = self.checker.check(self.schema, source)
+        self._verdicts.put(key, "" if isinstance(check_result, Success) else check_result.message)
+        return check_result
+
+
+def count_tokens(text: str) -> int:
+    """Counts tokens with tiktoken if it is installed, and otherwise estimates about four characters per token."""
+    encode = _token_encoder()
+    if encode is None:
+        return (len(text) + 3) // 4
+    return len(encode(text))
+
+@lru_cache(maxsize=None)
+def _token_encoder() -> Any | None:
+    # Looked up once: a failed import is retried (and searches sys.path) on every attempt.
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    return tiktoken.get_encoding("cl100k_base").encode
+
+def _parse_json_array(text: str, length: int) -> list[Any | None]:
+    """
+    Extracts a JSON array of `length` elements from a batched response. Elements that are missing, or the whole
+    array if it cannot be parsed, come back as None.
+    """
+    first_bracket = text.find("[")
+    last_bracket = text.rfind("]") + 1
+    try:
+        elements = json.loads(text[first_bracket:last_bracket]) if 0 <= first_bracket < last_bracket else None
+    except ValueError:
+        elements = None
+    if not isinstance(elements, list):
+        return [None] * length
+    elements = cast(list[Any], elements)
+    return [elements[i] if i < len(elements) else None for i in range(length)]
+
+def _compact_json(json_text: str) -> str:
+    try:
+        return json.dumps(json.loads(json_text), separators=(",", ":"))
+    except ValueError:
+        return json_text
+
+def _is_async_model(model: Model | AsyncModel) -> TypeGuard[AsyncModel]:
+    import inspect
+    return inspect.iscoroutinefunction(model.complete)
 
+# Running an `AsyncModel` from the synchronous API would need an event loop per call, which fails inside a
+# running loop and breaks clients bound to one loop.
+_async_model_failure = Failure("The translator's model is an AsyncModel; use translate_async or translate_many instead.")
+
+def _is_streaming_model(model: Model) -> TypeGuard[StreamingModel]:
+    return callable(getattr(model, "stream", None))
+
+def _is_structured_model(model: Model) -> TypeGuard[StructuredModel]:
+    return callable(getattr(model, "complete_structured", None))
+
+# "full" repair requests resend the original prompt, the whole response and the validator's full message, so
+# they share the prompt's cacheable prefix. "targeted" ones send only the invalid JSON, its problems condensed to
+# a line each, and the parts of the schema those problems involve.
+RepairPromptMode = Literal["full", "targeted"]
+
+@dataclass(frozen=True)
+class RepairStrategy:
+    mode: RepairPromptMode = "targeted"
+    # How many repair requests may follow the first response.
+    max_attempts: int = 1
+    # Budgets for all the repair requests of one translation. A repair that would exceed `max_tokens` (counted
+    # with `count_tokens`), or that would start `max_seconds` or more after the translation did, is not sent.
+    max_tokens: int | None = None
+    max_seconds: float | None = None
+
+@dataclass(frozen=True)
+class _PrefixRejected:
+    """A streamed response that was cut off because what had arrived so far could never be valid."""
+    text: str
+    message: str
+
+@dataclass(frozen=True)
+class _Complete:
+    prompt: str
+
+@dataclass(frozen=True)
+class _Validate:
+    json_text: str
 
 @dataclass(frozen=True)
 class TypedDictTranslator(Generic[T]):
-    model: Model
+    model: Model | AsyncModel
     validator: TypedDictValidator[T]
-
-    _max_repair_attempts = 1
+    # Runs validations (and calls to a synchronous model) for the async API. None uses the event loop's default.
+    executor: "Executor | None" = field(default=None, repr=False, compare=False)
+    cache: TranslationCache | None = field(default=None, repr=False, compare=False)
+    # Notified of each stage of every translation, e.g. a `metrics.TranslationMetrics`.
+    observer: TranslationObserver | None = field(default=None, repr=False, compare=False)
+    repair: RepairStrategy = field(default_factory=RepairStrategy)
+    # Whether to try the validator's safe, local coercions (see `TypedDictValidator.repair_locally`) before
+    # asking the model for a repair. Coercions are reported to the observer's `on_local_repair`.
+    local_repair: bool = True
+    # Whether to constrain a `StructuredModel`'s output to the validator's `output_format`. Off by default, since
+    # not every endpoint supports structured output.
+    constrain_output: bool = False
 
     def translate(self, request: str) -> Result[T]:
-        request = self._create_request_prompt(request)
+        """Translates `request` with a synchronous model; an `AsyncModel` needs `translate_async` instead."""
+        if _is_async_model(self.model):
+            return _async_model_failure
+        return self._run_steps(self._translation_steps(request))
+
+    def translate_batch(self, requests: Sequence[str], max_batch_tokens: int = 2048) -> list[Result[T]]:
+        """
+        Translates many requests with few model calls, for offline workloads. Packs as many intents into one
+        prompt as keep the whole prompt, instructions and schema included, within `max_batch_tokens`, asks for
+        a JSON array with one object per intent, validates each element on its own, and only sends follow-up
+        repair requests for the elements that failed. Needs a synchronous model, like `translate`.
+        """
+        if _is_async_model(self.model):
+            return [_async_model_failure] * len(requests)
+        results: list[Result[T] | None] = [None] * len(requests)
+        pending: list[int] = []
+        for i, request in enumerate(requests):
+            results[i] = self._cached_result(request)
+            if results[i] is None:
+                pending.append(i)
+
+        for batch in self._plan_batches([requests[i] for i in pending], max_batch_tokens):
+            indices = [pending[i] for i in batch]
+            if len(indices) == 1:
+                results[indices[0]] = self._run_steps(self._translation_steps(requests[indices[0]], check_cache=False))
+                continue
+            prompt = self._create_batch_prompt([requests[i] for i in indices])
+            if self.observer is not None:
+                self.observer.on_model_call_start(prompt)
+                start = time.perf_counter()
+                response = self._call_model(prompt)
+                self.observer.on_model_call_end(prompt, response, time.perf_counter() - start)
+            else:
+                response = self._call_model(prompt)
+            if isinstance(response, Failure):
+                for i in indices:
+                    results[i] = response
+                continue
+            elements = _parse_json_array(response.value, len(indices))
+            for i, element in zip(indices, elements):
+                if element is None:
+                    # The model did not produce a usable element for this intent; translate it on its own.
+                    results[i] = self._run_steps(self._translation_steps(requests[i], check_cache=False))
+                else:
+                    first_response = json.dumps(element, indent=2)
+                    results[i] = self._run_steps(self._translation_steps(requests[i], first_response, check_cache=False))
+        return cast(list[Result[T]], results)
+
+    def _plan_batches(self, requests: Sequence[str], max_batch_tokens: int) -> list[list[int]]:
+        # Every batch prompt starts with the prompt prefix and the batch instructions; only the items vary.
+        fixed_tokens = count_tokens(self._create_batch_prompt([]))
+        batches: list[list[int]] = []
+        batch_tokens = 0
+        for i, request in enumerate(requests):
+            tokens = count_tokens(self._create_batch_item(i, request))
+            if not batches or fixed_tokens + batch_tokens + tokens > max_batch_tokens:
+                batches.append([])
+                batch_tokens = 0
+            batches[-1].append(i)
+            batch_tokens += tokens
+        return batches
+
+    def _call_model(self, prompt: str) -> Result[str]:
+        return cast(Model, self.model).complete(prompt)
+
+    def _run_steps(self, steps: Generator[_Complete | _Validate, Any, Result[T]]) -> Result[T]:
+        response: Any = None
+        while True:
+            try:
+                step = steps.send(response)
+            except StopIteration as done:
+                return done.value
+            match step:
+                case _Complete(prompt):
+                    response = self._complete(cast(Model, self.model), prompt)
+                case _Validate(json_text):
+                    response = self.validator.validate(json_text)
+
+    async def translate_async(self, request: str, validate: Callable[[str], Awaitable[Result[Any]]] | None = None) -> Result[T]:
+        """
+        Translates `request` without blocking the event loop. Validations run on `executor`, unless `validate`
+        is given: it is then awaited for each one instead, e.g. to batch validations across translations.
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        steps = self._translation_steps(request)
+        response: Any = None
+        while True:
+            try:
+                step = steps.send(response)
+            except StopIteration as done:
+                return done.value
+            match step:
+                case _Complete(prompt):
+                    if _is_async_model(self.model):
+                        response = await self.model.complete(prompt)
+                    else:
+                        response = await loop.run_in_executor(self.executor, self._complete, cast(Model, self.model), prompt)
+                case _Validate(json_text):
+                    if validate is not None:
+                        response = await validate(json_text)
+                    else:
+                        response = await loop.run_in_executor(self.executor, self.validator.validate, json_text)
+
+    async def translate_many(self, requests: Iterable[str], max_concurrency: int = 16) -> list[Result[T]]:
+        """Translates many requests concurrently, with at most `max_concurrency` in flight at once."""
+        import asyncio
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def translate_one(request: str) -> Result[T]:
+            async with semaphore:
+                return await self.translate_async(request)
+
+        return await asyncio.gather(*(translate_one(request) for request in requests))
+
+    def _complete(self, model: Model, prompt: str) -> Result[str] | _PrefixRejected:
+        """
+        Calls a synchronous model. A model that supports structured output is constrained to the validator's
+        output format. Streamed completions are cut off as soon as the JSON object closes, or as soon as what
+        has arrived can no longer be valid.
+        """
+        if self.constrain_output and _is_structured_model(model):
+            output = self.validator.output_format()
+            if output is not None:
+                return model.complete_structured(prompt, output)
+        if not _is_streaming_model(model):
+            return model.complete(prompt)
+        stream = model.stream(prompt)
+        if isinstance(stream, Failure):
+            return stream
+        from streaming import JsonStreamScanner
+        scanner = JsonStreamScanner(self.validator.compiled_schema(), accept_coercible=self.local_repair)
+        chunks = stream.value
+        try:
+            for chunk in chunks:
+                if scanner.feed(chunk):
+                    break
+        except Exception as err:
+            return Failure(str(err))
+        finally:
+            close = getattr(chunks, "close", None)
+            if callable(close):
+                close()
+        if scanner.rejection is not None:
+            return _PrefixRejected(scanner.text, f"The JSON object so far is invalid:\n{scanner.rejection}")
+        return Success(scanner.text)
+
+    def _cached_result(self, request: str) -> Result[T] | None:
+        if self.cache is None:
+            return None
+        cached = self.cache.get(self._cache_key(request))
+        return Success(json.loads(cached)) if cached is not None else None
+
+    def _cache_key(self, request: str) -> str:
+        return translation_cache_key(self.validator.schema, self.validator.type_name, self.model, request)
+
+    def _translation_steps(
+        self,
+        request: str,
+        first_response: str | None = None,
+        check_cache: bool = True,
+    ) -> Generator[_Complete | _Validate, Any, Result[T]]:
+        """
+        The repair loop, shared by the sync and async APIs. Yields the model calls and validations it needs,
+        and expects each one's result to be sent back in. If `first_response` is given, it is used in place
+        of the first model call. `check_cache` is off for callers that already looked the request up.
+        """
+        steps = self._repair_loop(request, first_response, check_cache)
+        if self.observer is None:
+            return steps
+        return self._observe_translation(request, steps, self.observer)
+
+    def _observe_translation(
+        self,
+        request: str,
+        steps: Generator[_Complete | _Validate, Any, Result[T]],
+        observer: TranslationObserver,
+    ) -> Generator[_Complete | _Validate, Any, Result[T]]:
+        observer.on_translation_start(request)
+        start = time.perf_counter()
+        result = yield from steps
+        observer.on_translation_end(request, result, time.perf_counter() - start)
+        return result
+
+    def _repair_loop(self, request: str, first_response: str | None, check_cache: bool) -> Generator[_Complete | _Validate, Any, Result[T]]:
+        observer = self.observer
+        cached = self._cached_result(request) if check_cache else None
+        if cached is not None:
+            if observer is not None:
+                observer.on_cache_hit(request)
+            return cached
+
+        if observer is not None:
+            start = time.perf_counter()
+            prompt = self._create_request_prompt(request)
+            observer.on_prompt_built(prompt, time.perf_counter() - start)
+        else:
+            prompt = self._create_request_prompt(request)
+        cache_key = self._cache_key(request) if self.cache is not None else None
+        intent, request = request, prompt
+        strategy = self.repair
+        started = time.perf_counter() if strategy.max_seconds is not None else 0.0
         num_repairs_attempted = 0
+        repair_tokens = 0
         while True:
-            text_response = self.model.complete(request)
-            if isinstance(text_response, Failure):
-                return text_response
+            failure: ValidationFailure | None = None
+            completion: Result[str] | _PrefixRejected
+            if first_response is not None:
+                completion, first_response = Success(first_response), None
+            elif observer is not None:
+                observer.on_model_call_start(request)
+                start = time.perf_counter()
+                completion = yield _Complete(request)
+                reported = completion.text if isinstance(completion, _PrefixRejected) else completion
+                observer.on_model_call_end(request, reported, time.perf_counter() - start)
+            else:
+                completion = yield _Complete(request)
+            if isinstance(completion, Failure):
+                return completion
 
-            text_response = text_response.value
-            first_curly = text_response.find("{")
-            last_curly = text_response.rfind("}") + 1
             error_message: str
-            if 0 <= first_curly < last_curly:
-                trimmed_response = text_response[first_curly:last_curly]
-                result = self.validator.validate(trimmed_response)
-                if isinstance(result, Success):
-                    return result
-                error_message = result.message
+            text_response: str
+            if isinstance(completion, _PrefixRejected):
+                error_message = completion.message
+                text_response = completion.text
             else:
-                error_message = "Response did not contain any text resembling JSON."
+                text_response = completion.value
+                start = time.perf_counter() if observer is not None else 0.0
+                first_curly = text_response.find("{")
+                last_curly = text_response.rfind("}") + 1
+                has_json = 0 <= first_curly < last_curly
+                if observer is not None:
+                    extracted = text_response[first_curly:last_curly] if has_json else None
+                    observer.on_extraction(text_response, extracted, time.perf_counter() - start)
+                if has_json:
+                    trimmed_response = text_response[first_curly:last_curly]
+                    result: Result[T]
+                    if observer is not None:
+                        observer.on_validation_start(trimmed_response)
+                        start = time.perf_counter()
+                        result = yield _Validate(trimmed_response)
+                        observer.on_validation_end(trimmed_response, result, time.perf_counter() - start)
+                    else:
+                        result = yield _Validate(trimmed_response)
+                    if isinstance(result, ValidationFailure):
+                        failure = result
+                        if self.local_repair:
+                            repaired = self.validator.repair_locally(trimmed_response)
+                            if repaired is not None:
+                                repaired_response, coercions = repaired
+                                repaired_result: Result[T] = yield _Validate(repaired_response)
+                                if observer is not None:
+                                    observer.on_local_repair(trimmed_response, coercions, repaired_result)
+                                if isinstance(repaired_result, Success):
+                                    result, trimmed_response = repaired_result, repaired_response
+                    if isinstance(result, Success):
+                        if self.cache is not None and cache_key is not None:
+                            self.cache.put(cache_key, trimmed_response)
+                        return result
+                    # The model is asked to repair its own response, even if local repairs improved it.
+                    error_message = result.message
+                else:
+                    error_message = "Response did not contain any text resembling JSON."
             # print(f"FAILURE FROM RESPONSE:\n```\n{text_response}\n```\n\n{error_message}\n\n")
-            if num_repairs_attempted >= self._max_repair_attempts:
+            if num_repairs_attempted >= strategy.max_attempts:
+                return Failure(error_message)
+            if strategy.max_seconds is not None and time.perf_counter() - started >= strategy.max_seconds:
                 return Failure(error_message)
+            if strategy.mode == "targeted" and failure is not None:
+                repair_request = self._create_targeted_repair_prompt(intent, failure)
+            else:
+                # Without the details of a failed validation (e.g. the response had no JSON), the model
+                # needs the whole original prompt. It shares the prompt's cacheable prefix, too.
+                repair_request = f"{prompt}{text_response}\n{self._create_repair_prompt(error_message)}"
+            if strategy.max_tokens is not None:
+                repair_tokens += count_tokens(repair_request)
+                if repair_tokens > strategy.max_tokens:
+                    return Failure(error_message)
             num_repairs_attempted += 1
-            request = f"{text_response}\n{self._create_repair_prompt(error_message)}"
+            if observer is not None:
+                observer.on_repair_attempt(num_repairs_attempted, error_message)
+            request = repair_request
+
+    @cached_property
+    def prompt_prefix(self) -> str:
+        """
+        The start of every request prompt: the instructions and schema, which do not depend on the intent.
+        Built once, so the bytes are identical across requests and can hit a provider's prompt-prefix cache.
+        """
+        key = (type(self), schema_hash(self.validator.schema), self.validator.type_name)
+        precompiled = _precompiled_prompt_prefixes.get(key)
+        return precompiled if precompiled is not None else self._create_prompt_prefix()
+
+    @cached_property
+    def prompt_prefix_tokens(self) -> int:
+        return count_tokens(self.prompt_prefix)
 
     def _create_request_prompt(self, intent: str) -> str:
-        prompt = \
-            F"""
-            You are a service that translates user requests into JSON objects of type "${self.validator.type_name}" according to the following Python definitions:
+        return self.prompt_prefix + self._create_request_suffix(intent)
+
+    def _create_batch_prompt(self, intents: Sequence[str]) -> str:
+        items = "".join(self._create_batch_item(i, intent) for i, intent in enumerate(intents))
+        prompt = dedent(
+            """\
+            The following are {count} numbered user requests:
+            {items}
+            The following is a JSON array with exactly {count} elements, where element N is user request N translated into a JSON object, with 2 spaces of indentation and no properties with the value undefined:
+            """)
+        return self.prompt_prefix + prompt.format(count=len(intents), items=items)
+
+    def _create_batch_item(self, index: int, intent: str) -> str:
+        return f"{index + 1}.\n'''\n{intent}\n'''\n"
+
+    def _create_prompt_prefix(self) -> str:
+        # Templates are dedented before the schema is substituted in; dedenting afterwards would be a no-op,
+        # since the schema's own lines start at column 0.
+        prompt = dedent(
+            """
+            You are a service that translates user requests into JSON objects of type "{type_name}" according to the following Python definitions:
             ```
-            {self.validator.schema}
+            {schema}
             ```
+            """)
+        return prompt.format(type_name=self.validator.type_name, schema=self.validator.schema)
+
+    def _create_request_suffix(self, intent: str) -> str:
+        prompt = dedent(
+            """\
             The following is a user request:
             '''
             {intent}
             '''
             The following is the user request translated into a JSON object with 2 spaces of indentation and no properties with the value undefined:
-            """
-        return dedent(prompt)
+            """)
+        return prompt.format(intent=intent)
 
     def _create_repair_prompt(self, validation_error: str) -> str:
-        prompt = \
-            F"""
+        prompt = dedent(
+            """
             The above JSON object is invalid for the following reason:
             '''
             {validation_error}
             '''
             The following is a revised JSON object:
-            """
-        return dedent(prompt)
+            """)
+        return prompt.format(validation_error=validation_error)
+
+    def _create_targeted_repair_prompt(self, intent: str, failure: ValidationFailure) -> str:
+        from repair import schema_fragments
+        prompt = dedent(
+            """\
+            You are a service that translates user requests into JSON objects of type "{type_name}" according to the following Python definitions:
+            ```
+            {fragments}
+            ```
+            The following is a user request:
+            '''
+            {intent}
+            '''
+            The following JSON object was translated from it, but is invalid:
+            {json_text}
+            It has the following problems:
+            {errors}
+            The following is the complete, corrected JSON object with 2 spaces of indentation and no properties with the value undefined:
+            """)
+        return prompt.format(
+            type_name=self.validator.type_name,
+            fragments=schema_fragments(self.validator.schema, failure.definitions),
+            intent=intent,
+            json_text=_compact_json(failure.json_text),
+            errors="\n".join(failure.errors),
+        )
 
 @dataclass
 class ProgramValidator(TypedDictValidator[program.schema.Program]):
 
-    def __init__(self, schema: str):
-        super().__init__(schema, "API")
+    def __init__(self, schema: str, checker: Checker = _default_checker, memo_size: int = 256):
+        super().__init__(schema, "API", checker=checker, memo_size=memo_size)
+
+    @override
+    def compiled_schema(self) -> "CompiledSchema | None":
+        # Programs are always checked by mypy against the API's Protocol.
+        return None
+
+    @override
+    def output_format(self) -> "OutputFormat | None":
+        return _program_output_format(self.schema)
+
+    @override
+    def repair_locally(self, json_text: str) -> "tuple[str, list[Coercion]] | None":
+        return None
 
     @override
     def validate(self, json_text: str) -> Result[program.schema.Program]:
@@ -192,55 +971,128 @@ class ProgramValidator(TypedDictValidator[program.schema.Program]):
             typed_dict = json.loads(json_text)
             match typed_dict:
                 case { "@steps": list() }:
-                    program_text = program_to_text(cast(program.schema.Program, typed_dict))
+                    pass
                 case { "@steps": _ }:
                     raise TypeError("The result is not a valid program because '@steps' was not a list.")
                 case _:
                     raise TypeError("The result is not a valid program because it did not have a '@steps' property.")
-            program_text = f"{self.schema}\n{program_text}"
-            check_result = self._checker.check(program_text)
+            # Programs that cannot pass for their shape alone (unknown methods, wrong arguments, bad `@ref`s)
+            # are rejected before rendering them and running mypy.
+            structure_failure = self._check_structure(json_text, typed_dict)
+            if structure_failure is not None:
+                return structure_failure
+            source = program_to_text(cast(program.schema.Program, typed_dict))
+            program_text = f"{self.schema}\n{source}"
+            check_result = self._check_memoized(typed_dict, source)
         except Exception as err:
             err_text = f"{str(err)}\nJSON Text was:\n{json_text}\nand constructed program was:\n{program_text or 'NOT_SET'}"
             return Failure(err_text)
         if isinstance(check_result, Success):
             return Success(typed_dict)
         err_text = f"JSON Text was:\n{json_text}\nand constructed program was:\n{program_text or 'NOT_SET'}\n\nCheck result was {check_result.message}"
-        return Failure(err_text)
+        from repair import condense_mypy_output, quoted_names
+        errors = condense_mypy_output(check_result.message, for_program=True)
+        # Errors that name no method (like a `@ref` to a later step) still involve the methods the program calls.
+        steps = cast(list[Any], typed_dict["@steps"])
+        definitions = quoted_names(errors) or [call["@func"] for call in steps if isinstance(call, dict) and "@func" in call]
+        return ValidationFailure(err_text, json_text, errors, definitions)
+
+    def _check_structure(self, json_text: str, typed_dict: Any) -> ValidationFailure | None:
+        signatures = _program_signatures(self.schema)
+        if signatures is None:
+            return None
+        from program.structure import check_program_structure, functions_along
+        errors = check_program_structure(typed_dict, signatures)
+        if not errors:
+            return None
+        error_lines = [str(error) for error in errors]
+        errors_text = "\n".join(error_lines)
+        err_text = f"JSON Text was:\n{json_text}\n\nCheck result was:\n{errors_text}"
+        definitions: list[str] = []
+        for error in errors:
+            definitions += [name for name in functions_along(typed_dict, error.path) if name in signatures]
+            if error.path[-1:] == ("@func",):
+                # A call to a method the API lacks is best repaired by seeing the methods it has.
+                definitions += signatures
+        return ValidationFailure(err_text, json_text, error_lines, list(dict.fromkeys(definitions)))
 
-with open(program.schema.__file__, "r") as f:
-    program_schema = f.read()
+@lru_cache(maxsize=1)
+def program_schema() -> str:
+    """The source of `program.schema`, which program prompts include."""
+    with open(program.schema.__file__, "r") as f:
+        return f.read()
+
+@lru_cache(maxsize=64)
+def _program_signatures(schema: str) -> "dict[str, tuple[inspect.Signature, ...]] | None":
+    # The signatures of the API's methods, or None if the schema does not define an `API`.
+    from program.signatures import api_signatures
+    try:
+        return api_signatures(schema)
+    except KeyError:
+        return None
+
+@lru_cache(maxsize=64)
+def _program_output_format(schema: str) -> "OutputFormat | None":
+    # The program schema narrowed to the API's methods, and the arguments each one accepts.
+    from schema_export import output_format
+    compiled = _compile_native_schema(program_schema(), "Program")
+    api = _program_signatures(schema)
+    if api is None:
+        return None
+    return output_format(compiled, api) if compiled is not None else None
 
 @dataclass(frozen=True)
 class ProgramTranslator(TypedDictTranslator[program.schema.Program]):
-    model: Model
+    model: Model | AsyncModel
     validator: ProgramValidator
 
     @override
-    def _create_request_prompt(self, intent: str) -> str:
-        prompt = \
-            F"""
+    def _create_prompt_prefix(self) -> str:
+        prompt = dedent(
+            """
             You are a service that translates user requests into programs represented as JSON using the following Python definitions:
             ```
             {program_schema}
             ```
             The programs can call functions from the API defined in the following Python:
-            {self.validator.schema}
-            The following is a user request:
-            '''
-            {intent}
-            '''
-            The following is the user request translated into a JSON object with 2 spaces of indentation and no properties with the value undefined:
-            """
-        return dedent(prompt)
+            {schema}
+            """)
+        return prompt.format(program_schema=program_schema(), schema=self.validator.schema)
 
     @override
     def _create_repair_prompt(self, validation_error: str) -> str:
-        prompt = \
-            F"""
+        prompt = dedent(
+            """
             The above JSON program is invalid for the following reason:
             '''
             {validation_error}
             '''
             The following is a revised JSON program object:
-            """
-        return dedent(prompt)
+            """)
+        return prompt.format(validation_error=validation_error)
+
+    @override
+    def _create_targeted_repair_prompt(self, intent: str, failure: ValidationFailure) -> str:
+        from repair import schema_fragments
+        prompt = dedent(
+            """\
+            You are a service that translates user requests into programs represented as JSON, whose steps call functions from the following Python API:
+            ```
+            {fragments}
+            ```
+            The following is a user request:
+            '''
+            {intent}
+            '''
+            The following JSON program was translated from it, but is invalid:
+            {json_text}
+            It has the following problems:
+            {errors}
+            The following is the complete, corrected JSON program:
+            """)
+        return prompt.format(
+            fragments=schema_fragments(self.validator.schema, failure.definitions, methods_of="API"),
+            intent=intent,
+            json_text=_compact_json(failure.json_text),
+            errors="\n".join(failure.errors),
+        )